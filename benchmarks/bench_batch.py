@@ -0,0 +1,45 @@
+"""
+Wall time of many independent topN queries run one by one versus through PyDruid.run_many,
+against a local stub Broker that takes a fixed time to answer each query.
+
+    python benchmarks/bench_batch.py [queries] [broker delay in ms]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pydruid.client import PyDruid
+from pydruid.utils.aggregators import doublesum
+from stub_broker import StubBroker
+
+PAYLOAD = json.dumps([{'timestamp': '2015-01-01T00:00:00.000Z',
+                       'result': [{'count': 7.0, 'user_name': 'user_1'}]}]).encode('utf-8')
+
+
+def topn(hour):
+    return dict(datasource='twitterstream', granularity='all',
+                intervals='2013-10-04T{0:02d}/pt1h'.format(hour % 24),
+                aggregations={'count': doublesum('count')},
+                dimension='user_name', metric='count', threshold=10)
+
+
+def main(n=400, delay_ms=20):
+    with StubBroker(PAYLOAD, delay=delay_ms / 1000.0) as broker:
+        client = PyDruid(broker.url, 'druid/v2/')
+        start = timeit.default_timer()
+        for i in range(n):
+            client.topn(**topn(i))
+        print('serial               {0} queries in {1:.2f}s'.format(n, timeit.default_timer() - start))
+        for concurrency in (8, 32):
+            start = timeit.default_timer()
+            results = client.run_many([('topn', topn(i)) for i in range(n)], max_concurrency=concurrency)
+            assert all(r.ok for r in results)
+            print('run_many(max_concurrency={0:<2}) {1} queries in {2:.2f}s'.format(
+                concurrency, n, timeit.default_timer() - start))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
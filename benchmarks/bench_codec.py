@@ -0,0 +1,54 @@
+"""
+Encode and decode times of the available JSON codecs on topN, groupBy and select payloads
+shaped like real Druid results.
+
+    python benchmarks/bench_codec.py [rows]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pydruid import codec
+from stub_broker import report
+
+
+def payloads(n):
+    topn = [{'timestamp': '2013-10-04T{0:02d}:00:00.000Z'.format(h),
+             'result': [{'user_name': 'user_{0}'.format(i), 'count': float(i), 'length': 80.5 + i}
+                        for i in range(n // 24)]}
+            for h in range(24)]
+    groupby = [{'version': 'v1', 'timestamp': '2013-10-04T{0:02d}:00:00.000Z'.format(i % 24),
+                'event': {'user_name': 'user_{0}'.format(i % 5000), 'user_lang': 'en',
+                          'count': float(i % 17), 'tweets': i % 101, 'length': 80.5 + i % 60}}
+               for i in range(n)]
+    select = [{'timestamp': '2013-10-04T00:00:00.000Z', 'result': {
+        'pagingIdentifiers': {'twitterstream_2013-10-04_v1': n - 1},
+        'events': [{'segmentId': 'twitterstream_2013-10-04_v1', 'offset': i,
+                    'event': {'timestamp': '2013-10-04T00:00:00.000Z', 'user_name': 'user_{0}'.format(i),
+                              'user_lang': 'en', 'text': u'tweet {0} é㬓'.format(i),
+                              'count': 1.0}}
+                   for i in range(n)]}}]
+    return [('topN', topn), ('groupBy', groupby), ('select', select)]
+
+
+def main(n=20000, repeat=10):
+    codecs = [codec.JSONCodec()]
+    for codec_class in (codec.OrjsonCodec, codec.UjsonCodec):
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            print('{0} not installed, skipped'.format(codec_class.name))
+    for query_type, payload in payloads(n):
+        data = codec.JSONCodec().dumps(payload)
+        print('{0}: {1} rows, {2:.1f} MB'.format(query_type, n, len(data) / 1e6))
+        for c in codecs:
+            report('  {0} loads'.format(c.name),
+                   timeit.repeat(lambda: c.loads(data), number=1, repeat=repeat))
+            report('  {0} dumps'.format(c.name),
+                   timeit.repeat(lambda: c.dumps(payload), number=1, repeat=repeat))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
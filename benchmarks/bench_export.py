@@ -0,0 +1,45 @@
+"""
+Time and peak memory of exporting a large groupBy result to a DataFrame, through row dicts
+(export_pandas()) versus NumPy columns (export_pandas(columnar=True)).
+
+    python benchmarks/bench_export.py [rows]
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pydruid.query import QueryResult
+
+
+def result(n):
+    rows = [{'version': 'v1', 'timestamp': '2013-10-04T{0:02d}:00:00.000Z'.format(i % 24),
+             'event': {'user_name': 'user_{0}'.format(i % 5000), 'user_lang': 'en',
+                       'count': float(i % 17), 'tweets': i % 101, 'tweet_length': 80.5 + i % 60}}
+            for i in range(n)]
+    return QueryResult({'queryType': 'groupBy'}, b'', rows)
+
+
+def measure(name, run):
+    start = timeit.default_timer()
+    df = run()
+    total = timeit.default_timer() - start
+    # memory is traced in a separate run, since tracing slows allocation-heavy code down
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{0:<10} rows={1:<8} total {2:6.3f}s  peak memory {3:7.1f} MB'.format(
+        name, len(df), total, peak / 1e6))
+
+
+def main(n=1000000):
+    res = result(n)
+    measure('rows', res.export_pandas)
+    measure('columnar', lambda: res.export_pandas(columnar=True))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
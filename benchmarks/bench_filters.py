@@ -0,0 +1,80 @@
+"""
+Size, depth and serialization time of large filter trees built with chained & and |, as built
+and after pydruid.utils.filters.optimize_filter, which build_query applies; and the time to build
+an in filter on as many values directly, from a list, a set and a NumPy array.
+
+    python benchmarks/bench_filters.py [operands]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pydruid.utils.filters import Dimension, Filter, optimize_filter
+from stub_broker import report
+
+
+def trees(n):
+    conjunction = Dimension('dim0') == 0
+    for i in range(1, n):
+        conjunction = conjunction & (Dimension('dim{0}'.format(i % 50)) == i)
+    users = Dimension('user_id')
+    disjunction = users == 'user_0'
+    for i in range(1, n):
+        disjunction = disjunction | (users == 'user_{0}'.format(i))
+    return [('and of {0} selectors'.format(n), conjunction),
+            ('or of {0} selectors on one dimension'.format(n), disjunction)]
+
+
+def depth(node):
+    deepest = 0
+    stack = [(node, 1)]
+    while stack:
+        node, level = stack.pop()
+        deepest = level if level > deepest else deepest
+        for child in node.get('fields', ()):
+            stack.append((child, level + 1))
+        if 'field' in node:
+            stack.append((node['field'], level + 1))
+    return deepest
+
+
+def describe(name, spec, repeat):
+    try:
+        size = len(json.dumps(spec))
+        report('  {0} dumps'.format(name), timeit.repeat(lambda: json.dumps(spec), number=1,
+                                                         repeat=repeat))
+    except RecursionError:
+        size = None
+        print('  {0} dumps: too deep to serialize'.format(name))
+    print('  {0}: depth {1}, {2} bytes'.format(name, depth(spec), size))
+
+
+def in_filters(n, repeat):
+    print('in filter on {0} values'.format(n))
+    ids = ['user_{0}'.format(i) for i in range(n)]
+    sources = [('list', ids), ('set', set(ids))]
+    try:
+        import numpy
+        sources.append(('numpy', numpy.arange(n)))
+    except ImportError:
+        print('  numpy not installed, skipped')
+    for name, values in sources:
+        report('  from {0}'.format(name), timeit.repeat(
+            lambda: Filter(type='in', dimension='user_id', values=values), number=1, repeat=repeat))
+
+
+def main(n=2000, repeat=20):
+    for name, f in trees(n):
+        print(name)
+        spec = Filter.build_filter(f)
+        describe('as built', spec, repeat)
+        report('  optimize', timeit.repeat(lambda: optimize_filter(spec), number=1, repeat=repeat))
+        describe('optimized', optimize_filter(spec), repeat)
+    in_filters(n, repeat)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
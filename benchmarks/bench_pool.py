@@ -0,0 +1,80 @@
+"""
+Per-query latency of PyDruid against a local stub Broker, with and without connection reuse.
+
+    python benchmarks/bench_pool.py [queries]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from six.moves import urllib
+
+from pydruid.client import PyDruid
+from pydruid.utils.aggregators import doublesum
+from stub_broker import StubBroker, report
+
+PAYLOAD = json.dumps([{'timestamp': '2015-01-01T00:00:00.000Z',
+                       'result': {'count': 7.0}}]).encode('utf-8')
+
+
+class UrlopenPool(object):
+    """The pre-pool behaviour: a new connection for every query."""
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None):
+        request = urllib.request.Request(url, body, headers or {})
+        request.get_method = lambda: method
+        kwargs = {} if timeout is None else {'timeout': timeout}
+        start = timeit.default_timer()
+        try:
+            res = urllib.request.urlopen(request, **kwargs)
+        except urllib.error.HTTPError as e:
+            res = e
+        return UrlopenResponse(res, timeit.default_timer() - start)
+
+
+class UrlopenResponse(object):
+    """A urlopen response, with the interface of pydruid.pool.PooledResponse."""
+
+    def __init__(self, res, ttfb):
+        self.status = res.getcode()
+        self.reason = getattr(res, 'reason', '')
+        self.headers = res.info()
+        # connecting is part of urlopen, so it is counted in ttfb
+        self.connect_time = 0.0
+        self.ttfb = ttfb
+        self._res = res
+
+    def read(self, amt=None):
+        return self._res.read() if amt is None else self._res.read(amt)
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def close(self):
+        self._res.close()
+
+
+def run(client, n):
+    timings = []
+    for _ in range(n):
+        start = timeit.default_timer()
+        client.timeseries(datasource='twitterstream', granularity='all',
+                          intervals='2013-10-04/pt1h',
+                          aggregations={'count': doublesum('count')})
+        timings.append(timeit.default_timer() - start)
+    return timings
+
+
+def main(n=2000):
+    with StubBroker(PAYLOAD) as broker:
+        report('urlopen (new connection per query)',
+               run(PyDruid(broker.url, 'druid/v2/', pool=UrlopenPool()), n))
+        report('ConnectionPool (keep-alive)',
+               run(PyDruid(broker.url, 'druid/v2/'), n))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
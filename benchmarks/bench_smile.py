@@ -0,0 +1,63 @@
+"""
+End-to-end query time and response size of large select and groupBy results served as JSON
+versus Smile by a local stub Broker.
+
+    python benchmarks/bench_smile.py [rows]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pydruid import codec
+from pydruid.client import PyDruid
+from pydruid.utils import smile
+from stub_broker import StubBroker, report
+
+
+def payloads(n):
+    groupby = [{'version': 'v1', 'timestamp': '2013-10-04T{0:02d}:00:00.000Z'.format(i % 24),
+                'event': {'user_name': 'user_{0}'.format(i % 5000), 'user_lang': 'en',
+                          'count': float(i % 17), 'tweets': i % 101, 'length': 80.5 + i % 60}}
+               for i in range(n)]
+    select = [{'timestamp': '2013-10-04T00:00:00.000Z', 'result': {
+        'pagingIdentifiers': {'twitterstream_2013-10-04_v1': n - 1},
+        'events': [{'segmentId': 'twitterstream_2013-10-04_v1', 'offset': i,
+                    'event': {'timestamp': '2013-10-04T00:00:00.000Z',
+                              'user_name': 'user_{0}'.format(i), 'user_lang': 'en',
+                              'count': 1.0, 'length': 80.0 + i % 60}}
+                   for i in range(n)]}}]
+    return [('groupby', groupby, dict(dimensions=['user_name', 'user_lang'])),
+            ('select', select, dict(paging_spec={'pagingIdentifiers': {}, 'threshold': n}))]
+
+
+def run(client, method, kwargs, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        result = getattr(client, method)(datasource='twitterstream', granularity='hour',
+                                         intervals='2013-10-04/p1d', **kwargs)
+        timings.append(timeit.default_timer() - start)
+    return timings, result.compressed_bytes
+
+
+def main(n=20000, repeat=10):
+    codecs = [('json', codec.JSONCodec())]
+    if codec.orjson is not None:
+        codecs.append(('orjson', codec.OrjsonCodec()))
+    for method, payload, kwargs in payloads(n):
+        print('{0}: {1} rows'.format(method, n))
+        with StubBroker(json.dumps(payload).encode('utf-8')) as broker:
+            for name, c in codecs:
+                timings, size = run(PyDruid(broker.url, 'druid/v2/', codec=c), method, kwargs, repeat)
+                report('  {0} ({1:.1f} MB)'.format(name, size / 1e6), timings)
+        with StubBroker(smile.dumps(payload), smile.CONTENT_TYPE) as broker:
+            timings, size = run(PyDruid(broker.url, 'druid/v2/', codec=codec.SmileCodec()),
+                                method, kwargs, repeat)
+            report('  smile ({0:.1f} MB)'.format(size / 1e6), timings)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
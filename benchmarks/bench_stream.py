@@ -0,0 +1,65 @@
+"""
+Peak memory and time to first row of a large select, read whole versus streamed,
+against a local stub Broker.
+
+    python benchmarks/bench_stream.py [events]
+"""
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pydruid.client import PyDruid
+from stub_broker import StubBroker
+
+
+def payload(n):
+    events = [{'segmentId': 'twitterstream_2013-06-14_v1', 'offset': i,
+               'event': {'timestamp': '2013-06-14T00:00:00.000Z', 'user_name': 'user_{0}'.format(i),
+                         'user_lang': 'en', 'count': 1.0, 'tweet_length': 80.0 + i % 60}}
+              for i in range(n)]
+    return json.dumps([{'timestamp': '2013-06-14T00:00:00.000Z',
+                        'result': {'pagingIdentifiers': {'twitterstream_2013-06-14_v1': n - 1},
+                                   'events': events}}]).encode('utf-8')
+
+
+def measure(name, run):
+    tracemalloc.start()
+    start = timeit.default_timer()
+    first, rows = run()
+    total = timeit.default_timer() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{0:<10} rows={1:<8} first row after {2:6.3f}s  total {3:6.3f}s  peak memory {4:7.1f} MB'.format(
+        name, rows, first - start, total, peak / 1e6))
+
+
+def main(n=200000):
+    kwargs = dict(datasource='twitterstream', granularity='all', intervals='2013-06-14/p1d',
+                  paging_spec={'pagingIdentifiers': {}, 'threshold': n})
+    with StubBroker(payload(n)) as broker:
+        client = PyDruid(broker.url, 'druid/v2/')
+
+        def whole():
+            result = client.select(**kwargs)
+            first = timeit.default_timer()
+            return first, len(result[0]['result']['events'])
+
+        def streamed():
+            rows, first = 0, None
+            for _ in client.stream('select', **kwargs):
+                if first is None:
+                    first = timeit.default_timer()
+                rows += 1
+            return first, rows
+
+        measure('whole', whole)
+        client.result = client.result_json = None
+        measure('streamed', streamed)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
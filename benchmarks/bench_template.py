@@ -0,0 +1,54 @@
+"""
+Per-call cost of building and encoding a topN query whose intervals change between calls: through
+the query method's path (validate, build, encode) versus a prepared QueryTemplate (bind, splice).
+
+    python benchmarks/bench_template.py [calls]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pydruid.client import PyDruid
+from pydruid.template import Param
+from pydruid.utils.aggregators import doublesum, longsum, hyperunique
+from pydruid.utils.filters import Dimension
+from pydruid.utils.postaggregator import Field
+from stub_broker import report
+
+
+def args(intervals):
+    return dict(
+        datasource='twitterstream', granularity='all', intervals=intervals,
+        aggregations={'count': doublesum('count'), 'tweets': longsum('tweets'),
+                      'users': hyperunique('users')},
+        post_aggregations={'avg': Field('tweets') / Field('count')},
+        dimension='user_name', metric='count', threshold=100,
+        filter=(Dimension('user_lang') == 'en') & (Dimension('first_hashtag') == 'oscars') &
+               ~(Dimension('reply_to_name') == 'Not A Reply'))
+
+
+def intervals(i):
+    return '2013-10-{0:02d}/pt1h'.format(1 + i % 28)
+
+
+def main(calls=20000):
+    client = PyDruid('http://localhost:8082', 'druid/v2/')
+    print('codec: {0}'.format(client.codec.name))
+    counter = iter(range(10 ** 9))
+
+    def build():
+        return client._encode(client._query_from_spec(('topn', args(intervals(next(counter))))))
+
+    template = client.prepare('topn', **args(Param('intervals')))
+
+    def bind():
+        return client._encode(template.bind(intervals=intervals(next(counter))))
+
+    report('query method: validate, build, encode', timeit.repeat(build, number=1, repeat=calls))
+    report('template: bind, splice', timeit.repeat(bind, number=1, repeat=calls))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,68 @@
+"""
+A minimal local stand-in for a Druid Broker, used by the benchmarks in this directory.
+
+The broker answers every POST with a fixed payload (optionally after a fixed delay) over
+HTTP/1.1 keep-alive, and every DELETE with 202, which is enough to measure the client side
+of the query path without a Druid cluster.
+"""
+import threading
+
+from six.moves import BaseHTTPServer, socketserver
+
+
+class StubBroker(object):
+
+    def __init__(self, payload=b'[]', content_type='application/json', delay=0.0):
+        self.payload = payload
+        self.content_type = content_type
+        self.delay = delay
+        broker = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if broker.delay:
+                    threading.Event().wait(broker.delay)
+                payload = broker.payload
+                self.send_response(200)
+                self.send_header('Content-Type', broker.content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_DELETE(self):
+                self.send_response(202)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+
+    def __enter__(self):
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.01,))
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def report(name, timings):
+    """Print the mean and percentiles of a list of per-call timings in seconds."""
+    timings = sorted(timings)
+    n = len(timings)
+    print('{0:<40} n={1:<6} mean={2:8.1f}us  p50={3:8.1f}us  p99={4:8.1f}us'.format(
+        name, n, 1e6 * sum(timings) / n, 1e6 * timings[n // 2],
+        1e6 * timings[min(n - 1, int(n * 0.99))]))
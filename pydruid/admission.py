@@ -0,0 +1,280 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+from __future__ import division
+
+import heapq
+import itertools
+import threading
+import time
+
+import six
+
+from .exceptions import QueryTimeout
+
+BY_DATASOURCE = 'datasource'
+BY_QUERY_TYPE = 'query_type'
+
+
+class AdmissionControl:
+    """
+    Client-side admission control: limits the rate at which queries are sent and how many are in
+    flight at once, queueing the others on the client rather than on the Broker.
+
+    The rate is enforced with a token bucket: it fills up with rate tokens per second up to burst,
+    and every query takes one. Queries that have to wait are admitted highest priority first, and
+    in arrival order among equal priorities. The priority of a query is its context.priority,
+    which is what Druid schedules by as well; queries without one get the configured priority,
+    which is then also set as their context.priority.
+
+    Limits apply to all queries together, or separately to each datasource or query type, with
+    by. limits overrides the default settings for particular datasources or query types.
+
+    One AdmissionControl can be shared between clients, blocking and async alike; they account
+    for their queries in the same buckets and queues.
+
+    :param float rate: Queries per second, or None for no rate limit
+    :param float burst: Size of the token bucket, i.e., how many queries may be sent at once after
+        a quiet period. Defaults to one second's worth of rate, and at least 1
+    :param int max_in_flight: Maximum number of queries in flight at once, or None for no limit
+    :param int priority: Priority of queries whose context sets none. Defaults to Druid's default
+    :param by: 'datasource' or 'query_type' to limit each of them separately, a function
+        returning the key to limit a query by, or None to limit all queries together
+    :param dict limits: Settings by datasource or query type, as dicts with any of the keys rate,
+        burst, max_in_flight and priority. The others are taken from the defaults above
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> admission = AdmissionControl(rate=20, max_in_flight=8, by='datasource', limits={
+            ...     'batch_events': {'rate': 2, 'max_in_flight': 2, 'priority': -10}})
+            >>> client = PyDruid('http://localhost:8082', 'druid/v2/', admission=admission)
+    """
+
+    def __init__(self, rate=None, burst=None, max_in_flight=None, priority=None, by=None,
+                 limits=None):
+        if by not in (None, BY_DATASOURCE, BY_QUERY_TYPE) and not callable(by):
+            raise ValueError('Unknown key to limit queries by: {0}'.format(by))
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.priority = priority
+        self.by = by
+        self.limits = limits or {}
+        self._gates = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def key(self, query):
+        """
+        :param dict query: A query
+        :return: What the query is limited by: its datasource, its query type, or None
+        """
+        if self.by is None:
+            return None
+        if self.by == BY_QUERY_TYPE:
+            return query.get('queryType')
+        if self.by == BY_DATASOURCE:
+            datasource = query.get('dataSource')
+            if isinstance(datasource, dict):
+                return datasource.get('name')
+            return datasource
+        return self.by(query)
+
+    def prioritize(self, query):
+        """
+        :param dict query: A query, which is not modified
+        :return: The query, with context.priority set if it has none and one is configured for it
+        :rtype: dict
+        """
+        context = query.get('context') or {}
+        if 'priority' in context:
+            return query
+        priority = self._setting(self.key(query), 'priority')
+        if priority is None:
+            return query
+        query = query.copy()
+        query['context'] = dict(context, priority=priority)
+        return query
+
+    def acquire(self, query, deadline=None):
+        """
+        Wait until a query may be sent. Every acquire must be followed by a release once the
+        query is answered.
+
+        :param dict query: The query
+        :param float deadline: Time after which to stop waiting, if any
+        :return: The admission, to pass to release
+        :raise pydruid.exceptions.QueryTimeout: If the deadline passes first
+        """
+        with self._cond:
+            ticket = self.enter(query)
+            try:
+                while True:
+                    admitted, wait = self.poll(ticket)
+                    if admitted:
+                        return ticket
+                    wait = _until(deadline, wait)
+                    if wait is not None and wait <= 0:
+                        raise QueryTimeout(query, (query.get('context') or {}).get('queryId'))
+                    self._cond.wait(wait)
+            except BaseException:
+                self.release(ticket)
+                raise
+
+    def enter(self, query, wake=None):
+        """
+        Queue a query without waiting; the building block of acquire for callers that wait in
+        their own way, e.g., in an event loop. Poll the admission to find out if it was admitted.
+
+        :param dict query: The query
+        :param wake: Function called, with the lock held, when the query is admitted by another
+            caller's poll or release
+        :return: The admission, to pass to poll and release
+        """
+        key = self.key(query)
+        priority = (query.get('context') or {}).get('priority')
+        if priority is None:
+            priority = self._setting(key, 'priority') or 0
+        ticket = _Ticket(key, -priority, next(self._seq), wake)
+        with self._cond:
+            heapq.heappush(self._gate(key).waiting, ticket)
+        return ticket
+
+    def poll(self, ticket):
+        """
+        Admit the queued queries that may go now.
+
+        :param ticket: An admission returned by enter
+        :return: Whether that admission was admitted, and if not, the seconds until the next token,
+            or None if it waits for a query in flight to finish
+        :rtype: tuple
+        """
+        with self._cond:
+            wait = self._admit(self._gates[ticket.key])
+            return ticket.admitted, wait
+
+    def release(self, ticket):
+        """
+        Give back an admission once its query is answered, or stop waiting for it.
+
+        :param ticket: An admission returned by acquire or enter
+        """
+        with self._cond:
+            gate = self._gates[ticket.key]
+            if ticket.admitted:
+                gate.in_flight -= 1
+            elif ticket in gate.waiting:
+                gate.waiting.remove(ticket)
+                heapq.heapify(gate.waiting)
+            ticket.admitted = False
+            self._admit(gate)
+
+    def stats(self):
+        """
+        :return: For each key, the queries in flight, waiting and admitted so far
+        :rtype: dict
+        """
+        with self._cond:
+            return dict((key, {'in_flight': gate.in_flight, 'waiting': len(gate.waiting),
+                               'admitted': gate.admitted})
+                        for key, gate in six.iteritems(self._gates))
+
+    def _setting(self, key, name):
+        limits = self.limits.get(key)
+        if limits is not None and name in limits:
+            return limits[name]
+        return getattr(self, name)
+
+    def _gate(self, key):
+        gate = self._gates.get(key)
+        if gate is None:
+            rate = self._setting(key, 'rate')
+            burst = self._setting(key, 'burst')
+            if burst is None and rate is not None:
+                burst = rate if rate > 1 else 1
+            gate = self._gates[key] = _Gate(rate, burst, self._setting(key, 'max_in_flight'))
+        return gate
+
+    def _admit(self, gate):
+        admitted, wait = gate.admit(time.time())
+        if admitted:
+            for ticket in admitted:
+                if ticket.wake is not None:
+                    ticket.wake()
+            self._cond.notify_all()
+        return wait
+
+
+class _Ticket:
+    __slots__ = ('key', 'priority', 'seq', 'wake', 'admitted')
+
+    def __init__(self, key, priority, seq, wake):
+        self.key = key
+        # negated, as the heap pops the smallest first
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.admitted = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _Gate:
+    # the token bucket, in-flight count and queue of one key
+    def __init__(self, rate, burst, max_in_flight):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.tokens = burst
+        self.updated = time.time()
+        self.in_flight = 0
+        self.admitted = 0
+        self.waiting = []
+
+    def admit(self, now):
+        # admits waiting tickets in priority order while they fit; returns them, and the seconds
+        # until the next token if the first ticket left waits for one
+        if self.rate is not None:
+            self.tokens += (now - self.updated) * self.rate
+            if self.tokens > self.burst:
+                self.tokens = self.burst
+            self.updated = now
+        admitted = []
+        while self.waiting:
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                break
+            if self.rate is not None:
+                if self.tokens < 1:
+                    return admitted, (1 - self.tokens) / self.rate
+                self.tokens -= 1
+            ticket = heapq.heappop(self.waiting)
+            ticket.admitted = True
+            self.in_flight += 1
+            self.admitted += 1
+            admitted.append(ticket)
+        return admitted, None
+
+
+def _until(deadline, wait):
+    # the shorter of wait and the time left until the deadline, either of which may be None
+    if deadline is None:
+        return wait
+    remaining = deadline - time.time()
+    return remaining if wait is None or remaining < wait else wait
@@ -0,0 +1,513 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import asyncio
+import socket
+import time
+from urllib.parse import urlsplit
+
+from .batch import BatchResult
+from .client import BaseDruidClient, QueryTimeout
+from .hedging import with_query_id
+from .instrumentation import QueryMetrics
+from .query import QueryResult
+from .utils.compression import ENCODINGS, decompress
+
+
+class AsyncPyDruid(BaseDruidClient):
+    """
+    AsyncPyDruid exposes the same query methods as PyDruid, but each of them returns a coroutine
+    resolving to the query result instead of blocking, so a single event loop can keep many
+    queries in flight. Queries are sent over non-blocking keep-alive connections.
+
+    Query components are validated when the query method is called, so invalid queries raise
+    before anything is awaited. Each query resolves to its own pydruid.query.QueryResult and,
+    unlike PyDruid, nothing is recorded on the client, which makes one instance safe to share
+    between any number of concurrent tasks. Requires Python 3.5+.
+
+    :param url: URL of Broker node in the Druid cluster, or a list of URLs of Broker nodes to
+        spread queries across, or a pydruid.balancer.Balancer of them
+    :param str endpoint: Endpoint that Broker listens for queries on
+    :param AsyncConnectionPool pool: Pool of keep-alive connections to send queries over.
+        Defaults to a new pool owned by this client.
+    :param pydruid.cache.QueryCache cache: Cache to answer repeated queries from. Defaults to no caching
+    :param pydruid.cache.IntervalCache interval_cache: Cache to answer the already seen time buckets
+        of timeseries and groupBy queries from. Defaults to no caching
+    :param pydruid.codec.JSONCodec codec: Codec to encode queries and decode results with.
+        Defaults to the fastest one installed, see pydruid.codec.default_codec
+    :param bool compression: Whether to ask the Broker for gzip or deflate compressed responses
+    :param int compress_request_size: Gzip request bodies of at least this many bytes. Defaults
+        to never compressing them.
+    :param pydruid.hedging.Hedging hedging: Send a duplicate of queries that are slower than
+        usual, and use whichever answer comes first. Defaults to no hedging
+    :param float timeout: Seconds each query may take, including any retries, unless its context
+        sets a timeout of its own (in milliseconds, as Druid expects). Defaults to no timeout
+    :param pydruid.retry.RetryPolicy retry_policy: When to send failed queries again. Defaults to
+        never
+    :param pydruid.admission.AdmissionControl admission: Limits on the rate and concurrency of
+        queries, which wait on the client until they may be sent. Defaults to no limits
+    :param list listeners: pydruid.instrumentation.QueryListener instances to notify of every
+        query, with where its time went
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> from pydruid.client import *
+            >>> from pydruid.async_client import AsyncPyDruid
+
+            >>> client = AsyncPyDruid('http://localhost:8083', 'druid/v2/')
+
+            >>> top = await client.topn(
+                    datasource='twitterstream',
+                    granularity='all',
+                    intervals='2013-10-04/pt1h',
+                    aggregations={"count": doublesum("count")},
+                    dimension='user_name',
+                    filter = Dimension('user_lang') == 'en',
+                    metric='count',
+                    threshold=2
+                )
+
+            >>> print(top)
+            >>> [{'timestamp': '2013-10-04T00:00:00.000Z',
+                'result': [{'count': 7.0, 'user_name': 'user_1'}, {'count': 6.0, 'user_name': 'user_2'}]}]
+
+            >>> await client.close()
+    """
+
+    def __init__(self, url, endpoint, pool=None, cache=None, interval_cache=None, codec=None,
+                 compression=True, compress_request_size=None, hedging=None, timeout=None,
+                 retry_policy=None, admission=None, listeners=None):
+        BaseDruidClient.__init__(self, url, endpoint, cache, interval_cache, codec, compression,
+                                 compress_request_size, hedging, timeout, retry_policy, admission,
+                                 listeners)
+        self.pool = pool if pool is not None else AsyncConnectionPool()
+        self._cancellations = set()
+
+    async def _post(self, query, build=0.0):
+        if self.interval_cache is not None:
+            split = self.interval_cache.split(query)
+            if split is not None:
+                if split.query is None:
+                    return self._stitch_cached(split, build)
+                return split.stitch(await self._fetch(split.query, build))
+        return await self._fetch(query, build)
+
+    async def _fetch(self, query, build=0.0):
+        start = time.time()
+        metrics = self._started(query, build)
+        try:
+            result = self.cache.get(query) if self.cache is not None else None
+            if result is not None:
+                result = self._cache_hit(query, result, metrics)
+            else:
+                data, compressed_bytes, retries = await self._request(query, metrics)
+                result = QueryResult(query, data,
+                                     self._parse_result(data, query['queryType'], metrics),
+                                     time.time() - start, compressed_bytes, retries, metrics)
+                if self.cache is not None:
+                    self.cache.put(query, result)
+        except Exception as e:
+            self._finished(metrics, start, e)
+            raise
+        self._finished(metrics, start)
+        return result
+
+    async def _request(self, query, metrics=None):
+        # returns the response body, its size on the wire and the number of retries it took
+        deadline = self._deadline(query)
+        if self.admission is not None:
+            query = self.admission.prioritize(query)
+        started = time.time()
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                data, compressed_bytes = await self._attempt(query, deadline, metrics)
+            except Exception as e:
+                delay = self._retry_delay(e, attempts, started, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            else:
+                if metrics is not None:
+                    metrics.retries = attempts - 1
+                return data, compressed_bytes, attempts - 1
+
+    async def _attempt(self, query, deadline, metrics=None):
+        ticket = None
+        if self.admission is not None:
+            ticket = await self._admit(query, deadline)
+        try:
+            if self.hedging is not None and self.hedging.applies(query):
+                return await self._hedged_request(query, deadline, metrics)
+            return await self._read_query(query, deadline=deadline, metrics=metrics)
+        finally:
+            if ticket is not None:
+                self.admission.release(ticket)
+
+    async def _admit(self, query, deadline):
+        # waits on the event loop until admission lets the query go; the counterpart of
+        # AdmissionControl.acquire, sharing its queues and buckets
+        loop = asyncio.get_event_loop()
+        woken = asyncio.Event()
+        ticket = self.admission.enter(query, lambda: loop.call_soon_threadsafe(woken.set))
+        try:
+            while True:
+                woken.clear()
+                admitted, wait = self.admission.poll(ticket)
+                if admitted:
+                    return ticket
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise QueryTimeout(query, (query.get('context') or {}).get('queryId'))
+                    if wait is None or remaining < wait:
+                        wait = remaining
+                try:
+                    await asyncio.wait_for(woken.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self.admission.release(ticket)
+            raise
+
+    async def _read_query(self, query, tried=None, deadline=None, metrics=None):
+        # sends the query, cancelling it if the deadline passes before it is answered
+        if deadline is None:
+            return await self._balanced_request(query, tried, metrics=metrics)
+        query, query_id = with_query_id(query)
+        tried = tried if tried is not None else []
+        try:
+            return await self._balanced_request(query, tried, deadline, metrics)
+        except socket.timeout:
+            self._cancel(query_id, tried[-1].url if tried else None)
+            raise QueryTimeout(query, query_id)
+
+    async def _hedged_request(self, query, deadline=None, metrics=None):
+        # sends a duplicate of the query if no answer came within the hedging delay; the first
+        # answer wins and the other request is cancelled, see PyDruid._hedged_request
+        hedging = self.hedging
+        start = time.time()
+        primary, query_id = with_query_id(query)
+        hedge, hedge_id = with_query_id(query, query_id + '-hedge')
+        legs = {query_id: []}
+        # each request records its own metrics, as both may be running at once
+        leg_metrics = {query_id: QueryMetrics(primary), hedge_id: QueryMetrics(hedge)}
+        tasks = {asyncio.ensure_future(self._read_query(primary, legs[query_id], deadline,
+                                                        leg_metrics[query_id])): query_id}
+        done, pending = await asyncio.wait(list(tasks), timeout=hedging.delay(query['queryType']))
+        if not done and (self.balancer is None or len(legs[query_id]) < len(self.balancer.nodes)):
+            hedging.issue()
+            legs[hedge_id] = list(legs[query_id])
+            leg = asyncio.ensure_future(self._read_query(hedge, legs[hedge_id], deadline,
+                                                         leg_metrics[hedge_id]))
+            tasks[leg] = hedge_id
+        errors = {}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    leg_id = tasks[task]
+                    if task.exception() is not None:
+                        errors[leg_id] = task.exception()
+                        continue
+                    hedging.record(query['queryType'], time.time() - start,
+                                   won=(leg_id == hedge_id))
+                    if metrics is not None:
+                        metrics._record_exchange(leg_metrics[leg_id])
+                    for other in pending:
+                        tried = legs[tasks[other]]
+                        self._cancel(tasks[other], tried[-1].url if tried else None)
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise errors.get(query_id) or errors[hedge_id]
+
+    def _cancel(self, query_id, url=None):
+        # asks the Broker to stop running a query in the background; close() waits for it
+        async def cancel():
+            try:
+                await self.pool.request('DELETE', self._cancel_url(query_id, url))
+            except (IOError, OSError, asyncio.IncompleteReadError):
+                pass
+        task = asyncio.ensure_future(cancel())
+        self._cancellations.add(task)
+        task.add_done_callback(self._cancellations.discard)
+
+    async def _balanced_request(self, query, tried=None, deadline=None, metrics=None):
+        # sends the query, failing over between Brokers if there are several; tried collects the
+        # nodes the query is sent to. Past the deadline, raises socket.timeout
+        if self.balancer is None:
+            return await self._send(self._query_url(), query, deadline, metrics)
+        tried = tried if tried is not None else []
+        while True:
+            if deadline is not None and time.time() >= deadline:
+                raise socket.timeout('Query deadline passed')
+            node = self.balancer.acquire(tried)
+            if node is None:
+                raise IOError('No Broker left to send the query to')
+            tried.append(node)
+            start = time.time()
+            try:
+                response = await self._send(self._query_url(node.url), query, deadline, metrics)
+            except asyncio.CancelledError:
+                self.balancer.release(node)
+                raise
+            except Exception as e:
+                if not self.balancer.should_retry(self.balancer.release(node, error=e), len(tried)):
+                    raise
+            else:
+                self.balancer.release(node, time.time() - start)
+                return response
+
+    async def _send(self, url, query, deadline=None, metrics=None):
+        timeout = None
+        if deadline is not None:
+            query, timeout = self._with_remaining(query, deadline)
+        start = time.time()
+        body, headers = self._request_body(query)
+        serialized = time.time()
+        if deadline is None:
+            res = await self.pool.request('POST', url, body, headers)
+        else:
+            try:
+                res = await asyncio.wait_for(self.pool.request('POST', url, body, headers), timeout)
+            except asyncio.TimeoutError:
+                raise QueryTimeout(query, query['context'].get('queryId'))
+        received = time.time()
+        data = res.body
+        encoding = res.headers.get('content-encoding', '').strip().lower()
+        if encoding in ENCODINGS:
+            data = decompress(data, encoding)
+        if metrics is not None:
+            metrics.broker = url
+            metrics.serialize = serialized - start
+            metrics.request_bytes = len(body)
+            metrics.connect = res.connect_time
+            metrics.ttfb = res.ttfb
+            metrics.download = res.download + time.time() - received
+            metrics.response_bytes = len(res.body)
+            metrics.uncompressed_bytes = len(data)
+            metrics._record_headers(lambda name: res.headers.get(name.lower()))
+        if res.status >= 400:
+            raise self._query_error(query, res.status, res.reason, data)
+        return data, len(res.body)
+
+    async def run_many(self, queries, max_concurrency=100):
+        """
+        Run many independent queries concurrently, with at most max_concurrency of them in flight.
+
+        Results come back in the same order as the queries. A query that fails does not abort the
+        batch: its BatchResult carries the exception instead of a result.
+
+        :param list queries: (query_type, kwargs) pairs, where query_type names a query method of
+            this client, e.g., 'topn', and kwargs are the arguments it would be called with
+        :param int max_concurrency: Maximum number of queries in flight at once
+        :return: One result per query, in input order
+        :rtype: list[pydruid.batch.BatchResult]
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(spec):
+            async with semaphore:
+                start = time.time()
+                query = None
+                try:
+                    query = self._query_from_spec(spec)
+                    result = await self._post(query)
+                except Exception as e:
+                    return BatchResult(spec, query, error=e, elapsed=time.time() - start)
+                return BatchResult(spec, query, result, elapsed=time.time() - start)
+
+        return await asyncio.gather(*[run_one(spec) for spec in queries])
+
+    async def close(self):
+        """
+        Close the idle connections of this client's pool, once pending cancellations are sent.
+        """
+        if self._cancellations:
+            await asyncio.wait(list(self._cancellations))
+        await self.pool.clear()
+
+
+class AsyncConnectionPool:
+    """
+    A pool of persistent (keep-alive) HTTP/1.1 connections for use from a single event loop, keyed
+    by scheme, host and port. Reuse and health checking follow pydruid.pool.ConnectionPool:
+    connections are handed out most-recently-used first, and idle connections that timed out or
+    were closed by the server are discarded.
+
+    :param int max_connections: Maximum number of idle connections kept per host. More connections
+        are opened on demand when all pooled ones are in use; the surplus is closed when released.
+    :param float idle_timeout: Seconds an idle connection may stay in the pool before it is discarded
+    """
+
+    def __init__(self, max_connections=100, idle_timeout=60.0):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+
+    async def request(self, method, url, body=b'', headers=None):
+        """
+        Send a request over a pooled connection and read the whole response.
+
+        A request that fails on a reused connection before any response is received is retried
+        once on a fresh connection, since the server may have closed the socket in the meantime.
+
+        :param str method: HTTP method, e.g., POST
+        :param str url: Absolute URL to send the request to
+        :param bytes body: Request body
+        :param dict headers: Request headers
+        :rtype: AsyncResponse
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        lines = ['{0} {1} HTTP/1.1'.format(method, path),
+                 'Host: {0}:{1}'.format(key[1], key[2]),
+                 'Content-Length: {0}'.format(len(body))]
+        lines.extend('{0}: {1}'.format(name, value) for name, value in (headers or {}).items())
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+        while True:
+            start = time.time()
+            conn, reused = await self._get(key)
+            connected = time.time()
+            reader, writer = conn
+            try:
+                writer.write(request)
+                await writer.drain()
+                response = await _read_response(reader, connected)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if response.will_close:
+                writer.close()
+            else:
+                self._put(key, conn)
+            response.connect_time = connected - start
+            return response
+
+    async def clear(self):
+        """
+        Close all idle connections.
+        """
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for (_, writer), _ in conns:
+                writer.close()
+
+    async def _get(self, key):
+        now = time.time()
+        conns = self._idle.get(key)
+        while conns:
+            conn, last_used = conns.pop()
+            reader, writer = conn
+            if (now - last_used <= self.idle_timeout and not reader.at_eof() and
+                    not writer.transport.is_closing()):
+                return conn, True
+            writer.close()
+        scheme, host, port = key
+        reader, writer = await asyncio.open_connection(host, port, ssl=(scheme == 'https'))
+        writer.transport.get_extra_info('socket').setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return (reader, writer), False
+
+    def _put(self, key, conn):
+        conns = self._idle.setdefault(key, [])
+        if len(conns) < self.max_connections:
+            conns.append((conn, time.time()))
+        else:
+            conn[1].close()
+
+
+class AsyncResponse:
+    """
+    A fully read HTTP response.
+
+    :ivar int status: HTTP status code
+    :ivar str reason: HTTP reason phrase
+    :ivar dict headers: Response headers, with lower-cased names
+    :ivar bytes body: Response body
+    :ivar float connect_time: Seconds spent getting a connection for the request
+    :ivar float ttfb: Seconds from sending the request until the response headers arrived
+    :ivar float download: Seconds spent reading the response body
+    """
+
+    def __init__(self, status, reason, headers, body, will_close, ttfb=0.0, download=0.0):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.will_close = will_close
+        self.connect_time = 0.0
+        self.ttfb = ttfb
+        self.download = download
+
+
+async def _read_response(reader, sent=None):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError('Connection closed before a response was received')
+    version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    headers_received = time.time()
+    connection = headers.get('connection', '').lower()
+    will_close = connection == 'close' or (version == 'HTTP/1.0' and connection != 'keep-alive')
+
+    if int(status) in (204, 304) or int(status) < 200:
+        body = b''
+    elif 'chunked' in headers.get('transfer-encoding', '').lower():
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0], 16)
+            if size == 0:
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        # skip any trailers
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        body = b''.join(chunks)
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body = await reader.read()
+        will_close = True
+
+    return AsyncResponse(int(status), reason, headers, body, will_close,
+                         headers_received - sent if sent is not None else 0.0,
+                         time.time() - headers_received)
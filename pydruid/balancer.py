@@ -0,0 +1,236 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+from __future__ import division
+
+import socket
+import threading
+import time
+
+from six.moves import http_client
+
+from .exceptions import QueryTimeout
+
+# HTTP statuses meaning the Broker itself (or a proxy in front of it) is unavailable, rather than
+# that the query failed
+UNAVAILABLE_STATUSES = frozenset([502, 503, 504])
+
+LEAST_OUTSTANDING = 'least_outstanding'
+LATENCY = 'latency'
+
+
+class BrokerNode:
+    """
+    The state the balancer keeps for one Broker.
+
+    :ivar str url: URL of the Broker
+    :ivar int outstanding: Number of queries sent to it that have not been answered yet
+    :ivar float latency: Moving average of its response time in seconds, or None until measured
+    :ivar int failures: Number of consecutive failed requests
+    :ivar int trips: Number of times in a row its circuit was opened
+    :ivar float open_until: Time until which it is skipped, or 0 if its circuit is closed
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.latency = None
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def __repr__(self):
+        return 'BrokerNode({0!r})'.format(self.url)
+
+
+class Balancer:
+    """
+    Spreads queries across several Broker nodes and steers them away from unhealthy ones.
+
+    Each query goes to the available node with the fewest queries outstanding, or, with the
+    latency strategy, the lowest moving average response time weighted by the queries
+    outstanding on it. Ties are broken round-robin. A node is counted as busy until its response
+    headers arrive, which is when the Broker has finished computing the result.
+
+    Nodes are health checked passively with a circuit breaker: after failure_threshold
+    consecutive connection errors or unavailable responses (HTTP 502, 503 or 504) a node is
+    skipped for backoff seconds, doubling each time it trips again up to max_backoff. Once that
+    has passed, a single query is let through as a probe; it closes the circuit if it succeeds
+    and reopens it if it fails. Errors reported by Druid for a query, e.g., a syntax error or a
+    timeout, say nothing about the node's health and don't count as failures, and neither do
+    queries running past their client-side deadline.
+
+    Druid queries are reads, so a query whose node failed is safely retried on another node, up
+    to max_attempts nodes in total. When every node is unavailable, the one due to recover first
+    is tried anyway rather than failing without a request.
+
+    :param list urls: URLs of the Broker nodes
+    :param str strategy: 'least_outstanding' or 'latency'
+    :param int max_attempts: Maximum number of nodes to try a query on
+    :param int failure_threshold: Consecutive failures after which a node is skipped
+    :param float backoff: Seconds a node is skipped for the first time its circuit opens
+    :param float max_backoff: Upper bound of the backoff
+    :param float latency_decay: Weight of the latest sample in the moving average response time
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> client = PyDruid(['http://broker1:8082', 'http://broker2:8082'], 'druid/v2/')
+
+            >>> balancer = Balancer(['http://broker1:8082', 'http://broker2:8082'], strategy='latency')
+            >>> client = PyDruid(balancer, 'druid/v2/')
+    """
+
+    def __init__(self, urls, strategy=LEAST_OUTSTANDING, max_attempts=3, failure_threshold=3,
+                 backoff=1.0, max_backoff=60.0, latency_decay=0.3):
+        if not urls:
+            raise ValueError('Balancer needs at least one Broker URL')
+        if strategy not in (LEAST_OUTSTANDING, LATENCY):
+            raise ValueError('Unknown balancing strategy: {0}'.format(strategy))
+        self.nodes = [BrokerNode(url) for url in urls]
+        self.strategy = strategy
+        self.max_attempts = max_attempts
+        self.failure_threshold = failure_threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.latency_decay = latency_decay
+        self.failovers = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude=()):
+        """
+        Pick the node to send a query to and count the query as outstanding on it.
+
+        :param exclude: Nodes not to pick, e.g., those the query already failed on
+        :return: The node, or None if all nodes are excluded
+        :rtype: BrokerNode
+        """
+        now = time.time()
+        with self._lock:
+            candidates = [node for node in self.nodes if node not in exclude]
+            if not candidates:
+                return None
+            available = [node for node in candidates if self._available(node, now)]
+            if available:
+                # rotate the starting point so that ties are broken round-robin
+                start = self._next % len(available)
+                self._next += 1
+                available = available[start:] + available[:start]
+                node = available[0]
+                for other in available[1:]:
+                    if self._score(other) < self._score(node):
+                        node = other
+            else:
+                node = candidates[0]
+                for other in candidates[1:]:
+                    if other.open_until < node.open_until:
+                        node = other
+            if node.open_until:
+                node.probing = True
+            node.outstanding += 1
+            return node
+
+    def release(self, node, elapsed=None, error=None):
+        """
+        Record the outcome of a query sent to a node.
+
+        :param BrokerNode node: The node returned by acquire
+        :param float elapsed: Seconds it took to respond, if it did
+        :param Exception error: What the query failed with, if it did
+        :return: Whether the error means the node failed, so that the query should be retried on
+            another node
+        :rtype: bool
+        """
+        failed = error is not None and is_node_failure(error)
+        with self._lock:
+            node.outstanding -= 1
+            node.probing = False
+            if failed:
+                node.failures += 1
+                if node.open_until or node.failures >= self.failure_threshold:
+                    node.open_until = time.time() + min(self.backoff * 2 ** node.trips,
+                                                        self.max_backoff)
+                    node.trips += 1
+                return True
+            node.failures = 0
+            node.trips = 0
+            node.open_until = 0.0
+            if elapsed is not None:
+                if node.latency is None:
+                    node.latency = elapsed
+                else:
+                    node.latency += self.latency_decay * (elapsed - node.latency)
+        return False
+
+    def should_retry(self, failed, attempts):
+        """
+        Whether a query that was tried on attempts nodes should go to another one.
+
+        :param bool failed: What release returned for the last attempt
+        :param int attempts: Number of nodes tried so far
+        :rtype: bool
+        """
+        if not failed or attempts >= min(self.max_attempts, len(self.nodes)):
+            return False
+        with self._lock:
+            self.failovers += 1
+        return True
+
+    def stats(self):
+        """
+        :return: The state of each node, and the number of queries retried on another node
+        :rtype: dict
+        """
+        now = time.time()
+        with self._lock:
+            nodes = [{
+                'url': node.url,
+                'outstanding': node.outstanding,
+                'latency': node.latency,
+                'failures': node.failures,
+                'available': self._available(node, now),
+            } for node in self.nodes]
+            return {'nodes': nodes, 'failovers': self.failovers}
+
+    def _available(self, node, now):
+        # closed, or half open with no probe in flight yet
+        return not node.open_until or (now >= node.open_until and not node.probing)
+
+    def _score(self, node):
+        if self.strategy == LATENCY:
+            # unmeasured nodes go first, so every node gets a latency sample
+            return (node.outstanding + 1) * (node.latency or 0.0)
+        return node.outstanding
+
+
+def is_node_failure(error):
+    """
+    Whether an error raised while querying a Broker means the Broker is unavailable, as opposed
+    to Druid rejecting or failing the query, or the query running past its deadline.
+
+    :param Exception error: The error
+    :rtype: bool
+    """
+    if isinstance(error, QueryTimeout):
+        return False
+    status = getattr(error, 'status', None)
+    if status is not None:
+        return status in UNAVAILABLE_STATUSES
+    return isinstance(error, (socket.error, http_client.HTTPException, EOFError))
@@ -0,0 +1,86 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+
+import threading
+import time
+
+from six.moves import queue
+
+
+class BatchResult:
+    """
+    The outcome of one query run as part of a batch.
+
+    :ivar tuple spec: The (query_type, kwargs) pair the query was built from
+    :ivar dict query: The query sent to Druid, or None if it could not be built
+    :ivar pydruid.query.QueryResult result: The query result, or None if the query failed
+    :ivar Exception error: The exception that failed the query, or None if it succeeded
+    :ivar float elapsed: Seconds spent building and running the query
+    """
+
+    def __init__(self, spec, query=None, result=None, error=None, elapsed=0.0):
+        self.spec = spec
+        self.query = query
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return 'BatchResult({0!r}, ok={1}, elapsed={2:.3f})'.format(
+            self.spec[0], self.ok, self.elapsed)
+
+
+def run_many(client, queries, max_concurrency=10):
+    """
+    Run queries with client over up to max_concurrency threads. See PyDruid.run_many.
+    """
+    results = [None] * len(queries)
+    pending = queue.Queue()
+    for i in range(len(queries)):
+        pending.put(i)
+
+    def worker():
+        while True:
+            try:
+                i = pending.get_nowait()
+            except queue.Empty:
+                return
+            results[i] = run_one(client, queries[i])
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(min(max_concurrency, len(queries)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_one(client, spec):
+    start = time.time()
+    query = None
+    try:
+        query = client._query_from_spec(spec)
+        result = client._execute(query)
+    except Exception as e:
+        return BatchResult(spec, query, error=e, elapsed=time.time() - start)
+    return BatchResult(spec, query, result, elapsed=time.time() - start)
@@ -0,0 +1,428 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import six
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from .query import QueryResult
+from .utils.intervals import (GRANULARITIES, add_period, floor_instant, format_instant,
+                              parse_instant, parse_intervals)
+
+# context settings that change how a query runs, but not what it returns
+_NON_RESULT_CONTEXT = frozenset([
+    'queryId', 'timeout', 'priority', 'useCache', 'populateCache', 'useResultLevelCache',
+    'populateResultLevelCache', 'maxScatterGatherBytes', 'chunkPeriod',
+])
+
+
+class QueryCache:
+    """
+    A client-side cache of query results, keyed on the canonical serialization of the query.
+
+    Identical queries issued within ttl seconds of each other are answered from memory instead of
+    by the Broker. The least recently used results are evicted once the cache holds more than
+    max_entries results or more than max_bytes bytes of raw response. Cached results are shared
+    between callers, so they must be treated as read-only.
+
+    Queries whose intervals reach into the future (or which have no intervals at all, like
+    timeBoundary) return results that are still changing, and are not cached unless cache_recent
+    is set. A query can also opt out through its context, which is sent on to Druid as usual:
+    useCache=False skips the lookup and populateCache=False skips storing the result.
+
+    :param int max_entries: Maximum number of cached results
+    :param int max_bytes: Maximum total size of the cached results' raw responses
+    :param float ttl: Seconds a result stays valid after it was cached
+    :param bool cache_recent: Whether to also cache queries over intervals that touch the present
+
+    :ivar int hits: Number of lookups answered from the cache
+    :ivar int misses: Number of lookups that found no valid result
+    :ivar int evictions: Number of results evicted to make room for others
+    :ivar int expirations: Number of results dropped because they outlived ttl
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> from pydruid.cache import QueryCache
+            >>> query = PyDruid('http://localhost:8083', 'druid/v2/', cache=QueryCache(ttl=30))
+            >>> ts = query.timeseries(datasource='twitterstream', granularity='hour',
+                                      intervals='2013-10-04/p1d', aggregations={"count": doublesum("count")})
+            >>> ts = query.timeseries(datasource='twitterstream', granularity='hour',
+                                      intervals='2013-10-04/p1d', aggregations={"count": doublesum("count")})
+            >>> print query.cache.stats()
+            >>> {'hits': 1, 'misses': 1, 'evictions': 0, 'expirations': 0, 'entries': 1, 'bytes': 2791}
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024, ttl=60.0, cache_recent=False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cache_recent = cache_recent
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def key(self, query):
+        """
+        The canonical form of a query: its JSON serialization with sorted keys, leaving out context
+        settings that don't affect the result.
+        """
+        return _canonical(query)
+
+    def get(self, query):
+        """
+        Look up the cached result of a query.
+
+        :return: The cached result, or None if there is no valid one or the query opts out
+        :rtype: pydruid.query.QueryResult
+        """
+        if (query.get('context') or {}).get('useCache', True) is False:
+            return None
+        key = self.key(query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, size, result = entry
+            if expires < now:
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            # re-insert to mark as most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return result
+
+    def put(self, query, result):
+        """
+        Cache the result of a query, unless the query opts out or its result may still change.
+
+        :param dict query: The query
+        :param pydruid.query.QueryResult result: Its result
+        """
+        if (query.get('context') or {}).get('populateCache', True) is False:
+            return
+        if not self.cache_recent and self._touches_now(query):
+            return
+        size = len(result.result_json or b'')
+        if size > self.max_bytes:
+            return
+        key = self.key(query)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.time() + self.ttl, size, result)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop all cached results. The counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        :return: The hit, miss, eviction and expiration counters and the current size of the cache
+        :rtype: dict
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'expirations': self.expirations, 'entries': len(self._entries),
+                    'bytes': self._bytes}
+
+    def _touches_now(self, query):
+        if 'intervals' not in query:
+            return True
+        try:
+            intervals = parse_intervals(query['intervals'])
+        except (ValueError, TypeError, AttributeError):
+            return True
+        return any(end > _utcnow() for _, end in intervals)
+
+
+class IntervalCache:
+    """
+    A client-side cache of timeseries and groupBy results that stores them per granularity bucket,
+    so that a query over a sliding window (say, the last 30 days by hour) only asks the Broker for
+    the buckets it has not seen yet.
+
+    The query's intervals are split on bucket boundaries. Buckets that lie entirely within the
+    intervals and entirely in the past are looked up in the cache; the missing ones, plus any
+    partial buckets at the edges of the intervals or still in progress, are fetched from Druid in
+    a single query. The rows of both are then stitched back together in timestamp order. Newly
+    fetched complete buckets are cached, including empty ones.
+
+    Only the simple UTC granularities (hour, day, etc., see pydruid.utils.intervals.GRANULARITIES)
+    are supported. Other queries, such as those with granularity all, a period granularity, or a
+    limit that spans buckets, run uncached. Like QueryCache, the context flags useCache=False and
+    populateCache=False skip the lookup or the store, and cached rows are shared between callers,
+    so they must be treated as read-only.
+
+    :param int max_buckets: Maximum number of cached buckets over all queries. When exceeded, the
+        buckets of the least recently used queries are evicted. A query spanning more buckets than
+        this runs uncached.
+    :param float ttl: Seconds a bucket stays valid after it was cached, or None to keep it until it
+        is evicted
+    :param float min_age: Seconds that must have passed since the end of a bucket before it is
+        cached, to allow for late-arriving data
+
+    :ivar int hits: Number of buckets answered from the cache
+    :ivar int misses: Number of complete buckets fetched from Druid
+    :ivar int evictions: Number of buckets evicted to make room for others
+    :ivar int expirations: Number of buckets dropped because they outlived ttl
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> from pydruid.cache import IntervalCache
+            >>> query = PyDruid('http://localhost:8083', 'druid/v2/', interval_cache=IntervalCache())
+            >>> ts = query.timeseries(datasource='twitterstream', granularity='hour',
+                                      intervals='P30D/2013-10-31T12', aggregations={"count": doublesum("count")})
+            >>> ts = query.timeseries(datasource='twitterstream', granularity='hour',
+                                      intervals='P30D/2013-10-31T13', aggregations={"count": doublesum("count")})
+            >>> print query.interval_cache.stats()
+            >>> {'hits': 719, 'misses': 720, 'evictions': 0, 'expirations': 0, 'queries': 1, 'buckets': 721}
+    """
+
+    def __init__(self, max_buckets=1000000, ttl=None, min_age=0.0):
+        self.max_buckets = max_buckets
+        self.ttl = ttl
+        self.min_age = min_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # canonical query without its intervals -> {bucket start: (expiry, rows)}
+        self._series = OrderedDict()
+        self._buckets = 0
+        self._lock = threading.Lock()
+
+    def split(self, query):
+        """
+        Split a query into the part answered from the cache and the part to fetch from Druid.
+
+        :param dict query: The query
+        :return: The split, or None if the query cannot be cached per bucket
+        :rtype: IntervalSplit
+        """
+        granularity = query.get('granularity')
+        if (query.get('queryType') not in ('timeseries', 'groupBy') or
+                not isinstance(granularity, six.string_types) or granularity.lower() not in GRANULARITIES or
+                'limit' in query or (query.get('limitSpec') or {}).get('limit') is not None or
+                (query.get('context') or {}).get('grandTotal')):
+            return None
+        granularity = granularity.lower()
+        try:
+            intervals = _condense(parse_intervals(query['intervals']))
+        except (KeyError, ValueError, TypeError, AttributeError):
+            return None
+
+        period = GRANULARITIES[granularity]
+        cutoff = _utcnow() - timedelta(seconds=self.min_age)
+        fetch = []
+        complete = []
+        for start, end in intervals:
+            first = floor_instant(start, granularity)
+            if first < start:
+                first = add_period(first, period)
+            last = floor_instant(min(end, cutoff), granularity)
+            if last <= first:
+                fetch.append((start, end))
+                continue
+            if start < first:
+                fetch.append((start, first))
+            bucket = first
+            while bucket < last:
+                complete.append(bucket)
+                if len(complete) > self.max_buckets:
+                    return None
+                bucket = add_period(bucket, period)
+            if last < end:
+                fetch.append((last, end))
+
+        key = _canonical(dict(query, granularity=granularity), exclude=('intervals',))
+        context = query.get('context') or {}
+        cached = {}
+        if context.get('useCache', True) is not False:
+            cached = self._lookup(key, complete)
+        missing = [bucket for bucket in complete if bucket not in cached]
+        fetch.extend((bucket, add_period(bucket, period)) for bucket in missing)
+        populate = context.get('populateCache', True) is not False
+        # runs of adjacent buckets are fetched as single intervals
+        return IntervalSplit(query, key, granularity, cached, missing, _condense(fetch),
+                             self if populate else None)
+
+    def clear(self):
+        """
+        Drop all cached buckets. The counters are kept.
+        """
+        with self._lock:
+            self._series.clear()
+            self._buckets = 0
+
+    def stats(self):
+        """
+        :return: The hit, miss, eviction and expiration counters, the number of queries with cached
+            buckets and the total number of cached buckets
+        :rtype: dict
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'expirations': self.expirations, 'queries': len(self._series),
+                    'buckets': self._buckets}
+
+    def _lookup(self, key, buckets):
+        now = time.time()
+        found = {}
+        with self._lock:
+            series = self._series.pop(key, None)
+            if series is None:
+                return found
+            # re-insert to mark as most recently used
+            self._series[key] = series
+            for bucket in buckets:
+                entry = series.get(bucket)
+                if entry is None:
+                    continue
+                if entry[0] is not None and entry[0] < now:
+                    del series[bucket]
+                    self._buckets -= 1
+                    self.expirations += 1
+                    continue
+                found[bucket] = entry[1]
+            self.hits += len(found)
+        return found
+
+    def _store(self, key, rows_by_bucket):
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self.misses += len(rows_by_bucket)
+            series = self._series.pop(key, None)
+            if series is None:
+                series = {}
+            self._series[key] = series
+            for bucket, rows in rows_by_bucket.items():
+                if bucket not in series:
+                    self._buckets += 1
+                series[bucket] = (expires, rows)
+            while self._buckets > self.max_buckets and len(self._series) > 1:
+                _, evicted = self._series.popitem(last=False)
+                self._buckets -= len(evicted)
+                self.evictions += len(evicted)
+
+
+class IntervalSplit:
+    """
+    The result of IntervalCache.split: the buckets of a query found in the cache, and the query to
+    fetch the rest with.
+
+    :ivar dict query: The query to send to Druid for the uncached parts of the intervals, or None
+        if the cache holds all of them
+    """
+
+    def __init__(self, query, key, granularity, cached, missing, fetch, cache):
+        self.original = query
+        self.key = key
+        self.granularity = granularity
+        self.cached = cached
+        self.missing = missing
+        # where to store the fetched buckets, if anywhere
+        self.cache = cache
+        self.query = None
+        if fetch:
+            self.query = dict(query)
+            self.query['intervals'] = ['{0}/{1}'.format(format_instant(start), format_instant(end))
+                                       for start, end in fetch]
+
+    def stitch(self, fetched=None):
+        """
+        Combine the cached buckets with the result of the fetched query, and cache the complete
+        buckets that were fetched.
+
+        :param pydruid.query.QueryResult fetched: The result of running query, if it is not None
+        :return: The result of the original query
+        :rtype: pydruid.query.QueryResult
+        """
+        rows = []
+        for bucket, bucket_rows in self.cached.items():
+            rows.extend((bucket, row) for row in bucket_rows)
+        fetched_buckets = dict((bucket, []) for bucket in self.missing)
+        for row in (fetched.result if fetched is not None else []):
+            bucket = floor_instant(parse_instant(row['timestamp']), self.granularity)
+            rows.append((bucket, row))
+            if bucket in fetched_buckets:
+                fetched_buckets[bucket].append(row)
+        if self.cache is not None and fetched_buckets:
+            self.cache._store(self.key, fetched_buckets)
+
+        # the sort is stable, keeping Druid's order of the rows within a bucket
+        rows.sort(key=lambda item: item[0], reverse=bool(self.original.get('descending')))
+        result = [row for _, row in rows]
+        return QueryResult(self.original, json.dumps(result).encode('utf-8'), result,
+                           fetched.elapsed if fetched is not None else 0.0, None,
+                           fetched.retries if fetched is not None else 0)
+
+
+def _canonical(query, exclude=()):
+    context = query.get('context')
+    if context or exclude:
+        query = dict((k, v) for k, v in query.items() if k not in exclude)
+        if context:
+            query['context'] = dict((k, v) for k, v in context.items() if k not in _NON_RESULT_CONTEXT)
+    return json.dumps(query, sort_keys=True, separators=(',', ':'))
+
+
+def _condense(intervals):
+    # merge overlapping and adjacent intervals, as Druid does
+    condensed = []
+    for start, end in sorted(intervals):
+        if condensed and start <= condensed[-1][1]:
+            if end > condensed[-1][1]:
+                condensed[-1] = (condensed[-1][0], end)
+        else:
+            condensed.append((start, end))
+    return condensed
+
+
+def _utcnow():
+    return datetime(1970, 1, 1) + timedelta(seconds=time.time())
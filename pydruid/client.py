@@ -16,16 +16,25 @@
 from __future__ import division
 from __future__ import absolute_import
 
-import sys
+import socket
+import threading
+import time
 
 import six
-from six.moves import urllib
-
-try:
-    import pandas
-except ImportError:
-    print('Warning: unable to import Pandas. The export_pandas method will not work.')
-    pass
+from six.moves import queue
+from six.moves.urllib.parse import quote
+
+from .balancer import Balancer
+from .batch import run_many
+from .codec import default_codec
+from .exceptions import QueryError, QueryTimeout
+from .hedging import with_query_id
+from .instrumentation import QueryMetrics
+from .pool import ConnectionPool
+from .query import QueryResult, ROW_PATHS, count_rows, flatten_row
+from .template import BoundQuery, QueryTemplate
+from .utils.compression import ACCEPT_ENCODING, ENCODINGS, DecompressingReader, gzip_compress
+from .utils.json_stream import iter_items
 
 from .utils.aggregators import *
 from .utils.postaggregator import *
@@ -33,247 +42,187 @@ from .utils.filters import *
 from .utils.having import *
 from .utils.query_utils import *
 
-class PyDruid:
+
+class BaseDruidClient:
     """
-    PyDruid contains the functions for creating and executing Druid queries, as well as
-    for exporting query results into TSV files or pandas.DataFrame objects for subsequent analysis.
+    Query building and validation shared by the Druid clients. Each query method validates and
+    builds its query, then hands it to _post, which subclasses implement to actually send it: the
+    blocking PyDruid returns the result, while AsyncPyDruid returns a coroutine resolving to it.
 
-    :param str url: URL of Broker node in the Druid cluster
+    :param url: URL of Broker node in the Druid cluster, or a list of URLs of Broker nodes to
+        spread queries across, or a pydruid.balancer.Balancer of them
     :param str endpoint: Endpoint that Broker listens for queries on
-
-    :ivar str result_json: JSON object representing a query result. Initial value: None
-    :ivar list result: Query result parsed into a list of dicts. Initial value: None
-    :ivar str query_type: Name of most recently run query, e.g., topN. Initial value: None
-    :ivar dict query_dict: JSON object representing the query. Initial value: None
-
-    Example
-
-    .. code-block:: python
-        :linenos:
-
-            >>> from pydruid.client import *
-
-            >>> query = PyDruid('http://localhost:8083', 'druid/v2/')
-
-            >>> top = query.topn(
-                    datasource='twitterstream',
-                    granularity='all',
-                    intervals='2013-10-04/pt1h',
-                    aggregations={"count": doublesum("count")},
-                    dimension='user_name',
-                    filter = Dimension('user_lang') == 'en',
-                    metric='count',
-                    threshold=2
-                )
-
-            >>> print json.dumps(query.query_dict, indent=2)
-            >>> {
-                  "metric": "count",
-                  "aggregations": [
-                    {
-                      "type": "doubleSum",
-                      "fieldName": "count",
-                      "name": "count"
-                    }
-                  ],
-                  "dimension": "user_name",
-                  "filter": {
-                    "type": "selector",
-                    "dimension": "user_lang",
-                    "value": "en"
-                  },
-                  "intervals": "2013-10-04/pt1h",
-                  "dataSource": "twitterstream",
-                  "granularity": "all",
-                  "threshold": 2,
-                  "queryType": "topN"
-                }
-
-            >>> print query.result
-            >>> [{'timestamp': '2013-10-04T00:00:00.000Z',
-                'result': [{'count': 7.0, 'user_name': 'user_1'}, {'count': 6.0, 'user_name': 'user_2'}]}]
-
-            >>> df = query.export_pandas()
-            >>> print df
-            >>>    count                 timestamp      user_name
-                0      7  2013-10-04T00:00:00.000Z         user_1
-                1      6  2013-10-04T00:00:00.000Z         user_2
+    :param pydruid.cache.QueryCache cache: Cache to answer repeated queries from. Defaults to no caching
+    :param pydruid.cache.IntervalCache interval_cache: Cache to answer the already seen time buckets
+        of timeseries and groupBy queries from. Defaults to no caching
+    :param pydruid.codec.JSONCodec codec: Codec to encode queries and decode results with.
+        Defaults to the fastest one installed, see pydruid.codec.default_codec
+    :param bool compression: Whether to ask the Broker for gzip or deflate compressed responses.
+        Compressed responses are decompressed as they are read.
+    :param int compress_request_size: Gzip request bodies of at least this many bytes, e.g., for
+        queries with huge filters. Defaults to never compressing them.
+    :param pydruid.hedging.Hedging hedging: Send a duplicate of queries that are slower than
+        usual, and use whichever answer comes first. Defaults to no hedging
+    :param float timeout: Seconds each query may take, including any retries, unless its context
+        sets a timeout of its own (in milliseconds, as Druid expects). Defaults to no timeout
+    :param pydruid.retry.RetryPolicy retry_policy: When to send failed queries again. Defaults to
+        never
+    :param pydruid.admission.AdmissionControl admission: Limits on the rate and concurrency of
+        queries, which wait on the client until they may be sent. Defaults to no limits
+    :param list listeners: pydruid.instrumentation.QueryListener instances to notify of every
+        query, with where its time went
     """
 
-    def __init__(self, url, endpoint):
-        self.url = url
+    def __init__(self, url, endpoint, cache=None, interval_cache=None, codec=None,
+                 compression=True, compress_request_size=None, hedging=None, timeout=None,
+                 retry_policy=None, admission=None, listeners=None):
+        if isinstance(url, Balancer):
+            self.balancer = url
+        elif isinstance(url, (list, tuple)):
+            self.balancer = Balancer(url)
+        else:
+            self.balancer = None
+        self.url = self.balancer.nodes[0].url if self.balancer is not None else url
         self.endpoint = endpoint
+        self.cache = cache
+        self.interval_cache = interval_cache
+        self.codec = codec if codec is not None else default_codec()
+        self.compression = compression
+        self.compress_request_size = compress_request_size
+        self.hedging = hedging
+        self.timeout = timeout
+        self.retry_policy = retry_policy
+        self.admission = admission
+        self.listeners = list(listeners or ())
         self.result = None
         self.result_json = None
         self.query_type = None
         self.query_dict = None
 
-    def __post(self, query):
-        try:
-            querystr = json.dumps(query).encode('utf-8')
-            if self.url.endswith('/'):
-                url = self.url + self.endpoint
-            else:
-                url = self.url + '/' + self.endpoint
-            headers = {'Content-Type': 'application/json'}
-            req = urllib.request.Request(url, querystr, headers)
-            res = urllib.request.urlopen(req)
-            data = res.read()
-            self.result_json = data
-            res.close()
-        except urllib.error.HTTPError:
-            _, e, _ = sys.exc_info()
-            err=None
-            if e.code==500:
-                # has Druid returned an error?
-                try:
-                    err= json.loads(e.read())
-                except ValueError:
-                    pass
-                else:
-                    err= err.get('error',None)
-
-            raise IOError('{0} \n Druid Error: {1} \n Query is: {2}'.format(
-                e, err,json.dumps(self.query_dict, indent=4)))
+    def _post(self, query, build=0.0):
+        raise NotImplementedError('Subclasses must implement _post')
+
+    def _run(self, query_type, valid_parts, args):
+        # builds the query and posts it, passing on how long building it took
+        start = time.time()
+        query = self._prepare_query(query_type, valid_parts, args)
+        return self._post(query, time.time() - start)
+
+    def _started(self, query, build):
+        # the metrics of a query about to be fetched, once the listeners know about it
+        for listener in self.listeners:
+            listener.query_started(query)
+        return QueryMetrics(query, build)
+
+    def _finished(self, metrics, started, error=None):
+        metrics.error = error
+        metrics.total = metrics.build + time.time() - started
+        for listener in self.listeners:
+            listener.query_finished(metrics)
+
+    def _cache_hit(self, query, cached, metrics):
+        # a result from the cache, carrying the metrics of the query that found it there
+        metrics.cached = True
+        metrics.rows = count_rows(query['queryType'], cached.result)
+        return QueryResult(query, cached.result_json, cached.result, cached.elapsed,
+                           cached.compressed_bytes, cached.retries, metrics)
+
+    def _stitch_cached(self, split, build):
+        # the result of a query whose buckets the interval cache holds all of
+        start = time.time()
+        metrics = self._started(split.original, build)
+        result = self._cache_hit(split.original, split.stitch(), metrics)
+        self._finished(metrics, start)
+        return result
+
+    def _parse_result(self, data, query_type, metrics):
+        start = time.time()
+        result = self._parse(data, query_type)
+        metrics.parse = time.time() - start
+        metrics.rows = count_rows(query_type, result)
+        return result
+
+    def _query_url(self, url=None):
+        url = url if url is not None else self.url
+        if url.endswith('/'):
+            return url + self.endpoint
+        return url + '/' + self.endpoint
+
+    def _deadline(self, query):
+        # when the query must be answered by: its own context.timeout (0 meaning none, as in
+        # Druid), else the client's timeout
+        context = query.get('context') or {}
+        if 'timeout' in context:
+            budget = context['timeout'] / 1000.0 if context['timeout'] else None
         else:
-            self.result = self.__parse()
-            return self.result
-
-    def __parse(self):
-        if self.result_json:
-            res = json.loads(self.result_json)
-            return res
+            budget = self.timeout
+        return time.time() + budget if budget is not None else None
+
+    def _with_remaining(self, query, deadline):
+        # returns a copy of the query whose context.timeout is what is left of the deadline, so
+        # that Druid gives up when the client does, and the seconds left
+        remaining = deadline - time.time()
+        if remaining < 0.001:
+            remaining = 0.001
+        query = query.copy()
+        query['context'] = dict(query.get('context') or {}, timeout=int(remaining * 1000) or 1)
+        return query, remaining
+
+    def _retry_delay(self, error, attempts, started, deadline):
+        # seconds to wait before retrying a failed query, or None to give up on it
+        delay = None
+        if self.retry_policy is not None:
+            delay = self.retry_policy.retry_delay(error, attempts, started, deadline)
+        if delay is None and isinstance(error, QueryError):
+            error.retries = attempts - 1
+        return delay
+
+    def _cancel_url(self, query_id, url=None):
+        return self._query_url(url).rstrip('/') + '/' + quote(query_id, safe='')
+
+    def _encode(self, query):
+        if isinstance(query, BoundQuery):
+            return query.encode(self.codec)
+        return self.codec.dumps(query)
+
+    def _request_body(self, query, accept=None):
+        # the encoded query and the headers to send it with, asking for the codec's format
+        # unless another is given
+        body = self._encode(query)
+        headers = {'Content-Type': 'application/json',
+                   'Accept': accept or getattr(self.codec, 'accept', 'application/json')}
+        if self.compression:
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
+        if self.compress_request_size is not None and len(body) >= self.compress_request_size:
+            body = gzip_compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        return body, headers
+
+    def _parse(self, data, query_type):
+        if data:
+            return self.codec.loads(data)
         else:
-            raise IOError('{Error parsing result: {0} for {1} query'.format(
-                self.result_json, self.query_type))
+            raise IOError('Error parsing result: {0} for {1} query'.format(
+                data, query_type))
 
-    # --------- Export implementations ---------
-
-    def export_tsv(self, dest_path):
-        """
-        Export the current query result to a tsv file.
-
-        :param str dest_path: file to write query results to
-        :raise NotImplementedError:
-
-        Example
-
-        .. code-block:: python
-            :linenos:
-
-                >>> top = query.topn(
-                        datasource='twitterstream',
-                        granularity='all',
-                        intervals='2013-10-04/pt1h',
-                        aggregations={"count": doublesum("count")},
-                        dimension='user_name',
-                        filter = Dimension('user_lang') == 'en',
-                        metric='count',
-                        threshold=2
-                    )
-
-                >>> query.export_tsv('top.tsv')
-                >>> !cat top.tsv
-                >>> count	user_name	timestamp
-                    7.0	user_1	2013-10-04T00:00:00.000Z
-                    6.0	user_2	2013-10-04T00:00:00.000Z
-        """
-        if six.PY3:
-            f = open(dest_path, 'w', newline='', encoding='utf-8')
-        else:
-            f = open(dest_path, 'wb')
-        w = UnicodeWriter(f)
-
-        if self.query_type == "timeseries":
-            header = list(self.result[0]['result'].keys())
-            header.append('timestamp')
-        elif self.query_type == 'topN':
-            header = list(self.result[0]['result'][0].keys())
-            header.append('timestamp')
-        elif self.query_type == "groupBy":
-            header = list(self.result[0]['event'].keys())
-            header.append('timestamp')
-            header.append('version')
+    def _query_error(self, query, status, reason, body):
+        # has Druid returned an error? It does with 500, but also with, e.g., 400 and 429
+        err = None
+        try:
+            err = self.codec.loads(body)
+        except ValueError:
+            pass
+        if isinstance(err, dict):
+            err = err.get('error', None)
         else:
-            raise NotImplementedError('TSV export not implemented for query type: {0}'.format(self.query_type))
-
-        w.writerow(header)
-
-        if self.result:
-            if self.query_type == "topN" or self.query_type == "timeseries":
-                for item in self.result:
-                    timestamp = item['timestamp']
-                    result = item['result']
-                    if type(result) is list:  # topN
-                        for line in result:
-                            w.writerow(list(line.values()) + [timestamp])
-                    else:  # timeseries
-                        w.writerow(list(result.values()) + [timestamp])
-            elif self.query_type == "groupBy":
-                for item in self.result:
-                    timestamp = item['timestamp']
-                    version = item['version']
-                    w.writerow(
-                        list(item['event'].values()) + [timestamp] + [version])
-
-        f.close()
-
-    def export_pandas(self):
-        """
-        Export the current query result to a Pandas DataFrame object.
-
-        :return: The DataFrame representing the query result
-        :rtype: DataFrame
-        :raise NotImplementedError:
-
-        Example
-
-        .. code-block:: python
-            :linenos:
-
-                >>> top = query.topn(
-                        datasource='twitterstream',
-                        granularity='all',
-                        intervals='2013-10-04/pt1h',
-                        aggregations={"count": doublesum("count")},
-                        dimension='user_name',
-                        filter = Dimension('user_lang') == 'en',
-                        metric='count',
-                        threshold=2
-                    )
-
-                >>> df = query.export_pandas()
-                >>> print df
-                >>>    count                 timestamp      user_name
-                    0      7  2013-10-04T00:00:00.000Z         user_1
-                    1      6  2013-10-04T00:00:00.000Z         user_2
-        """
-        if self.result:
-            if self.query_type == "timeseries":
-                nres = [list(v['result'].items()) + [('timestamp', v['timestamp'])]
-                        for v in self.result]
-                nres = [dict(v) for v in nres]
-            elif self.query_type == "topN":
-                nres = []
-                for item in self.result:
-                    timestamp = item['timestamp']
-                    results = item['result']
-                    tres = [dict(list(res.items()) + [('timestamp', timestamp)])
-                            for res in results]
-                    nres += tres
-            elif self.query_type == "groupBy":
-                nres = [list(v['event'].items()) + [('timestamp', v['timestamp'])]
-                        for v in self.result]
-                nres = [dict(v) for v in nres]
-            else:
-                raise NotImplementedError('Pandas export not implemented for query type: {0}'.format(self.query_type))
+            err = None
 
-            df = pandas.DataFrame(nres)
-            return df
+        return QueryError('HTTP Error {0}: {1} \n Druid Error: {2} \n Query is: {3}'.format(
+            status, reason, err, json.dumps(query, indent=4)), status, reason, err, query)
 
     # --------- Query implementations ---------
 
-    def validate_query(self, valid_parts, args):
+    def validate_query(self, valid_parts, args, query_type=None):
         """
         Validate the query parts so only allowed objects are sent.
 
@@ -283,19 +232,25 @@ class PyDruid:
 
         :param list valid_parts: a list of valid object names
         :param dict args: the dict of args to be sent
+        :param str query_type: the query type being validated. Defaults to the most recently run query type
         :raise ValueError: if an invalid object is given
         """
+        if query_type is None:
+            query_type = self.query_type
         valid_parts = valid_parts[:] + ['context']
         for key, val in six.iteritems(args):
             if key not in valid_parts:
                 raise ValueError(
                     'Query component: {0} is not valid for query type: {1}.'
-                    .format(key, self.query_type) +
+                    .format(key, query_type) +
                     'The list of valid components is: \n {0}'
                     .format(valid_parts))
 
     def build_query(self, args):
-        query_dict = {'queryType': self.query_type}
+        self.query_dict = self._build_query(self.query_type, args)
+
+    def _build_query(self, query_type, args):
+        query_dict = {'queryType': query_type}
 
         for key, val in six.iteritems(args):
             if key == 'aggregations':
@@ -309,13 +264,37 @@ class PyDruid:
             elif key == 'limit_spec':
                 query_dict['limitSpec'] = val
             elif key == "filter":
-                query_dict[key] = Filter.build_filter(val)
+                query_dict[key] = optimize_filter(Filter.build_filter(val))
             elif key == "having":
                 query_dict[key] = Having.build_having(val)
             else:
                 query_dict[key] = val
 
-        self.query_dict = query_dict
+        return query_dict
+
+    def _prepare_query(self, query_type, valid_parts, args):
+        self.validate_query(valid_parts, args, query_type)
+        return self._build_query(query_type, args)
+
+    def prepare(self, query_type, **kwargs):
+        """
+        Validate, build and encode a query once, to run it many times with different values for
+        its pydruid.template.Param placeholders.
+
+        :param str query_type: Name of the query method, e.g., 'topn'
+        :param kwargs: The arguments the query method would be called with, with placeholders
+            for the values to bind on each run
+        :return: The prepared query
+        :rtype: pydruid.template.QueryTemplate
+        """
+        return QueryTemplate(self, query_type, kwargs)
+
+    def _query_from_spec(self, spec):
+        # builds the query a (query method name, kwargs) pair describes, without sending it
+        method, kwargs = spec
+        if method.startswith('_') or not hasattr(_QueryBuilder, method):
+            raise ValueError('Unknown query type: {0}'.format(method))
+        return getattr(_QueryBuilder(self.url, self.endpoint), method)(**kwargs)
 
     def topn(self, **kwargs):
         """
@@ -335,7 +314,7 @@ class PyDruid:
         :param int threshold: How many of the top items to return
 
         :return: The query result
-        :rtype: list[dict]
+        :rtype: pydruid.query.QueryResult
 
         Optional key/value pairs:
 
@@ -362,15 +341,12 @@ class PyDruid:
                 >>> print top
                 >>> [{'timestamp': '2013-06-14T00:00:00.000Z', 'result': [{'count': 22.0, 'user': "cool_user"}}]}]
         """
-        self.query_type = 'topN'
         valid_parts = [
             'datasource', 'granularity', 'filter', 'aggregations',
             'post_aggregations', 'intervals', 'dimension', 'threshold',
             'metric'
         ]
-        self.validate_query(valid_parts, kwargs)
-        self.build_query(kwargs)
-        return self.__post(self.query_dict)
+        return self._run('topN', valid_parts, kwargs)
 
     def timeseries(self, **kwargs):
         """
@@ -385,7 +361,7 @@ class PyDruid:
         :param dict aggregations: A map from aggregator name to one of the pydruid.utils.aggregators e.g., doublesum
 
         :return: The query result
-        :rtype: list[dict]
+        :rtype: pydruid.query.QueryResult
 
         Optional key/value pairs:
 
@@ -409,14 +385,11 @@ class PyDruid:
                 >>> print counts
                 >>> [{'timestamp': '2013-06-14T00:00:00.000Z', 'result': {'count': 9619.0, 'rows': 8007, 'percent': 120.13238416385663}}]
         """
-        self.query_type = 'timeseries'
         valid_parts = [
             'datasource', 'granularity', 'filter', 'aggregations',
             'post_aggregations', 'intervals'
         ]
-        self.validate_query(valid_parts, kwargs)
-        self.build_query(kwargs)
-        return self.__post(self.query_dict)
+        return self._run('timeseries', valid_parts, kwargs)
 
     def groupby(self, **kwargs):
         """
@@ -432,7 +405,7 @@ class PyDruid:
         :param list dimensions: The dimensions to group by
 
         :return: The query result
-        :rtype: list[dict]
+        :rtype: pydruid.query.QueryResult
 
         Optional key/value pairs:
 
@@ -467,15 +440,12 @@ class PyDruid:
                 >>> {'timestamp': '2013-10-04T00:00:00.000Z', 'version': 'v1', 'event': {'count': 1.0, 'user_name': 'user_2', 'reply_to_name': 'user_3'}}
         """
 
-        self.query_type = 'groupBy'
         valid_parts = [
             'datasource', 'granularity', 'filter', 'aggregations',
             'having', 'post_aggregations', 'intervals', 'dimensions',
             'limit_spec',
         ]
-        self.validate_query(valid_parts, kwargs)
-        self.build_query(kwargs)
-        return self.__post(self.query_dict)
+        return self._run('groupBy', valid_parts, kwargs)
 
     def segment_metadata(self, **kwargs):
         """
@@ -499,7 +469,7 @@ class PyDruid:
         :param dict context: A dict of query context options
 
         :return: The query result
-        :rtype: list[dict]
+        :rtype: pydruid.query.QueryResult
 
         Example:
 
@@ -513,11 +483,8 @@ class PyDruid:
                 >>> {'errorMessage': None, 'cardinality': None, 'type': 'FLOAT', 'size': 30908008}
 
         """
-        self.query_type = 'segmentMetadata'
         valid_parts = ['datasource', 'intervals']
-        self.validate_query(valid_parts, kwargs)
-        self.build_query(kwargs)
-        return self.__post(self.query_dict)
+        return self._run('segmentMetadata', valid_parts, kwargs)
 
     def time_boundary(self, **kwargs):
         """
@@ -532,7 +499,7 @@ class PyDruid:
         :param dict context: A dict of query context options
 
         :return: The query result
-        :rtype: list[dict]
+        :rtype: pydruid.query.QueryResult
 
         Example:
 
@@ -543,11 +510,8 @@ class PyDruid:
                 >>> print bound
                 >>> [{'timestamp': '2011-09-14T15:00:00.000Z', 'result': {'minTime': '2011-09-14T15:00:00.000Z', 'maxTime': '2014-03-04T23:44:00.000Z'}}]
         """
-        self.query_type = 'timeBoundary'
         valid_parts = ['datasource']
-        self.validate_query(valid_parts, kwargs)
-        self.build_query(kwargs)
-        return self.__post(self.query_dict)
+        return self._run('timeBoundary', valid_parts, kwargs)
 
     def select(self, **kwargs):
         """
@@ -569,7 +533,7 @@ class PyDruid:
         :param dict context: A dict of query context options
 
         :return: The query result
-        :rtype: list[dict]
+        :rtype: pydruid.query.QueryResult
 
         Example:
 
@@ -586,11 +550,701 @@ class PyDruid:
                 >>> print raw_data
                 >>> [{'timestamp': '2013-06-14T00:00:00.000Z', 'result': {'pagingIdentifiers': {'twitterstream_2013-06-14T00:00:00.000Z_2013-06-15T00:00:00.000Z_2013-06-15T08:00:00.000Z_v1': 1, 'events': [{'segmentId': 'twitterstream_2013-06-14T00:00:00.000Z_2013-06-15T00:00:00.000Z_2013-06-15T08:00:00.000Z_v1', 'offset': 0, 'event': {'timestamp': '2013-06-14T00:00:00.000Z', 'dim': 'value'}}]}}]
         """
-        self.query_type = 'select'
         valid_parts = [
             'datasource', 'granularity', 'filter', 'dimensions', 'metrics',
             'paging_spec', 'intervals'
         ]
-        self.validate_query(valid_parts, kwargs)
-        self.build_query(kwargs)
-        return self.__post(self.query_dict)
+        return self._run('select', valid_parts, kwargs)
+
+
+class _QueryBuilder(BaseDruidClient):
+    def _post(self, query, build=0.0):
+        return query
+
+
+class _Prefetch:
+    # runs fn(arg) on a background thread, or only once get() is called if not in the background
+    def __init__(self, fn, arg, background=True):
+        self.fn = fn
+        self.arg = arg
+        self.value = None
+        self.error = None
+        self.thread = None
+        if background:
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        try:
+            self.value = self.fn(self.arg)
+        except Exception as e:
+            self.error = e
+
+    def get(self):
+        if self.thread is None:
+            return self.fn(self.arg)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class _RowStream:
+    # the rows of a streamed response. Closing it, or dropping it, closes the response and calls
+    # finish, with what the iteration failed with if it did, even if iteration never started,
+    # which a generator's finally can't do
+    def __init__(self, rows, res, finish):
+        self._rows = rows
+        self._res = res
+        self._finish = finish
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._rows)
+        except StopIteration:
+            self.close()
+            raise
+        except BaseException as e:
+            self._close(e)
+            raise
+
+    next = __next__
+
+    def close(self):
+        self._close()
+
+    def _close(self, error=None):
+        if self._res is None:
+            return
+        res, self._res = self._res, None
+        try:
+            self._rows.close()
+        finally:
+            res.close()
+            self._finish(error)
+
+    def __del__(self):
+        self.close()
+
+
+def _start_thread(fn, *args):
+    thread = threading.Thread(target=fn, args=args)
+    thread.daemon = True
+    thread.start()
+
+
+class PyDruid(BaseDruidClient):
+    """
+    PyDruid contains the functions for creating and executing Druid queries, as well as
+    for exporting query results into TSV files or pandas.DataFrame objects for subsequent analysis.
+
+    :param url: URL of Broker node in the Druid cluster, or a list of URLs of Broker nodes to
+        spread queries across, or a pydruid.balancer.Balancer of them
+    :param str endpoint: Endpoint that Broker listens for queries on
+    :param pydruid.pool.ConnectionPool pool: Pool of keep-alive connections to send queries over.
+        Defaults to a new pool owned by this client; pass one explicitly to tune it or to share it.
+    :param pydruid.cache.QueryCache cache: Cache to answer repeated queries from. Defaults to no caching
+    :param pydruid.cache.IntervalCache interval_cache: Cache to answer the already seen time buckets
+        of timeseries and groupBy queries from. Defaults to no caching
+    :param pydruid.codec.JSONCodec codec: Codec to encode queries and decode results with.
+        Defaults to the fastest one installed, see pydruid.codec.default_codec
+    :param bool compression: Whether to ask the Broker for gzip or deflate compressed responses.
+        Compressed responses are decompressed as they are read.
+    :param int compress_request_size: Gzip request bodies of at least this many bytes, e.g., for
+        queries with huge filters. Defaults to never compressing them.
+    :param pydruid.hedging.Hedging hedging: Send a duplicate of queries that are slower than
+        usual, and use whichever answer comes first. Defaults to no hedging
+    :param float timeout: Seconds each query may take, including any retries, unless its context
+        sets a timeout of its own (in milliseconds, as Druid expects). Defaults to no timeout
+    :param pydruid.retry.RetryPolicy retry_policy: When to send failed queries again. Defaults to
+        never
+    :param pydruid.admission.AdmissionControl admission: Limits on the rate and concurrency of
+        queries, which wait on the client until they may be sent. Defaults to no limits
+    :param list listeners: pydruid.instrumentation.QueryListener instances to notify of every
+        query, with where its time went
+
+    Each query method returns a pydruid.query.QueryResult holding the query and its result. For
+    backwards compatibility the client also records the most recent query on itself; these
+    attributes are shared by all callers, so multi-threaded code should use the returned
+    QueryResult instead.
+
+    :ivar str result_json: JSON object representing a query result. Initial value: None
+    :ivar list result: Query result parsed into a list of dicts. Initial value: None
+    :ivar str query_type: Name of most recently run query, e.g., topN. Initial value: None
+    :ivar dict query_dict: JSON object representing the query. Initial value: None
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> from pydruid.client import *
+
+            >>> query = PyDruid('http://localhost:8083', 'druid/v2/')
+
+            >>> top = query.topn(
+                    datasource='twitterstream',
+                    granularity='all',
+                    intervals='2013-10-04/pt1h',
+                    aggregations={"count": doublesum("count")},
+                    dimension='user_name',
+                    filter = Dimension('user_lang') == 'en',
+                    metric='count',
+                    threshold=2
+                )
+
+            >>> print json.dumps(query.query_dict, indent=2)
+            >>> {
+                  "metric": "count",
+                  "aggregations": [
+                    {
+                      "type": "doubleSum",
+                      "fieldName": "count",
+                      "name": "count"
+                    }
+                  ],
+                  "dimension": "user_name",
+                  "filter": {
+                    "type": "selector",
+                    "dimension": "user_lang",
+                    "value": "en"
+                  },
+                  "intervals": "2013-10-04/pt1h",
+                  "dataSource": "twitterstream",
+                  "granularity": "all",
+                  "threshold": 2,
+                  "queryType": "topN"
+                }
+
+            >>> print top
+            >>> [{'timestamp': '2013-10-04T00:00:00.000Z',
+                'result': [{'count': 7.0, 'user_name': 'user_1'}, {'count': 6.0, 'user_name': 'user_2'}]}]
+
+            >>> df = top.export_pandas()
+            >>> print df
+            >>>    count                 timestamp      user_name
+                0      7  2013-10-04T00:00:00.000Z         user_1
+                1      6  2013-10-04T00:00:00.000Z         user_2
+    """
+
+    def __init__(self, url, endpoint, pool=None, cache=None, interval_cache=None, codec=None,
+                 compression=True, compress_request_size=None, hedging=None, timeout=None,
+                 retry_policy=None, admission=None, listeners=None):
+        BaseDruidClient.__init__(self, url, endpoint, cache, interval_cache, codec, compression,
+                                 compress_request_size, hedging, timeout, retry_policy, admission,
+                                 listeners)
+        self.pool = pool if pool is not None else ConnectionPool()
+
+    def _post(self, query, build=0.0):
+        self.query_type = query['queryType']
+        self.query_dict = query
+        result = self._execute(query, build)
+        self.result_json = result.result_json
+        self.result = result.result
+        return result
+
+    def _execute(self, query, build=0.0):
+        # like _post, but leaves the client's attributes alone so it is safe to call from many threads
+        if self.interval_cache is not None:
+            split = self.interval_cache.split(query)
+            if split is not None:
+                if split.query is None:
+                    return self._stitch_cached(split, build)
+                return split.stitch(self._fetch(split.query, build))
+        return self._fetch(query, build)
+
+    def _fetch(self, query, build=0.0):
+        start = time.time()
+        metrics = self._started(query, build)
+        try:
+            result = self.cache.get(query) if self.cache is not None else None
+            if result is not None:
+                result = self._cache_hit(query, result, metrics)
+            else:
+                data, compressed_bytes, retries = self._request(query, metrics)
+                result = QueryResult(query, data,
+                                     self._parse_result(data, query['queryType'], metrics),
+                                     time.time() - start, compressed_bytes, retries, metrics)
+                if self.cache is not None:
+                    self.cache.put(query, result)
+        except Exception as e:
+            self._finished(metrics, start, e)
+            raise
+        self._finished(metrics, start)
+        return result
+
+    def _request(self, query, metrics=None):
+        # returns the response body, its size on the wire and the number of retries it took
+        deadline = self._deadline(query)
+        if self.admission is not None:
+            query = self.admission.prioritize(query)
+        started = time.time()
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                data, compressed_bytes = self._attempt(query, deadline, metrics)
+            except Exception as e:
+                delay = self._retry_delay(e, attempts, started, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+            else:
+                if metrics is not None:
+                    metrics.retries = attempts - 1
+                return data, compressed_bytes, attempts - 1
+
+    def _attempt(self, query, deadline, metrics=None):
+        ticket = None
+        if self.admission is not None:
+            ticket = self.admission.acquire(query, deadline)
+        try:
+            if self.hedging is not None and self.hedging.applies(query):
+                return self._hedged_request(query, deadline, metrics)
+            return self._read_query(query, deadline=deadline, metrics=metrics)
+        finally:
+            self._release(ticket)
+
+    def _read_query(self, query, tried=None, deadline=None, metrics=None):
+        # sends the query and reads its whole response, cancelling the query if the deadline
+        # passes first
+        if deadline is None:
+            return self._read(self._open(query, tried=tried, metrics=metrics), metrics)
+        query, query_id = with_query_id(query)
+        tried = tried if tried is not None else []
+        try:
+            return self._read(self._open(query, tried=tried, deadline=deadline, metrics=metrics),
+                              metrics)
+        except socket.timeout:
+            raise self._expired(query, query_id, tried)
+
+    def _expired(self, query, query_id, tried):
+        _start_thread(self._cancel, query_id, tried[-1].url if tried else None)
+        return QueryTimeout(query, query_id)
+
+    def _read(self, res, metrics=None):
+        start = time.time()
+        try:
+            data = res.read()
+        finally:
+            res.close()
+        compressed_bytes = getattr(res, 'compressed_bytes', len(data))
+        if metrics is not None:
+            metrics.download = time.time() - start
+            metrics.response_bytes = compressed_bytes
+            metrics.uncompressed_bytes = len(data)
+        return data, compressed_bytes
+
+    def _hedged_request(self, query, deadline=None, metrics=None):
+        # sends the query from a background thread, and a duplicate of it if no answer came
+        # within the hedging delay; the first answer wins and the other request is cancelled
+        hedging = self.hedging
+        start = time.time()
+        primary, query_id = with_query_id(query)
+        hedge, hedge_id = with_query_id(query, query_id + '-hedge')
+        answers = queue.Queue()
+
+        def run(leg, leg_id, tried):
+            # each request records its own metrics, as both may be running at once
+            leg_metrics = QueryMetrics(leg)
+            try:
+                response = self._read_query(leg, tried, deadline, leg_metrics)
+            except Exception as e:
+                answers.put((leg_id, None, None, e))
+            else:
+                answers.put((leg_id, response, leg_metrics, None))
+
+        # the nodes each request was sent to, the last one being where it is running
+        legs = {query_id: []}
+        _start_thread(run, primary, query_id, legs[query_id])
+        errors = {}
+        timeout = hedging.delay(query['queryType'])
+        while len(errors) < len(legs):
+            try:
+                leg_id, response, leg_metrics, error = answers.get(timeout=timeout)
+            except queue.Empty:
+                timeout = None
+                if self.balancer is None or len(legs[query_id]) < len(self.balancer.nodes):
+                    hedging.issue()
+                    legs[hedge_id] = list(legs[query_id])
+                    _start_thread(run, hedge, hedge_id, legs[hedge_id])
+                continue
+            if error is not None:
+                errors[leg_id] = error
+                continue
+            hedging.record(query['queryType'], time.time() - start, won=(leg_id == hedge_id))
+            if metrics is not None:
+                metrics._record_exchange(leg_metrics)
+            for other_id, tried in legs.items():
+                if other_id != leg_id and other_id not in errors:
+                    _start_thread(self._cancel, other_id, tried[-1].url if tried else None)
+            return response
+        raise errors.get(query_id) or errors[hedge_id]
+
+    def _cancel(self, query_id, url=None):
+        # asks the Broker to stop running a query; best effort, as it may have finished already
+        try:
+            self.pool.urlopen('DELETE', self._cancel_url(query_id, url)).close()
+        except (IOError, OSError):
+            pass
+
+    def _open(self, query, accept=None, tried=None, deadline=None, metrics=None):
+        # sends the query and returns the response once its status is known to be good, wrapped
+        # to decompress its body while it is read if it is compressed. With several Brokers,
+        # tried collects the nodes the query is sent to. Past the deadline, raises socket.timeout
+        if self.balancer is None:
+            return self._send(self._query_url(), query, accept, deadline, metrics)
+        tried = tried if tried is not None else []
+        while True:
+            if deadline is not None and time.time() >= deadline:
+                raise socket.timeout('Query deadline passed')
+            node = self.balancer.acquire(tried)
+            if node is None:
+                raise IOError('No Broker left to send the query to')
+            tried.append(node)
+            start = time.time()
+            try:
+                res = self._send(self._query_url(node.url), query, accept, deadline, metrics)
+            except Exception as e:
+                if not self.balancer.should_retry(self.balancer.release(node, error=e), len(tried)):
+                    raise
+            else:
+                self.balancer.release(node, time.time() - start)
+                return res
+
+    def _send(self, url, query, accept=None, deadline=None, metrics=None):
+        timeout = None
+        if deadline is not None:
+            query, timeout = self._with_remaining(query, deadline)
+        start = time.time()
+        body, headers = self._request_body(query, accept)
+        serialized = time.time()
+        try:
+            res = self.pool.urlopen('POST', url, body, headers, timeout=timeout)
+        except socket.timeout:
+            if deadline is None:
+                raise
+            # the socket timeout is what was left of the deadline: the Broker is merely slow
+            raise QueryTimeout(query, query['context'].get('queryId'))
+        if metrics is not None:
+            metrics.broker = url
+            metrics.serialize = serialized - start
+            metrics.request_bytes = len(body)
+            metrics.connect = res.connect_time
+            metrics.ttfb = res.ttfb
+            metrics._record_headers(res.getheader)
+        status, reason = res.status, res.reason
+        encoding = (res.getheader('Content-Encoding') or '').strip().lower()
+        if encoding in ENCODINGS:
+            res = DecompressingReader(res, encoding)
+        if status >= 400:
+            try:
+                data = res.read()
+            finally:
+                res.close()
+            raise self._query_error(query, status, reason, data)
+        return res
+
+    def stream(self, query_type, **kwargs):
+        """
+        Run a query and iterate over its result rows while they are still arriving, parsing the
+        response incrementally instead of reading it whole. Memory use stays bounded however large
+        the result is, and the first rows are available before the last byte arrives.
+
+        The query is sent, and any Druid error raised, when stream is called. Rows are flattened
+        the way export_pandas flattens them: timeseries, topN and groupBy rows are dicts of the
+        result's values plus its timestamp, and select rows are the selected events. Other query
+        types yield the elements of the result as they are. Stopping the iteration early closes the
+        connection. The client's result attributes are left untouched. Listeners are told the query
+        finished once the rows run out, reading them fails or the iterator is closed; reading and
+        parsing the rows is timed together, as download.
+
+        The query's deadline applies to sending it and to each read of the response; if it passes,
+        the query is cancelled and QueryTimeout raised.
+
+        :param str query_type: Name of the query method to run, e.g., 'select' or 'groupby'
+        :param kwargs: The arguments that query method takes
+        :return: An iterator of result rows; close it to stop early
+        :rtype: iterator[dict]
+
+        Example
+
+        .. code-block:: python
+            :linenos:
+
+                >>> rows = query.stream(
+                        'select',
+                        datasource='twitterstream',
+                        granularity='all',
+                        intervals='2013-06-14/pt1h',
+                        paging_spec={'pagingIdentifiers': {}, 'threshold': 100000}
+                    )
+                >>> for row in rows:
+                ...     print row
+                >>> {'timestamp': '2013-06-14T00:00:00.000Z', 'dim': 'value'}
+                >>> ...
+        """
+        start = time.time()
+        query = self._query_from_spec((query_type, kwargs))
+        deadline = self._deadline(query)
+        query_id = None
+        if deadline is not None:
+            query, query_id = with_query_id(query)
+        build = time.time() - start
+        start = time.time()
+        metrics = self._started(query, build)
+        ticket = None
+        tried = []
+        try:
+            if self.admission is not None:
+                query = self.admission.prioritize(query)
+                ticket = self.admission.acquire(query, deadline)
+            try:
+                # the incremental parser only reads JSON, whatever the codec
+                res = self._open(query, 'application/json', tried, deadline, metrics)
+            except socket.timeout:
+                if query_id is None:
+                    raise
+                raise self._expired(query, query_id, tried)
+        except Exception as e:
+            self._release(ticket)
+            self._finished(metrics, start, e)
+            raise
+        opened = time.time()
+
+        def finish(error):
+            # reading the rows is both downloading and parsing them, all timed as download
+            metrics.download = time.time() - opened
+            self._release(ticket)
+            self._finished(metrics, start, error)
+
+        return _RowStream(self._stream_rows(query, res, query_id, tried, metrics), res, finish)
+
+    def _stream_rows(self, query, res, query_id=None, tried=None, metrics=None):
+        query_type = query['queryType']
+        try:
+            for context, item in iter_items(res, ROW_PATHS.get(query_type, ('*',))):
+                if metrics is not None:
+                    metrics.rows += 1
+                yield flatten_row(query_type, context, item)
+        except socket.timeout:
+            if query_id is None:
+                raise
+            raise self._expired(query, query_id, tried)
+
+    def _release(self, ticket):
+        if ticket is not None:
+            self.admission.release(ticket)
+
+    def export_stream(self, dest_path, query_type, columns=None, dialect='excel-tab',
+                      compression='infer', **kwargs):
+        """
+        Run a query and write its result rows to a TSV (or CSV) file while they are arriving,
+        without ever holding the whole result in memory. Rows are flattened as by stream.
+
+        :param str dest_path: File to write the rows to
+        :param str query_type: Name of the query method to run, e.g., 'select' or 'groupby'
+        :param list columns: Columns to write, in order. Defaults to the keys of the first row
+        :param str dialect: csv dialect, e.g., excel-tab (TSV) or excel (CSV)
+        :param str compression: gzip to compress the file, None not to, or infer to compress it
+            if dest_path ends with .gz
+        :param kwargs: The arguments that query method takes
+        :return: The number of rows written
+        :rtype: int
+
+        Example
+
+        .. code-block:: python
+            :linenos:
+
+                >>> query.export_stream(
+                        'events.tsv.gz',
+                        'select',
+                        columns=['timestamp', 'user_name', 'count'],
+                        datasource='twitterstream',
+                        granularity='all',
+                        intervals='2013-06-14/p1d',
+                        paging_spec={'pagingIdentifiers': {}, 'threshold': 10000000}
+                    )
+                >>> 10000000
+        """
+        rows = self.stream(query_type, **kwargs)
+        try:
+            return write_rows(rows, dest_path, columns, dialect, compression)
+        finally:
+            rows.close()
+
+    def select_iter(self, threshold=None, max_rows=None, prefetch=True, **kwargs):
+        """
+        Run a select query page by page, driving its pagingSpec automatically, and iterate over
+        the selected events of all pages.
+
+        While the events of one page are being consumed, the next page is already being fetched
+        in the background, so the Broker works on page n+1 while the caller processes page n.
+        Iteration ends when a page comes back empty or max_rows events have been returned.
+
+        The next page's pagingIdentifiers are the returned ones advanced by one, as older Druid
+        versions expect. If paging_spec sets fromNext to True, they are passed back unchanged
+        instead. The client's result attributes are left untouched.
+
+        :param int threshold: Number of events per page. Defaults to the threshold of paging_spec,
+            or 1000 without one
+        :param int max_rows: Stop after this many events. Defaults to no limit
+        :param bool prefetch: Whether to fetch the next page while the current one is consumed
+        :param kwargs: The arguments select takes. paging_spec is optional and only needed to
+            resume from given pagingIdentifiers
+        :return: A generator of selected events
+        :rtype: generator[dict]
+
+        Example
+
+        .. code-block:: python
+            :linenos:
+
+                >>> events = query.select_iter(
+                        datasource='twitterstream',
+                        granularity='all',
+                        intervals='2013-06-14/p1d',
+                        dimensions=['user_name'],
+                        threshold=10000
+                    )
+                >>> for event in events:
+                ...     print event
+                >>> {'timestamp': '2013-06-14T00:00:00.000Z', 'user_name': 'user_1', 'count': 1.0}
+                >>> ...
+        """
+        paging_spec = dict(kwargs.pop('paging_spec', None) or {})
+        if threshold is None:
+            threshold = paging_spec.get('threshold', 1000)
+
+        def page_query(identifiers, rows):
+            page_threshold = threshold
+            if max_rows is not None and max_rows - rows < threshold:
+                page_threshold = max_rows - rows
+            spec = dict(paging_spec, pagingIdentifiers=identifiers, threshold=page_threshold)
+            return self._query_from_spec(('select', dict(kwargs, paging_spec=spec)))
+
+        # build the first page's query right away, so invalid queries raise here
+        query = page_query(paging_spec.get('pagingIdentifiers', {}), 0)
+        return self._iter_pages(query, page_query, max_rows, prefetch,
+                                paging_spec.get('fromNext', False))
+
+    def _iter_pages(self, query, page_query, max_rows, prefetch, from_next):
+        rows = 0
+        # identifiers accumulate across pages, so that segments missing from a page's
+        # pagingIdentifiers keep their position instead of being read again from the start
+        identifiers = dict(query['pagingSpec']['pagingIdentifiers'])
+        page = _Prefetch(self._execute, query, prefetch)
+        while page is not None:
+            result = page.get()
+            events = [event for bucket in result for event in bucket['result']['events']]
+            if not events:
+                return
+            if max_rows is not None:
+                events = events[:max_rows - rows]
+            rows += len(events)
+
+            page = None
+            if max_rows is None or rows < max_rows:
+                for bucket in result:
+                    for segment, offset in six.iteritems(bucket['result']['pagingIdentifiers']):
+                        identifiers[segment] = offset if from_next else offset + 1
+                page = _Prefetch(self._execute, page_query(dict(identifiers), rows), prefetch)
+
+            for event in events:
+                yield event['event']
+
+    def run_many(self, queries, max_concurrency=10):
+        """
+        Run many independent queries in parallel over a pool of threads, without waiting for each
+        one to finish before sending the next.
+
+        Results come back in the same order as the queries. A query that fails does not abort the
+        batch: its BatchResult carries the exception instead of a result. The client's result,
+        result_json, query_type and query_dict attributes are left untouched.
+
+        :param list queries: (query_type, kwargs) pairs, where query_type names a query method of
+            this client, e.g., 'topn', and kwargs are the arguments it would be called with
+        :param int max_concurrency: Maximum number of queries in flight at once
+        :return: One result per query, in input order
+        :rtype: list[pydruid.batch.BatchResult]
+
+        Example
+
+        .. code-block:: python
+            :linenos:
+
+                >>> results = query.run_many([
+                        ('topn', dict(datasource='twitterstream', granularity='all',
+                                      intervals=interval, aggregations={"count": doublesum("count")},
+                                      dimension='user_name', metric='count', threshold=10))
+                        for interval in ['2013-10-04/pt1h', '2013-10-04T01/pt1h', '2013-10-04T02/pt1h']
+                    ], max_concurrency=3)
+                >>> [(r.ok, round(r.elapsed, 3)) for r in results]
+                >>> [(True, 0.112), (True, 0.094), (True, 0.131)]
+                >>> print results[0].result
+                >>> [{'timestamp': '2013-10-04T00:00:00.000Z', 'result': [{'count': 7.0, 'user_name': 'user_1'}, ...]}]
+        """
+        return run_many(self, queries, max_concurrency)
+
+    # --------- Export implementations ---------
+
+    def export_tsv(self, dest_path):
+        """
+        Export the result of the most recent query to a tsv file. See QueryResult.export_tsv.
+
+        :param str dest_path: file to write query results to
+        :raise NotImplementedError:
+        """
+        self._last_result().export_tsv(dest_path)
+
+    def export_pandas(self, columnar=False):
+        """
+        Export the result of the most recent query to a Pandas DataFrame object. See
+        QueryResult.export_pandas.
+
+        :param bool columnar: Build the DataFrame from NumPy columns instead of row dicts
+        :return: The DataFrame representing the query result
+        :rtype: DataFrame
+        :raise NotImplementedError:
+        """
+        return self._last_result().export_pandas(columnar)
+
+    def export_numpy(self):
+        """
+        Export the result of the most recent query to NumPy arrays, one per column. See
+        QueryResult.export_numpy.
+
+        :rtype: dict[str, numpy.ndarray]
+        :raise NotImplementedError:
+        """
+        return self._last_result().export_numpy()
+
+    def export_arrow(self):
+        """
+        Export the result of the most recent query to an Apache Arrow table. See
+        QueryResult.export_arrow.
+
+        :rtype: pyarrow.Table
+        :raise NotImplementedError:
+        """
+        return self._last_result().export_arrow()
+
+    def export_parquet(self, dest_path, compression='snappy'):
+        """
+        Export the result of the most recent query to a Parquet file. See
+        QueryResult.export_parquet.
+
+        :param str dest_path: File to write the query result to
+        :param str compression: Parquet compression codec, e.g., snappy, gzip, zstd, or None
+        :raise NotImplementedError:
+        """
+        self._last_result().export_parquet(dest_path, compression)
+
+    def _last_result(self):
+        query = dict(self.query_dict or {}, queryType=self.query_type)
+        return QueryResult(query, self.result_json, self.result)
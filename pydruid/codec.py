@@ -0,0 +1,143 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from .utils import smile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JSONCodec:
+    """
+    Encodes queries to and decodes results from JSON with the standard json module (or
+    simplejson, if it is installed). Other codecs implement the same two methods, and name the
+    response format they decode in accept, which is sent as the Accept header.
+    """
+
+    name = 'json'
+    accept = 'application/json'
+
+    def dumps(self, obj):
+        """
+        :param obj: The object to encode, e.g., a query
+        :return: Its JSON, encoded in UTF-8
+        :rtype: bytes
+        """
+        return json.dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        """
+        :param data: JSON, as bytes in UTF-8 or as str
+        :return: The decoded object
+        """
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    A codec backed by orjson, which encodes to and decodes from bytes directly. NumPy arrays and
+    scalars in queries are serialized natively. Requires orjson.
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('orjson is required for OrjsonCodec')
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    """
+    A codec backed by ujson, which decodes bytes without an intermediate str. Requires ujson.
+    """
+
+    name = 'ujson'
+
+    def __init__(self):
+        if ujson is None:
+            raise ImportError('ujson is required for UjsonCodec')
+
+    def dumps(self, obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+class SmileCodec(JSONCodec):
+    """
+    A codec that asks the Broker for results in Jackson's Smile binary format, which is roughly
+    half the size of JSON on the wire. Queries are still sent as JSON, and responses that come
+    back as JSON anyway (e.g., from Brokers that don't support Smile) are decoded as such.
+
+    Smile is decoded in pure Python by pydruid.utils.smile, which is several times slower than
+    a C JSON decoder, so Smile pays off when bandwidth rather than CPU is the bottleneck. A faster
+    decoder, such as a C extension, can be plugged in with decode.
+
+    :param JSONCodec json_codec: Codec for queries and JSON responses. Defaults to default_codec()
+    :param decode: Function decoding a Smile document (bytes) into Python objects. Defaults to
+        pydruid.utils.smile.loads
+    """
+
+    name = 'smile'
+    accept = smile.CONTENT_TYPE
+
+    def __init__(self, json_codec=None, decode=None):
+        self.json_codec = json_codec if json_codec is not None else default_codec()
+        self.decode = decode if decode is not None else smile.loads
+
+    def dumps(self, obj):
+        return self.json_codec.dumps(obj)
+
+    def loads(self, data):
+        if data[:3] == smile.HEADER:
+            return self.decode(data)
+        return self.json_codec.loads(data)
+
+
+def default_codec():
+    """
+    The fastest codec available: OrjsonCodec if orjson is installed, else UjsonCodec if ujson
+    is, else JSONCodec.
+
+    :rtype: JSONCodec
+    """
+    if orjson is not None:
+        return OrjsonCodec()
+    if ujson is not None:
+        return UjsonCodec()
+    return JSONCodec()
@@ -0,0 +1,53 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+
+import socket
+
+
+class QueryError(IOError):
+    """
+    Raised when the Broker answers a query with an HTTP error.
+
+    :ivar int status: HTTP status code
+    :ivar str reason: HTTP reason phrase
+    :ivar str error: The error reported by Druid, if any
+    :ivar dict query: The failed query
+    :ivar int retries: Number of times the query was retried before giving up
+    """
+
+    retries = 0
+
+    def __init__(self, message, status, reason, error=None, query=None):
+        IOError.__init__(self, message)
+        self.status = status
+        self.reason = reason
+        self.error = error
+        self.query = query
+
+
+class QueryTimeout(QueryError, socket.timeout):
+    """
+    Raised when the deadline of a query passes before it is answered. The query is cancelled on
+    the Broker it was running on.
+
+    :ivar str query_id: The queryId the query was sent and cancelled with
+    """
+
+    def __init__(self, query, query_id):
+        message = 'Query {0} timed out'.format(query_id) if query_id else 'Query timed out'
+        QueryError.__init__(self, message, None, None, 'Query timeout', query)
+        self.query_id = query_id
@@ -0,0 +1,149 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+from __future__ import division
+
+import collections
+import math
+import threading
+import uuid
+
+
+class Hedging:
+    """
+    Settings and counters for hedged requests: when a query hasn't been answered within a delay,
+    a duplicate is sent (to another Broker, if the client has several), the first answer wins,
+    and the other one is cancelled through Druid's query cancellation endpoint.
+
+    The delay is a percentile of the latencies recently seen for the same query type, so that
+    only the slowest queries get hedged: at the 95th percentile, about 5% of queries cost a
+    second request. Until min_samples latencies are known, initial_delay is used.
+
+    :param float percentile: Latency percentile to wait for before hedging, between 0 and 100
+    :param int window: Number of recent latencies kept per query type
+    :param int min_samples: Number of latencies needed before the percentile is used
+    :param float initial_delay: Delay in seconds used until then
+    :param float min_delay: Lower bound of the delay in seconds
+    :param float max_delay: Upper bound of the delay in seconds, or None
+    :param query_types: Query types to hedge, e.g., ['topN']. Defaults to all of them
+    :ivar int issued: Number of hedge requests sent
+    :ivar int won: Number of hedge requests answered before the query they duplicate
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> hedging = Hedging(percentile=95, query_types=['topN'])
+            >>> client = PyDruid([broker1, broker2], 'druid/v2/', hedging=hedging)
+            >>> ...
+            >>> hedging.stats()
+            {'issued': 52, 'won': 31, 'delays': {'topN': 0.84}}
+    """
+
+    def __init__(self, percentile=95.0, window=1000, min_samples=20, initial_delay=1.0,
+                 min_delay=0.01, max_delay=None, query_types=None):
+        if not 0 < percentile <= 100:
+            raise ValueError('percentile must be in (0, 100]')
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.query_types = set(query_types) if query_types is not None else None
+        self.issued = 0
+        self.won = 0
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def applies(self, query):
+        """
+        :param dict query: A query
+        :return: Whether the query should be hedged
+        :rtype: bool
+        """
+        return self.query_types is None or query.get('queryType') in self.query_types
+
+    def delay(self, query_type):
+        """
+        :param str query_type: Type of a query, e.g., topN
+        :return: Seconds to wait for an answer before hedging a query of this type
+        :rtype: float
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get(query_type, ()))
+        if len(latencies) < self.min_samples:
+            delay = self.initial_delay
+        else:
+            index = int(math.ceil(self.percentile / 100 * len(latencies))) - 1
+            delay = latencies[max(index, 0)]
+        delay = max(delay, self.min_delay)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay
+
+    def issue(self):
+        """
+        Count a hedge request being sent.
+        """
+        with self._lock:
+            self.issued += 1
+
+    def record(self, query_type, elapsed, won=False):
+        """
+        Record how long a query took to be answered.
+
+        :param str query_type: Type of the query
+        :param float elapsed: Seconds until the first answer
+        :param bool won: Whether a hedge request answered first
+        """
+        with self._lock:
+            latencies = self._latencies.get(query_type)
+            if latencies is None:
+                latencies = self._latencies[query_type] = collections.deque(maxlen=self.window)
+            latencies.append(elapsed)
+            if won:
+                self.won += 1
+
+    def stats(self):
+        """
+        :return: The hedges issued and won, and the current delay of each query type seen
+        :rtype: dict
+        """
+        with self._lock:
+            query_types = list(self._latencies)
+            stats = {'issued': self.issued, 'won': self.won}
+        stats['delays'] = dict((query_type, self.delay(query_type)) for query_type in query_types)
+        return stats
+
+
+def with_query_id(query, query_id=None):
+    """
+    Copy a query, setting its queryId in context so that it can be cancelled.
+
+    :param dict query: The query, which is not modified
+    :param str query_id: The queryId. Defaults to the query's own one, or else a random one
+    :return: The copy and its queryId
+    :rtype: tuple
+    """
+    context = dict(query.get('context') or {})
+    if query_id is None:
+        query_id = context.get('queryId') or str(uuid.uuid4())
+    context['queryId'] = query_id
+    query = query.copy()
+    query['context'] = context
+    return query, query_id
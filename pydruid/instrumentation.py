@@ -0,0 +1,144 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+
+import json
+
+import six
+
+QUERY_ID_HEADER = 'X-Druid-Query-Id'
+RESPONSE_CONTEXT_HEADER = 'X-Druid-Response-Context'
+
+# what one request and its response measure, as opposed to the query as a whole
+_EXCHANGE_FIELDS = ('broker', 'serialize', 'connect', 'ttfb', 'download', 'request_bytes',
+                    'response_bytes', 'uncompressed_bytes', 'query_id', 'response_context')
+
+
+class QueryMetrics:
+    """
+    Where the time of one query went, and how much data it moved.
+
+    The phases are timed in seconds. The network ones (serialize, connect, ttfb and download)
+    describe the request that produced the result: with retries or hedging, that is the last or
+    the winning one.
+
+    :ivar dict query: The query
+    :ivar str query_type: Its type, e.g., topN
+    :ivar str datasource: Its datasource, if it names one
+    :ivar float build: Validating the query arguments and building the query
+    :ivar float serialize: Encoding (and compressing) the request body
+    :ivar float connect: Getting a connection: close to 0 for a pooled one, else the TCP (and TLS)
+        handshake
+    :ivar float ttfb: Time to first byte, from sending the request until its response headers
+        arrived, which is mostly the time Druid took to run the query
+    :ivar float download: Reading (and decompressing) the response body
+    :ivar float parse: Decoding the response body
+    :ivar float total: The whole query, from building it to having its result
+    :ivar int request_bytes: Size of the request body as sent
+    :ivar int response_bytes: Size of the response body as received
+    :ivar int uncompressed_bytes: Size of the response body after decompression
+    :ivar int rows: Number of result rows, counted as export_pandas does
+    :ivar int retries: Number of times the query was retried
+    :ivar bool cached: Whether the result came from the client's cache, without any request
+    :ivar str broker: URL of the Broker the request went to
+    :ivar str query_id: The query's id, from Druid's X-Druid-Query-Id response header
+    :ivar response_context: Druid's X-Druid-Response-Context response header, decoded, e.g.,
+        the segments that were missing
+    :ivar Exception error: What the query failed with, if it did
+    """
+
+    def __init__(self, query, build=0.0):
+        self.query = query
+        self.query_type = query.get('queryType')
+        datasource = query.get('dataSource')
+        self.datasource = datasource.get('name') if isinstance(datasource, dict) else datasource
+        self.build = build
+        self.serialize = 0.0
+        self.connect = 0.0
+        self.ttfb = 0.0
+        self.download = 0.0
+        self.parse = 0.0
+        self.total = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.uncompressed_bytes = 0
+        self.rows = 0
+        self.retries = 0
+        self.cached = False
+        self.broker = None
+        self.query_id = None
+        self.response_context = None
+        self.error = None
+
+    def as_dict(self):
+        """
+        :return: The metrics, without the query, e.g., to hand over to a metrics system
+        :rtype: dict
+        """
+        return dict((name, value) for name, value in vars(self).items() if name != 'query')
+
+    def _record_headers(self, getheader):
+        # takes the Druid headers from a response, given a function looking them up by name
+        self.query_id = getheader(QUERY_ID_HEADER)
+        context = getheader(RESPONSE_CONTEXT_HEADER)
+        if isinstance(context, six.string_types) and context:
+            try:
+                context = json.loads(context)
+            except ValueError:
+                pass
+        self.response_context = context
+
+    def _record_exchange(self, other):
+        # takes the network measurements of the request another QueryMetrics recorded
+        for name in _EXCHANGE_FIELDS:
+            setattr(self, name, getattr(other, name))
+
+    def __repr__(self):
+        return ('QueryMetrics({0}, total={1:.3f}, ttfb={2:.3f}, rows={3})'
+                .format(self.query_type, self.total, self.ttfb, self.rows))
+
+
+class QueryListener:
+    """
+    Base class for listeners notified of every query a client runs, e.g., to export timings to a
+    metrics system. Override the methods of interest. Listeners are called on the thread (or
+    event loop) running the query, so they should be quick; whatever they raise propagates.
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> class StatsdListener(QueryListener):
+            ...     def query_finished(self, metrics):
+            ...         statsd.timing('druid.{0}.ttfb'.format(metrics.query_type), metrics.ttfb)
+
+            >>> client = PyDruid('http://localhost:8082', 'druid/v2/', listeners=[StatsdListener()])
+    """
+
+    def query_started(self, query):
+        """
+        Called before a query is sent, or looked up in the cache.
+
+        :param dict query: The query
+        """
+
+    def query_finished(self, metrics):
+        """
+        Called once a query has its result, or has failed.
+
+        :param QueryMetrics metrics: What the query measured. Its error is set if it failed
+        """
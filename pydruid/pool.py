@@ -0,0 +1,192 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+
+import select
+import socket
+import threading
+import time
+
+from six.moves import http_client
+from six.moves.urllib.parse import urlsplit
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of persistent (keep-alive) HTTP connections, keyed by scheme, host and port.
+
+    Connections are handed out most-recently-used first, so that a busy client keeps reusing a small
+    set of warm sockets. Before a pooled connection is reused it is health checked: connections that
+    sat idle for longer than idle_timeout, or whose socket has become readable (which for an idle
+    HTTP connection means the server closed it), are discarded and replaced with a fresh one.
+
+    :param int max_connections: Maximum number of idle connections kept per host. More connections
+        are opened on demand when all pooled ones are in use; the surplus is closed when released.
+    :param float idle_timeout: Seconds an idle connection may stay in the pool before it is discarded
+    :param float timeout: Socket timeout in seconds for new connections, or None to block
+    """
+
+    def __init__(self, max_connections=10, idle_timeout=60.0, timeout=None):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Send a request over a pooled connection.
+
+        A request that fails on a reused connection before any response is received is retried
+        once on a fresh connection, since the server may have closed the socket in the meantime.
+
+        :param str method: HTTP method, e.g., POST
+        :param str url: Absolute URL to send the request to
+        :param bytes body: Request body
+        :param dict headers: Request headers
+        :param float timeout: Socket timeout in seconds for this request. Defaults to the pool's
+        :return: The response, which returns its connection to the pool once read or closed
+        :rtype: PooledResponse
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        while True:
+            start = time.time()
+            conn, reused = self._get(key, timeout)
+            connected = time.time()
+            try:
+                conn.request(method, path, body, headers or {})
+                response = conn.getresponse()
+            except socket.timeout:
+                conn.close()
+                raise
+            except (socket.error, http_client.HTTPException):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            response = PooledResponse(self, key, conn, response)
+            response.connect_time = connected - start
+            response.ttfb = time.time() - connected
+            return response
+
+    def clear(self):
+        """
+        Close all idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def _get(self, key, timeout=None):
+        timeout = timeout if timeout is not None else self.timeout
+        now = time.time()
+        while True:
+            with self._lock:
+                conns = self._idle.get(key)
+                if not conns:
+                    break
+                conn, last_used = conns.pop()
+            if now - last_used <= self.idle_timeout and _is_alive(conn):
+                conn.sock.settimeout(timeout)
+                return conn, True
+            conn.close()
+        return self._connect(key, timeout), False
+
+    def _put(self, key, conn):
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.max_connections:
+                conns.append((conn, time.time()))
+                return
+        conn.close()
+
+    def _connect(self, key, timeout):
+        scheme, host, port = key
+        if scheme == 'https':
+            conn = http_client.HTTPSConnection(host, port, timeout=timeout)
+        else:
+            conn = http_client.HTTPConnection(host, port, timeout=timeout)
+        conn.connect()
+        # headers and body go out in separate writes; without TCP_NODELAY the
+        # body waits on the delayed ACK of the headers for every reused request
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+
+class PooledResponse:
+    """
+    An HTTP response whose connection goes back to its ConnectionPool once the body has been read
+    completely. Closing a response before that closes the underlying connection instead.
+
+    :ivar int status: HTTP status code
+    :ivar str reason: HTTP reason phrase
+    :ivar headers: Response headers
+    :ivar float connect_time: Seconds spent getting a connection for the request
+    :ivar float ttfb: Seconds from sending the request until the response headers arrived
+    """
+
+    def __init__(self, pool, key, conn, response):
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.msg
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.connect_time = 0.0
+        self.ttfb = 0.0
+
+    def read(self, amt=None):
+        if amt is None:
+            data = self._response.read()
+        else:
+            data = self._response.read(amt)
+        if self._response.isclosed():
+            self.close()
+        return data
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._put(self._key, conn)
+        else:
+            self._response.close()
+            conn.close()
+
+
+def _is_alive(conn):
+    # an idle HTTP connection should have nothing to read; a readable socket
+    # means the server has closed it (or sent something we can't use)
+    sock = conn.sock
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (ValueError, socket.error, select.error):
+        return False
+    return not readable
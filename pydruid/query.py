@@ -0,0 +1,474 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+
+import copy
+
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+
+import six
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pandas
+except ImportError:
+    print('Warning: unable to import Pandas. The export_pandas method will not work.')
+    pass
+
+from .utils.intervals import parse_instant
+from .utils.query_utils import UnicodeWriter
+
+# where the rows of each query type's result sit, as iter_items paths
+ROW_PATHS = {
+    'timeseries': ('*', 'result'),
+    'topN': ('*', 'result', '*'),
+    'groupBy': ('*', 'event'),
+    'select': ('*', 'result', 'events', '*'),
+}
+
+
+def flatten_row(query_type, context, item):
+    """
+    Turn one item found at ROW_PATHS[query_type] into a flat row dict. Timeseries, topN and groupBy
+    rows get the timestamp of the result they belong to; select rows are the events themselves.
+    Items of other query types are returned as they are.
+    """
+    if query_type == 'select':
+        return item['event']
+    if 'timestamp' in context:
+        item['timestamp'] = context['timestamp']
+    return item
+
+
+def count_rows(query_type, result):
+    """
+    Count the rows of a parsed result, i.e., the items at ROW_PATHS[query_type], without
+    flattening them. Results of other query types count their top-level elements.
+    """
+    return _count(result, ROW_PATHS.get(query_type, ('*',)))
+
+
+def _count(node, path):
+    if not path:
+        return 1
+    if path[0] == '*':
+        if not isinstance(node, list):
+            return 0
+        return sum(_count(item, path[1:]) for item in node) if path[1:] else len(node)
+    if not isinstance(node, dict):
+        return 0
+    return _count(node.get(path[0]), path[1:])
+
+
+class QueryResult(Sequence):
+    """
+    The result of one Druid query, together with the query that produced it.
+
+    A QueryResult is immutable: every query gets its own, so a single client can be shared
+    between threads without any locking. It behaves like the list of result rows it wraps, so it
+    can be indexed, iterated over and compared with a plain list.
+
+    :ivar dict query: The query sent to Druid
+    :ivar str query_type: The query type, e.g., topN
+    :ivar bytes result_json: The raw response body
+    :ivar list result: The response parsed into a list of dicts
+    :ivar float elapsed: Seconds between sending the query and parsing its result
+    :ivar int compressed_bytes: Size of the response body as received, which is less than
+        uncompressed_bytes if the Broker compressed it
+    :ivar int uncompressed_bytes: Size of the response body after decompression
+    :ivar int retries: Number of times the query was retried before it succeeded
+    :ivar pydruid.instrumentation.QueryMetrics metrics: Where the time of the query went, if it
+        was sent by a client
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> top = query.topn(
+                    datasource='twitterstream',
+                    granularity='all',
+                    intervals='2013-10-04/pt1h',
+                    aggregations={"count": doublesum("count")},
+                    dimension='user_name',
+                    metric='count',
+                    threshold=2
+                )
+            >>> print top.query_type, round(top.elapsed, 3)
+            >>> topN 0.052
+            >>> print top[0]['result'][0]
+            >>> {'count': 7.0, 'user_name': 'user_1'}
+    """
+
+    __slots__ = ('query', 'query_type', 'result_json', 'result', 'elapsed', 'compressed_bytes',
+                 'uncompressed_bytes', 'retries', 'metrics')
+
+    def __init__(self, query, result_json, result, elapsed=0.0, compressed_bytes=None, retries=0,
+                 metrics=None):
+        uncompressed_bytes = len(result_json or b'')
+        if compressed_bytes is None:
+            compressed_bytes = uncompressed_bytes
+        for name, value in (('query', query), ('query_type', query.get('queryType')),
+                            ('result_json', result_json), ('result', result),
+                            ('elapsed', elapsed), ('compressed_bytes', compressed_bytes),
+                            ('uncompressed_bytes', uncompressed_bytes), ('retries', retries),
+                            ('metrics', metrics)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('QueryResult is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('QueryResult is immutable')
+
+    def __reduce__(self):
+        return QueryResult, (self.query, self.result_json, self.result, self.elapsed,
+                             self.compressed_bytes, self.retries, self.metrics)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return QueryResult(*copy.deepcopy(self.__reduce__()[1], memo))
+
+    def __getitem__(self, index):
+        return self.result[index]
+
+    def __len__(self):
+        return len(self.result)
+
+    def __iter__(self):
+        return iter(self.result)
+
+    def __eq__(self, other):
+        if isinstance(other, QueryResult):
+            other = other.result
+        return self.result == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.result)
+
+    def export_tsv(self, dest_path):
+        """
+        Export the query result to a tsv file.
+
+        :param str dest_path: file to write query results to
+        :raise NotImplementedError:
+
+        Example
+
+        .. code-block:: python
+            :linenos:
+
+                >>> top = query.topn(
+                        datasource='twitterstream',
+                        granularity='all',
+                        intervals='2013-10-04/pt1h',
+                        aggregations={"count": doublesum("count")},
+                        dimension='user_name',
+                        filter = Dimension('user_lang') == 'en',
+                        metric='count',
+                        threshold=2
+                    )
+
+                >>> top.export_tsv('top.tsv')
+                >>> !cat top.tsv
+                >>> count	user_name	timestamp
+                    7.0	user_1	2013-10-04T00:00:00.000Z
+                    6.0	user_2	2013-10-04T00:00:00.000Z
+        """
+        if six.PY3:
+            f = open(dest_path, 'w', newline='', encoding='utf-8')
+        else:
+            f = open(dest_path, 'wb')
+        w = UnicodeWriter(f)
+
+        if self.query_type == "timeseries":
+            header = list(self.result[0]['result'].keys())
+            header.append('timestamp')
+        elif self.query_type == 'topN':
+            header = list(self.result[0]['result'][0].keys())
+            header.append('timestamp')
+        elif self.query_type == "groupBy":
+            header = list(self.result[0]['event'].keys())
+            header.append('timestamp')
+            header.append('version')
+        else:
+            raise NotImplementedError('TSV export not implemented for query type: {0}'.format(self.query_type))
+
+        w.writerow(header)
+
+        if self.result:
+            if self.query_type == "topN" or self.query_type == "timeseries":
+                for item in self.result:
+                    timestamp = item['timestamp']
+                    result = item['result']
+                    if type(result) is list:  # topN
+                        for line in result:
+                            w.writerow(list(line.values()) + [timestamp])
+                    else:  # timeseries
+                        w.writerow(list(result.values()) + [timestamp])
+            elif self.query_type == "groupBy":
+                for item in self.result:
+                    timestamp = item['timestamp']
+                    version = item['version']
+                    w.writerow(
+                        list(item['event'].values()) + [timestamp] + [version])
+
+        f.close()
+
+    def export_pandas(self, columnar=False):
+        """
+        Export the query result to a Pandas DataFrame object.
+
+        :param bool columnar: Build the DataFrame from the columns of export_numpy instead of from
+            a list of row dicts. This is much faster and leaner for large results, and parses the
+            timestamp column into datetime64 values rather than leaving it as strings.
+        :return: The DataFrame representing the query result
+        :rtype: DataFrame
+        :raise NotImplementedError:
+
+        Example
+
+        .. code-block:: python
+            :linenos:
+
+                >>> top = query.topn(
+                        datasource='twitterstream',
+                        granularity='all',
+                        intervals='2013-10-04/pt1h',
+                        aggregations={"count": doublesum("count")},
+                        dimension='user_name',
+                        filter = Dimension('user_lang') == 'en',
+                        metric='count',
+                        threshold=2
+                    )
+
+                >>> df = top.export_pandas()
+                >>> print df
+                >>>    count                 timestamp      user_name
+                    0      7  2013-10-04T00:00:00.000Z         user_1
+                    1      6  2013-10-04T00:00:00.000Z         user_2
+        """
+        if columnar:
+            if self.result:
+                return pandas.DataFrame(self.export_numpy(), copy=False)
+            return None
+        if self.result:
+            if self.query_type == "timeseries":
+                nres = [list(v['result'].items()) + [('timestamp', v['timestamp'])]
+                        for v in self.result]
+                nres = [dict(v) for v in nres]
+            elif self.query_type == "topN":
+                nres = []
+                for item in self.result:
+                    timestamp = item['timestamp']
+                    results = item['result']
+                    tres = [dict(list(res.items()) + [('timestamp', timestamp)])
+                            for res in results]
+                    nres += tres
+            elif self.query_type == "groupBy":
+                nres = [list(v['event'].items()) + [('timestamp', v['timestamp'])]
+                        for v in self.result]
+                nres = [dict(v) for v in nres]
+            else:
+                raise NotImplementedError('Pandas export not implemented for query type: {0}'.format(self.query_type))
+
+            df = pandas.DataFrame(nres)
+            return df
+
+    def export_numpy(self):
+        """
+        Export the query result to NumPy arrays, one per column.
+
+        Supports timeseries, topN, groupBy and select results. The result is walked once,
+        collecting each column's values without building any intermediate row dicts. Numeric
+        columns become int64, float64 or bool arrays, with missing values as NaN; other columns
+        become object arrays, with missing values as None.
+        The timestamp column is parsed into datetime64[ms] values in UTC.
+
+        :return: The columns in order of first appearance, followed by timestamp
+        :rtype: dict[str, numpy.ndarray]
+        :raise NotImplementedError:
+
+        Example
+
+        .. code-block:: python
+            :linenos:
+
+                >>> columns = top.export_numpy()
+                >>> print columns['count']
+                >>> [7. 6.]
+                >>> print columns['timestamp']
+                >>> ['2013-10-04T00:00:00.000' '2013-10-04T00:00:00.000']
+        """
+        if numpy is None:
+            raise ImportError('NumPy is required to export to NumPy arrays')
+        rows, timestamps, repeats = self._column_rows('NumPy')
+        columns = dict((name, _column(values)) for name, values in _column_values(rows))
+        # distinct timestamps are few (one per granularity bucket), so parse each only once
+        parsed = {}
+        for timestamp in timestamps:
+            if timestamp not in parsed:
+                parsed[timestamp] = numpy.datetime64(parse_instant(timestamp), 'ms')
+        timestamps = numpy.array([parsed[timestamp] for timestamp in timestamps],
+                                 dtype='datetime64[ms]')
+        columns['timestamp'] = timestamps if repeats is None else numpy.repeat(timestamps, repeats)
+        return columns
+
+    def export_arrow(self):
+        """
+        Export the query result to an Apache Arrow table, built column by column without any
+        intermediate row dicts. Column types are inferred by Arrow, and the timestamp column is
+        parsed into timestamp[ms, UTC] values. Requires pyarrow.
+
+        :return: The table, with the columns in order of first appearance, followed by timestamp
+        :rtype: pyarrow.Table
+        :raise NotImplementedError:
+
+        Example
+
+        .. code-block:: python
+            :linenos:
+
+                >>> table = top.export_arrow()
+                >>> print table.schema
+                >>> count: double
+                    user_name: string
+                    timestamp: timestamp[ms, tz=UTC]
+        """
+        # imported on first use, since it is slow to import
+        import pyarrow
+
+        rows, timestamps, repeats = self._column_rows('Arrow')
+        names = []
+        arrays = []
+        for name, values in _column_values(rows):
+            try:
+                array = pyarrow.array(values)
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+                # mixed types: fall back to their string representations
+                array = pyarrow.array([None if value is None else six.text_type(value)
+                                       for value in values], pyarrow.string())
+            names.append(name)
+            arrays.append(array)
+
+        parsed = {}
+        for timestamp in timestamps:
+            if timestamp not in parsed:
+                parsed[timestamp] = parse_instant(timestamp)
+        if repeats is None:
+            timestamps = [parsed[timestamp] for timestamp in timestamps]
+        else:
+            timestamps = [parsed[timestamp] for timestamp, repeat in zip(timestamps, repeats)
+                          for _ in range(repeat)]
+        names.append('timestamp')
+        arrays.append(pyarrow.array(timestamps, pyarrow.timestamp('ms', tz='UTC')))
+        return pyarrow.Table.from_arrays(arrays, names=names)
+
+    def export_parquet(self, dest_path, compression='snappy'):
+        """
+        Export the query result to a Parquet file, as the table returned by export_arrow.
+        Requires pyarrow.
+
+        :param str dest_path: File to write the query result to
+        :param str compression: Parquet compression codec, e.g., snappy, gzip, zstd, or None
+        :raise NotImplementedError:
+
+        Example
+
+        .. code-block:: python
+            :linenos:
+
+                >>> top.export_parquet('top.parquet', compression='zstd')
+        """
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(self.export_arrow(), dest_path,
+                                    compression=compression or 'none')
+
+    def _column_rows(self, export):
+        # the flat rows of the result, with their timestamps (or, for topN, one timestamp per
+        # result along with the number of rows it is repeated for)
+        repeats = None
+        if self.query_type == 'timeseries':
+            rows = [item['result'] for item in self.result]
+            timestamps = [item['timestamp'] for item in self.result]
+        elif self.query_type == 'topN':
+            rows = [row for item in self.result for row in item['result']]
+            timestamps = [item['timestamp'] for item in self.result]
+            repeats = [len(item['result']) for item in self.result]
+        elif self.query_type == 'groupBy':
+            rows = [item['event'] for item in self.result]
+            timestamps = [item['timestamp'] for item in self.result]
+        elif self.query_type == 'select':
+            rows = [event['event'] for item in self.result for event in item['result']['events']]
+            timestamps = [row['timestamp'] for row in rows]
+        else:
+            raise NotImplementedError('{0} export not implemented for query type: {1}'.format(
+                export, self.query_type))
+        return rows, timestamps, repeats
+
+
+def _column_values(rows):
+    # (name, values) of each column of the rows in order of first appearance, except timestamp
+    names = {}
+    if rows:
+        first = rows[0].keys()
+        names = dict.fromkeys(first)
+        for row in rows:
+            if row.keys() != first:
+                names.update(dict.fromkeys(row))
+    names.pop('timestamp', None)
+    for name in names:
+        try:
+            values = [row[name] for row in rows]
+        except KeyError:
+            values = [row.get(name) for row in rows]
+        yield name, values
+
+
+def _column(values):
+    # a typed array for numbers (with NaN for missing ones), an object array for anything else
+    sample = next((value for value in values if value is not None), None)
+    if isinstance(sample, six.integer_types + (float,)) and not isinstance(sample, bool):
+        try:
+            array = numpy.array(values)
+            if array.dtype.kind in 'iuf':
+                return array
+            return numpy.array(values, dtype=numpy.float64)
+        except (TypeError, ValueError):
+            pass
+    elif isinstance(sample, bool):
+        array = numpy.array(values)
+        if array.dtype.kind == 'b':
+            return array
+    array = numpy.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
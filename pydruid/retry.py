@@ -0,0 +1,128 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+
+import random
+import socket
+import threading
+import time
+
+from six.moves import http_client
+
+from .exceptions import QueryError, QueryTimeout
+
+# HTTP statuses that say the Broker is overloaded or briefly unavailable
+RETRY_STATUSES = (429, 502, 503)
+
+# errors Druid reports for queries that are likely to succeed if sent again a little later
+RETRY_ERRORS = ('Query capacity exceeded',)
+
+
+class RetryPolicy:
+    """
+    When and how often to send a failed query again.
+
+    Only transient failures are retried: connection errors, the HTTP statuses in retry_statuses
+    (by default 429 Too Many Requests, 502 Bad Gateway and 503 Service Unavailable), and the
+    Druid errors in retry_errors, as reported in the error field of the response. Anything else,
+    e.g., a malformed query, fails straight away, as does a query whose deadline has passed.
+
+    Retries wait with exponential backoff and full jitter: before retry n, a random time between
+    0 and backoff * 2 ** (n - 1) seconds, capped at max_backoff, so that clients failing at the
+    same time don't retry in lockstep. A query is given up once it was tried max_attempts times,
+    or if waiting for the next retry would take it past budget seconds since it was first sent,
+    or past its deadline.
+
+    With several Brokers, a query whose Broker is down is first retried on another one right
+    away, see pydruid.balancer.Balancer; the retry policy comes on top of that.
+
+    :param int max_attempts: Maximum number of times a query is sent
+    :param float backoff: Upper bound of the wait before the first retry, in seconds
+    :param float max_backoff: Upper bound of the wait before any retry, in seconds
+    :param float budget: Seconds after which a failing query is no longer retried, or None
+    :param bool jitter: Whether to randomize the waits. Without jitter, the upper bounds are used
+    :param retry_statuses: HTTP statuses to retry
+    :param retry_errors: Druid errors to retry
+    :param bool retry_connection_errors: Whether to retry connection errors
+    :ivar int retries: Number of retries made under this policy so far
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> policy = RetryPolicy(max_attempts=5, backoff=0.2, budget=10)
+            >>> client = PyDruid('http://localhost:8082', 'druid/v2/', retry_policy=policy)
+            >>> result = client.topn(...)
+            >>> result.retries
+            2
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.1, max_backoff=5.0, budget=30.0, jitter=True,
+                 retry_statuses=RETRY_STATUSES, retry_errors=RETRY_ERRORS,
+                 retry_connection_errors=True):
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be at least 1')
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_errors = frozenset(retry_errors)
+        self.retry_connection_errors = retry_connection_errors
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def is_retryable(self, error):
+        """
+        :param Exception error: What a query failed with
+        :return: Whether the failure is transient
+        :rtype: bool
+        """
+        if isinstance(error, QueryTimeout):
+            return False
+        if isinstance(error, QueryError):
+            return error.status in self.retry_statuses or error.error in self.retry_errors
+        return self.retry_connection_errors and isinstance(
+            error, (socket.error, http_client.HTTPException, EOFError))
+
+    def retry_delay(self, error, attempts, started, deadline=None):
+        """
+        Decide whether to retry a failed query, and when.
+
+        :param Exception error: What the last attempt failed with
+        :param int attempts: Number of times the query was sent so far
+        :param float started: Time the query was first sent
+        :param float deadline: Time by which the query must be answered, if any
+        :return: Seconds to wait before sending the query again, or None to give up
+        :rtype: float
+        """
+        if attempts >= self.max_attempts or not self.is_retryable(error):
+            return None
+        delay = self.backoff * 2 ** (attempts - 1)
+        if delay > self.max_backoff:
+            delay = self.max_backoff
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        resume = time.time() + delay
+        if self.budget is not None and resume - started > self.budget:
+            return None
+        if deadline is not None and resume >= deadline:
+            return None
+        with self._lock:
+            self.retries += 1
+        return delay
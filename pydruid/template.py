@@ -0,0 +1,170 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from __future__ import absolute_import
+
+import re
+import time
+
+import six
+
+from .utils.params import Param
+
+
+class QueryTemplate:
+    """
+    A query validated, built and encoded once, with Param placeholders for the values that change
+    between runs. Running it only encodes the bound values and splices them into the encoded
+    query, instead of validating, building and encoding the whole query again. Get one with the
+    prepare method of a client.
+
+    Queries sent with a deadline, through admission control with a default priority or with
+    hedging get their context set per request; only the context is encoded again then.
+
+    :ivar dict query: The query, with the placeholders in it
+    :ivar frozenset params: Names of the parameters to bind
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> template = client.prepare(
+                    'topn',
+                    datasource='twitterstream',
+                    granularity='all',
+                    intervals=Param('intervals'),
+                    aggregations={"count": doublesum("count")},
+                    dimension='user_name',
+                    filter=Dimension('user_lang') == Param('lang'),
+                    metric='count',
+                    threshold=10
+                )
+            >>> top = template.run(intervals='2013-10-04/pt1h', lang='en')
+    """
+
+    def __init__(self, client, query_type, args):
+        self.client = client
+        self.codec = client.codec
+        self.query = client._query_from_spec((query_type, args))
+        paths = {}
+        _find_params(self.query, (), paths)
+        self.params = frozenset(paths.values())
+        # the prefixes of the paths to placeholders: only those containers are copied on binding
+        self._dirty = set(path[:i] for path in paths for i in range(len(path)))
+        self._fragments, self._slots = self._split(self.codec.dumps(
+            dict((key, value) for key, value in self.query.items() if key != 'context')))
+
+    def _split(self, body):
+        # the encoded query without its context, cut around the encoded placeholders
+        tokens = dict((self.codec.dumps(Param(name)), name) for name in self.params)
+        if not tokens:
+            return [body], []
+        pattern = re.compile(b'|'.join(re.escape(token) for token in tokens))
+        fragments = []
+        slots = []
+        start = 0
+        for match in pattern.finditer(body):
+            fragments.append(body[start:match.start()])
+            slots.append(tokens[match.group()])
+            start = match.end()
+        fragments.append(body[start:])
+        return fragments, slots
+
+    def bind(self, **params):
+        """
+        :param params: A value for each parameter
+        :return: The query with the values in place of the placeholders, with its encoding
+        :rtype: BoundQuery
+        :raise ValueError: If parameters are missing or unknown
+        """
+        if six.viewkeys(params) != self.params:
+            missing = self.params - six.viewkeys(params)
+            unknown = six.viewkeys(params) - self.params
+            raise ValueError('Missing parameters: {0}, unknown parameters: {1}'.format(
+                sorted(missing), sorted(unknown)))
+        query = BoundQuery(self._fill(self.query, (), params))
+        encoded = dict((name, self.codec.dumps(value)) for name, value in six.iteritems(params))
+        parts = [self._fragments[0]]
+        for name, fragment in zip(self._slots, self._fragments[1:]):
+            parts.append(encoded[name])
+            parts.append(fragment)
+        query._codec = self.codec
+        query._body = b''.join(parts)
+        return query
+
+    def run(self, **params):
+        """
+        Bind the parameters and send the query, as the query methods of the client do.
+
+        :param params: A value for each parameter
+        :return: The query result (a coroutine resolving to it, with AsyncPyDruid)
+        :rtype: pydruid.query.QueryResult
+        """
+        start = time.time()
+        query = self.bind(**params)
+        return self.client._post(query, time.time() - start)
+
+    def _fill(self, node, path, params):
+        if isinstance(node, Param):
+            return params[node.name]
+        if path not in self._dirty:
+            return node
+        if isinstance(node, dict):
+            return dict((key, self._fill(value, path + (key,), params))
+                        for key, value in six.iteritems(node))
+        return [self._fill(value, path + (i,), params) for i, value in enumerate(node)]
+
+
+class BoundQuery(dict):
+    """
+    A query bound from a QueryTemplate: a plain query dict that also carries its encoding, which
+    the client sends instead of encoding the query again. Treat it as read-only; copies keep the
+    encoding, and only their context may differ.
+    """
+
+    _codec = None
+    _body = None
+
+    def copy(self):
+        query = BoundQuery(self)
+        query._codec = self._codec
+        query._body = self._body
+        return query
+
+    def encode(self, codec):
+        """
+        :param pydruid.codec.JSONCodec codec: The codec to encode the query with
+        :return: The encoded query, spliced together if the codec is the template's
+        :rtype: bytes
+        """
+        if codec is not self._codec:
+            return codec.dumps(dict(self))
+        context = self.get('context')
+        if not context:
+            return self._body
+        return b''.join((self._body[:-1], b',"context":', codec.dumps(context), b'}'))
+
+
+def _find_params(node, path, paths):
+    # records the path to every placeholder in a query
+    if isinstance(node, Param):
+        paths[path] = node.name
+    elif isinstance(node, dict):
+        for key, value in six.iteritems(node):
+            _find_params(value, path + (key,), paths)
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            _find_params(value, path + (i,), paths)
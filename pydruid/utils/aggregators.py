@@ -16,42 +16,97 @@
 from six import iteritems
 
 from .filters import Filter
+from .spec import Spec, freeze
 
 
 def longsum(raw_metric):
-    return {"type": "longSum", "fieldName": raw_metric}
+    return Spec(type="longSum", fieldName=raw_metric)
 
 
 def doublesum(raw_metric):
-    return {"type": "doubleSum", "fieldName": raw_metric}
+    return Spec(type="doubleSum", fieldName=raw_metric)
 
 
 def min(raw_metric):
-    return {"type": "min", "fieldName": raw_metric}
+    return Spec(type="min", fieldName=raw_metric)
 
 
 def max(raw_metric):
-    return {"type": "max", "fieldName": raw_metric}
+    return Spec(type="max", fieldName=raw_metric)
 
 
 def count(raw_metric):
-    return {"type": "count", "fieldName": raw_metric}
+    return Spec(type="count", fieldName=raw_metric)
 
 
 def hyperunique(raw_metric):
-    return {"type": "hyperUnique", "fieldName": raw_metric}
+    return Spec(type="hyperUnique", fieldName=raw_metric)
+
+
+def longmin(raw_metric):
+    return Spec(type="longMin", fieldName=raw_metric)
+
+
+def longmax(raw_metric):
+    return Spec(type="longMax", fieldName=raw_metric)
+
+
+def doublemin(raw_metric):
+    return Spec(type="doubleMin", fieldName=raw_metric)
+
+
+def doublemax(raw_metric):
+    return Spec(type="doubleMax", fieldName=raw_metric)
+
+
+def longfirst(raw_metric):
+    return Spec(type="longFirst", fieldName=raw_metric)
+
+
+def longlast(raw_metric):
+    return Spec(type="longLast", fieldName=raw_metric)
+
+
+def doublefirst(raw_metric):
+    return Spec(type="doubleFirst", fieldName=raw_metric)
+
+
+def doublelast(raw_metric):
+    return Spec(type="doubleLast", fieldName=raw_metric)
+
+
+def thetasketch(raw_column, is_input_theta_sketch=False, size=16384):
+    # needs the druid-datasketches extension
+    return Spec(type="thetaSketch", fieldName=raw_column,
+                isInputThetaSketch=is_input_theta_sketch, size=size)
+
+
+def approxhistogram(raw_metric, resolution=None, num_buckets=None, lower_limit=None,
+                    upper_limit=None, fold=False):
+    # needs the druid-histogram extension; fold aggregates a column of histograms instead of values
+    agg = {"type": "approxHistogramFold" if fold else "approxHistogram", "fieldName": raw_metric}
+    for key, value in (("resolution", resolution), ("numBuckets", num_buckets),
+                       ("lowerLimit", lower_limit), ("upperLimit", upper_limit)):
+        if value is not None:
+            agg[key] = value
+    return Spec(agg)
+
+
+def javascript(columns_list, fn_aggregate, fn_combine, fn_reset):
+    return Spec(type="javascript", fieldNames=columns_list, fnAggregate=fn_aggregate,
+                fnCombine=fn_combine, fnReset=fn_reset)
 
 
 def cardinality(raw_column, by_row=False):
     if type(raw_column) is not list:
         raw_column = [raw_column]
-    return {"type": "cardinality", "fieldNames": raw_column, "byRow": by_row}
+    return Spec(type="cardinality", fieldNames=raw_column, byRow=by_row)
 
 
 def filtered(filter, agg):
-    return {"type": "filtered",
-            "filter": Filter.build_filter(filter),
-            "aggregator": agg}
+    return Spec(type="filtered",
+                filter=Filter.build_filter(filter),
+                aggregator=agg)
 
 
 def build_aggregators(agg_input):
@@ -60,9 +115,12 @@ def build_aggregators(agg_input):
 
 
 def _build_aggregator(name, kwargs):
-    if kwargs["type"] == "filtered":
-        kwargs["aggregator"]["name"] = name
-    else:
-        kwargs.update({"name": name})
+    # the aggregator named as given, leaving the given one as it is so it can be shared. The named
+    # copy is cached on Specs, as the builders above return; a plain dict is frozen every time
+    return freeze(kwargs)._derive(("name", name), lambda agg: _named(agg, name))
+
 
-    return kwargs
+def _named(agg, name):
+    if agg["type"] == "filtered":
+        return agg.replace(aggregator=agg["aggregator"].replace(name=name))
+    return agg.replace(name=name)
@@ -0,0 +1,86 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import zlib
+
+# Content-Encodings we can decode, with the zlib window bits for each
+ENCODINGS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'x-gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+def gzip_compress(data, level=6):
+    """
+    Compress bytes into the gzip format, e.g., for a request body sent with Content-Encoding gzip.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data, encoding):
+    """
+    Decompress a whole body sent with the given Content-Encoding (gzip or deflate).
+    """
+    decompressor = zlib.decompressobj(ENCODINGS[encoding.lower()])
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+class DecompressingReader:
+    """
+    Wraps a response with a compressed body, decompressing it as it is read, so that the body can
+    be parsed incrementally without ever being held whole, compressed or not.
+
+    :param fp: The response, whose read(n) returns bytes of the compressed body
+    :param str encoding: Its Content-Encoding, gzip or deflate
+    :ivar int compressed_bytes: Number of compressed bytes read so far
+    :ivar int uncompressed_bytes: Number of decompressed bytes returned so far
+    """
+
+    def __init__(self, fp, encoding):
+        self.fp = fp
+        self.decompressor = zlib.decompressobj(ENCODINGS[encoding.lower()])
+        self.compressed_bytes = 0
+        self.uncompressed_bytes = 0
+
+    def read(self, amt=None):
+        if amt is None:
+            data = self.fp.read()
+            self.compressed_bytes += len(data)
+            data = self.decompressor.decompress(data) + self.decompressor.flush()
+            self.uncompressed_bytes += len(data)
+            return data
+        while True:
+            tail = self.decompressor.unconsumed_tail
+            if tail:
+                data = self.decompressor.decompress(tail, amt)
+            else:
+                compressed = self.fp.read(amt)
+                if not compressed:
+                    data = self.decompressor.flush()
+                    self.uncompressed_bytes += len(data)
+                    return data
+                self.compressed_bytes += len(compressed)
+                data = self.decompressor.decompress(compressed, amt)
+            # a chunk may only hold a header or the end of a block, decompressing to nothing
+            if data:
+                self.uncompressed_bytes += len(data)
+                return data
+
+    def close(self):
+        self.fp.close()
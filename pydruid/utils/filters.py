@@ -13,6 +13,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import six
+
+from .params import Param
+
 try:
     import simplejson as json
 except ImportError:
@@ -38,6 +42,46 @@ class Filter:
         elif args["type"] == "not":
             self.filter = {"filter": {"type": "not",
                                       "field": args["field"]}}
+
+        elif args["type"] == "in":
+            self.filter = {"filter": {"type": "in",
+                                      "dimension": args["dimension"],
+                                      "values": _values(args["values"])}}
+
+        elif args["type"] == "bound":
+            bound = {"type": "bound", "dimension": args["dimension"]}
+            for key in ("lower", "upper"):
+                if args.get(key) is not None:
+                    bound[key] = args[key]
+                    if args.get(key + "Strict"):
+                        bound[key + "Strict"] = True
+            if args.get("ordering") is not None:
+                bound["ordering"] = args["ordering"]
+            self.filter = {"filter": bound}
+
+        elif args["type"] == "regex":
+            self.filter = {"filter": {"type": "regex",
+                                      "dimension": args["dimension"],
+                                      "pattern": args["pattern"]}}
+
+        elif args["type"] == "search":
+            query = args["query"]
+            if isinstance(query, six.string_types):
+                query = {"type": "insensitive_contains", "value": query}
+            self.filter = {"filter": {"type": "search",
+                                      "dimension": args["dimension"],
+                                      "query": query}}
+
+        elif args["type"] == "javascript":
+            self.filter = {"filter": {"type": "javascript",
+                                      "dimension": args["dimension"],
+                                      "function": args["function"]}}
+
+        elif args["type"] == "extraction":
+            self.filter = {"filter": {"type": "extraction",
+                                      "dimension": args["dimension"],
+                                      "value": args["value"],
+                                      "extractionFn": args["extractionFn"]}}
         else:
             raise NotImplementedError(
                 'Filter type: {0} does not exist'.format(args['type']))
@@ -67,3 +111,141 @@ class Dimension:
 
     def __eq__(self, other):
         return Filter(dimension=self.dimension, value=other)
+
+    def __lt__(self, other):
+        return self._bound(upper=other, upperStrict=True)
+
+    def __le__(self, other):
+        return self._bound(upper=other)
+
+    def __gt__(self, other):
+        return self._bound(lower=other, lowerStrict=True)
+
+    def __ge__(self, other):
+        return self._bound(lower=other)
+
+    def _bound(self, **args):
+        # numbers compare numerically; anything else as Druid does by default, lexicographically
+        value = args.get("lower", args.get("upper"))
+        numeric = isinstance(value, (six.integer_types, float)) and not isinstance(value, bool)
+        return Filter(type="bound", dimension=self.dimension,
+                      ordering="numeric" if numeric else None, **args)
+
+
+def _values(values):
+    # the values of an in filter as a list: arrays convert in one go, without boxing each value
+    # into a filter of its own, and any other iterable is copied, e.g., a set or a generator
+    if isinstance(values, Param):
+        return values
+    if isinstance(values, six.string_types):
+        return [values]
+    if hasattr(values, "tolist"):
+        return values.tolist()
+    return list(values)
+
+
+def optimize_filter(filter_dict):
+    """
+    Simplify a filter spec into an equivalent one that is smaller and shallower:
+
+    * nested and/or filters are flattened into their parent of the same type, e.g., the
+      500-deep tree of f1 & f2 & ... & f500 into one and of 500 fields
+    * duplicate fields of an and/or are dropped, and an and/or of a single field becomes that field
+    * double negations cancel out
+    * selector (and in) filters on the same dimension within an or are merged into one in filter
+
+    The given spec is left untouched; parts that need no change are shared with the result.
+
+    :param dict filter_dict: A filter spec, as returned by Filter.build_filter
+    :return: The simplified filter spec
+    :rtype: dict
+    """
+    negated = False
+    while filter_dict.get('type') == 'not':
+        filter_dict = filter_dict['field']
+        negated = not negated
+    if filter_dict.get('type') in ('and', 'or'):
+        filter_dict = _optimize_junction(filter_dict)
+    return {'type': 'not', 'field': filter_dict} if negated else filter_dict
+
+
+def _optimize_junction(filter_dict):
+    typ = filter_dict['type']
+    fields = []
+    seen = set()
+    # the fields of nested filters of the same type are spliced in place, walking the tree with a
+    # stack rather than recursion, as chained operators nest once per operand
+    stack = [iter(filter_dict['fields'])]
+    while stack:
+        field = next(stack[-1], None)
+        if field is None:
+            stack.pop()
+            continue
+        if field.get('type') == typ:
+            stack.append(iter(field['fields']))
+            continue
+        field = optimize_filter(field)
+        if field.get('type') == typ:
+            stack.append(iter(field['fields']))
+            continue
+        key = _freeze(field)
+        if key not in seen:
+            seen.add(key)
+            fields.append(field)
+    if typ == 'or':
+        fields = _merge_values(fields)
+    if len(fields) == 1:
+        return fields[0]
+    return {'type': typ, 'fields': fields}
+
+
+def _merge_values(fields):
+    # merges the selector and in filters of each dimension into one in filter, where the first of
+    # them was
+    values = {}
+    for field in fields:
+        dimension, field_values = _match_values(field)
+        if dimension is not None:
+            values.setdefault(dimension, []).extend(field_values)
+    merged = []
+    for field in fields:
+        dimension = _match_values(field)[0]
+        if dimension is None:
+            merged.append(field)
+        elif dimension not in values:
+            continue
+        elif len(values[dimension]) < 2:
+            merged.append(field)
+        else:
+            merged.append({'type': 'in', 'dimension': dimension,
+                           'values': _unique(values.pop(dimension))})
+    return merged
+
+
+def _match_values(field):
+    # the dimension and values of a plain selector or in filter, or None, None for others
+    typ = field.get('type')
+    if typ == 'selector' and len(field) == 3:
+        return field['dimension'], [field['value']]
+    if typ == 'in' and len(field) == 3 and isinstance(field['values'], list):
+        return field['dimension'], field['values']
+    return None, None
+
+
+def _unique(values):
+    seen = set()
+    unique = []
+    for value in values:
+        if value not in seen:
+            seen.add(value)
+            unique.append(value)
+    return unique
+
+
+def _freeze(node):
+    # a hashable equivalent of a filter spec, to find duplicates with
+    if isinstance(node, dict):
+        return tuple(sorted((key, _freeze(value)) for key, value in node.items()))
+    if isinstance(node, (list, tuple)):
+        return tuple(_freeze(value) for value in node)
+    return node
@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+from .spec import Spec
+
 try:
     import simplejson as json
 except ImportError:
@@ -23,21 +25,21 @@ class Having:
     def __init__(self, **args):
 
         if args['type'] in ('equalTo', 'lessThan','greaterThan'):
-            self.having = {'having': {'type': args['type'],
-                                      'aggregation': args['aggregation'],
-                                      'value': args['value']}}
+            self.having = {'having': Spec(type=args['type'],
+                                          aggregation=args['aggregation'],
+                                          value=args['value'])}
 
         elif args['type'] == 'and':
-            self.having = {'having': {'type': 'and',
-                                      'havingSpecs': args['havingSpecs']}}
+            self.having = {'having': Spec(type='and',
+                                          havingSpecs=args['havingSpecs'])}
 
         elif args['type'] == 'or':
-            self.having = {'having': {'type': 'or',
-                                      'havingSpecs': args['havingSpecs']}}
+            self.having = {'having': Spec(type='or',
+                                          havingSpecs=args['havingSpecs'])}
 
         elif args['type'] == 'not':
-            self.having = {'having': {'type': 'not',
-                                      'havingSpec': args['havingSpec']}}
+            self.having = {'having': Spec(type='not',
+                                          havingSpec=args['havingSpec'])}
         else:
             raise NotImplemented(
                 'Having type: {0} does not exist'.format(args['type']))
@@ -0,0 +1,173 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import calendar
+import re
+from datetime import datetime, timedelta
+
+import six
+
+# ISO-8601 instants as Druid accepts them: any prefix of 2013-10-04T05:06:07.089, with an
+# optional UTC offset. Instants without an offset are in UTC, like on a default Druid cluster.
+_INSTANT = re.compile(
+    r'^(\d{4})(?:-(\d{2})(?:-(\d{2})'
+    r'(?:[Tt ](\d{2})(?::?(\d{2})(?::?(\d{2})(?:[.,](\d+))?)?)?)?)?)?'
+    r'(Z|z|[+-]\d{2}(?::?\d{2})?)?$')
+
+_PERIOD = re.compile(
+    r'^[Pp](?:(\d+)[Yy])?(?:(\d+)[Mm])?(?:(\d+)[Ww])?(?:(\d+)[Dd])?'
+    r'(?:[Tt](?:(\d+)[Hh])?(?:(\d+)[Mm])?(?:(\d+(?:[.,]\d+)?)[Ss])?)?$')
+
+# Druid's simple granularities, as periods in the format returned by parse_period
+GRANULARITIES = {
+    'second': (0, timedelta(seconds=1)),
+    'minute': (0, timedelta(minutes=1)),
+    'five_minute': (0, timedelta(minutes=5)),
+    'ten_minute': (0, timedelta(minutes=10)),
+    'fifteen_minute': (0, timedelta(minutes=15)),
+    'thirty_minute': (0, timedelta(minutes=30)),
+    'hour': (0, timedelta(hours=1)),
+    'six_hour': (0, timedelta(hours=6)),
+    'eight_hour': (0, timedelta(hours=8)),
+    'day': (0, timedelta(days=1)),
+    'week': (0, timedelta(weeks=1)),
+    'month': (1, timedelta()),
+    'quarter': (3, timedelta()),
+    'year': (12, timedelta()),
+}
+
+_EPOCH = datetime(1970, 1, 1)
+# weeks start on Monday, as in ISO-8601 and Druid
+_FIRST_MONDAY = datetime(1970, 1, 5)
+
+
+def parse_instant(value):
+    """
+    Parse an ISO-8601 date or date-time into a naive datetime in UTC.
+
+    :param str value: e.g., 2013-10-04, 2013-10-04T05 or 2013-10-04T05:06:07.089-07:00
+    :rtype: datetime
+    :raise ValueError: if value is not an ISO-8601 instant
+    """
+    match = _INSTANT.match(value.strip())
+    if not match:
+        raise ValueError('Not an ISO-8601 instant: {0}'.format(value))
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    instant = datetime(int(year), int(month or 1), int(day or 1), int(hour or 0),
+                       int(minute or 0), int(second or 0),
+                       int((fraction or '0')[:6].ljust(6, '0')))
+    if offset and offset not in 'Zz':
+        sign = -1 if offset[0] == '-' else 1
+        digits = offset[1:].replace(':', '')
+        delta = timedelta(hours=int(digits[:2]), minutes=int(digits[2:] or 0))
+        instant -= sign * delta
+    return instant
+
+
+def parse_period(value):
+    """
+    Parse an ISO-8601 period, e.g., P1D, pt1h or P1Y2M.
+
+    :param str value: The period
+    :return: The number of months and the remaining fixed-length part of the period
+    :rtype: tuple[int, timedelta]
+    :raise ValueError: if value is not an ISO-8601 period
+    """
+    match = _PERIOD.match(value.strip())
+    if not match or not any(match.groups()) or value.strip()[-1] in 'Tt':
+        raise ValueError('Not an ISO-8601 period: {0}'.format(value))
+    years, months, weeks, days, hours, minutes, seconds = match.groups()
+    return (int(years or 0) * 12 + int(months or 0),
+            timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                      minutes=int(minutes or 0),
+                      seconds=float((seconds or '0').replace(',', '.'))))
+
+
+def add_period(instant, period, sign=1):
+    """
+    Add (or with sign=-1, subtract) a period as returned by parse_period to an instant. Months are
+    added on the calendar, clamping the day to the end of shorter months.
+    """
+    months, delta = period
+    if months:
+        month_index = instant.year * 12 + instant.month - 1 + sign * months
+        year, month = divmod(month_index, 12)
+        day = calendar.monthrange(year, month + 1)[1]
+        if instant.day < day:
+            day = instant.day
+        instant = instant.replace(year=year, month=month + 1, day=day)
+    return instant + sign * delta
+
+
+def parse_interval(value):
+    """
+    Parse an ISO-8601 interval as used in Druid queries: start/end, start/period or period/end.
+
+    :param str value: e.g., 2013-10-04/2013-10-05, 2013-10-04/pt1h or P1D/2013-10-05
+    :return: The start (inclusive) and end (exclusive) of the interval, as naive UTC datetimes
+    :rtype: tuple[datetime, datetime]
+    :raise ValueError: if value is not an ISO-8601 interval
+    """
+    parts = value.split('/')
+    if len(parts) != 2:
+        raise ValueError('Not an ISO-8601 interval: {0}'.format(value))
+    start, end = parts
+    if start[:1] in 'Pp':
+        end = parse_instant(end)
+        return add_period(end, parse_period(start), -1), end
+    start = parse_instant(start)
+    if end[:1] in 'Pp':
+        return start, add_period(start, parse_period(end))
+    return start, parse_instant(end)
+
+
+def parse_intervals(intervals):
+    """
+    Parse the intervals of a Druid query, which may be a single interval or a list of them.
+
+    :rtype: list[tuple[datetime, datetime]]
+    :raise ValueError: if any of the intervals is not an ISO-8601 interval
+    """
+    if isinstance(intervals, six.string_types):
+        intervals = [intervals]
+    return [parse_interval(interval) for interval in intervals]
+
+
+def floor_instant(instant, granularity):
+    """
+    Truncate an instant to the start of the granularity bucket it falls in, the way Druid buckets
+    timestamps in UTC.
+
+    :param datetime instant: A naive UTC datetime
+    :param str granularity: One of the simple granularities in GRANULARITIES, e.g., hour
+    :rtype: datetime
+    """
+    months, delta = GRANULARITIES[granularity]
+    if months:
+        index = (instant.year * 12 + instant.month - 1) // months * months
+        return datetime(index // 12, index % 12 + 1, 1)
+    offset = _microseconds(instant - (_FIRST_MONDAY if granularity == 'week' else _EPOCH))
+    return instant - timedelta(microseconds=offset % _microseconds(delta))
+
+
+def _microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def format_instant(instant):
+    """
+    Format a naive UTC datetime the way Druid does, e.g., 2013-10-04T00:00:00.000Z.
+    """
+    return instant.strftime('%Y-%m-%dT%H:%M:%S.') + '{0:03d}Z'.format(instant.microsecond // 1000)
@@ -0,0 +1,170 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import codecs
+import numbers
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+# what may follow a complete number
+_NUMBER_END = _WHITESPACE + ',]}'
+
+
+def iter_items(fp, path, chunk_size=CHUNK_SIZE):
+    """
+    Incrementally parse a JSON document read from fp, yielding the values found at path without
+    ever holding the whole document in memory.
+
+    The path is a tuple of steps from the top of the document: '*' steps into every element of an
+    array, any other string steps into that key of an object. Along the way, the other members of
+    the objects on the path are collected into a context dict, which is yielded alongside each value.
+    Only members that come before the one being stepped into are known at that point, which suits
+    Druid's results, where each timestamp precedes its result.
+
+    :param fp: File-like object whose read(n) returns bytes
+    :param tuple path: Steps leading to the values to yield
+    :param int chunk_size: Number of bytes to read at a time
+    :return: A generator of (context, value) pairs
+
+    Example
+
+    .. code-block:: python
+        :linenos:
+
+            >>> fp = io.BytesIO(b'[{"timestamp": "2013-10-04", "result": [{"count": 1}, {"count": 2}]}]')
+            >>> list(iter_items(fp, ('*', 'result', '*')))
+            >>> [({'timestamp': '2013-10-04'}, {'count': 1}), ({'timestamp': '2013-10-04'}, {'count': 2})]
+    """
+    reader = _Reader(fp, chunk_size)
+    for item in _walk(reader, tuple(path), {}):
+        yield item
+    if reader.peek() is not None:
+        raise ValueError('Extra data after the end of the JSON document')
+
+
+def _walk(reader, path, context):
+    if not path:
+        yield context, reader.value()
+        return
+
+    step = path[0]
+    if step == '*':
+        reader.expect('[')
+        if reader.peek() == ']':
+            reader.advance()
+            return
+        while True:
+            for item in _walk(reader, path[1:], context):
+                yield item
+            if reader.expect(',]') == ']':
+                return
+    else:
+        reader.expect('{')
+        if reader.peek() == '}':
+            reader.advance()
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == step:
+                for item in _walk(reader, path[1:], context):
+                    yield item
+            else:
+                # copy rather than update, since contexts already yielded must not change
+                context = dict(context)
+                context[key] = reader.value()
+            if reader.expect(',}') == '}':
+                return
+
+
+class _Reader:
+    """
+    A window over the text of a JSON document that is read and decoded chunk by chunk.
+    """
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buf = u''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, min_size=0):
+        # drop what was consumed, then read until at least min_size more characters arrived
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        target = len(self.buf) + max(min_size, 1)
+        while not self.eof and len(self.buf) < target:
+            data = self.fp.read(self.chunk_size)
+            if not data:
+                self.eof = True
+                self.buf += self.decoder.decode(b'', True)
+            else:
+                self.buf += self.decoder.decode(data)
+        return len(self.buf) > 0
+
+    def peek(self):
+        while True:
+            buf, pos = self.buf, self.pos
+            end = len(buf)
+            while pos < end and buf[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < end:
+                return buf[pos]
+            if self.eof:
+                return None
+            self.fill()
+
+    def advance(self):
+        self.pos += 1
+
+    def expect(self, chars):
+        char = self.peek()
+        if char is None or char not in chars:
+            raise ValueError('Expected one of {0!r} but found {1!r} in JSON stream'.format(chars, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        if self.peek() is None:
+            raise ValueError('Unexpected end of JSON stream')
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # a number or literal running up to the end of the buffer may continue in the next
+                # chunk, and so may a number the decoder stopped short at, e.g., at '12' of '12.5'
+                if self.eof or (end < len(self.buf) and (
+                        not _is_number(value) or self.buf[end] in _NUMBER_END)):
+                    self.pos = end
+                    return value
+            # grow the window geometrically, so that a large value isn't re-parsed once per chunk
+            self.fill(max(self.chunk_size, len(self.buf) - self.pos))
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
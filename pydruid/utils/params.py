@@ -0,0 +1,31 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+class Param(str):
+    """
+    A placeholder for a value bound when a prepared query is run, see
+    pydruid.template.QueryTemplate. It can stand for any single JSON value of the query, e.g.,
+    intervals, a filter value or threshold, and for all the values of an in filter.
+
+    :param str name: Name of the parameter to bind it with
+    """
+
+    def __new__(cls, name):
+        param = str.__new__(cls, '\x00pydruid.param:{0}\x00'.format(name))
+        param.name = name
+        return param
+
+    def __repr__(self):
+        return 'Param({0!r})'.format(self.name)
@@ -17,12 +17,15 @@ from __future__ import division
 
 import six
 
+from .spec import Spec, freeze
+
+
 class Postaggregator:
     def __init__(self, fn, fields, name):
-        self.post_aggregator = {'type': 'arithmetic',
-                                'name': name,
-                                'fn': fn,
-                                'fields': fields}
+        self.post_aggregator = Spec(type='arithmetic',
+                                    name=name,
+                                    fn=fn,
+                                    fields=fields)
         self.name = name
 
     def __mul__(self, other):
@@ -49,9 +52,11 @@ class Postaggregator:
 
     @staticmethod
     def build_post_aggregators(postaggs):
+        # named copies, leaving the post-aggregators as they are so they can be shared; subclasses
+        # that set a plain dict as post_aggregator get it frozen first
         def rename_postagg(new_name, post_aggregator):
-            post_aggregator['name'] = new_name
-            return post_aggregator
+            return freeze(post_aggregator)._derive(('name', new_name),
+                                           lambda spec: spec.replace(name=new_name))
 
         return [rename_postagg(new_name, postagg.post_aggregator)
                 for (new_name, postagg) in six.iteritems(postaggs)]
@@ -60,8 +65,8 @@ class Postaggregator:
 class Field(Postaggregator):
     def __init__(self, name):
         Postaggregator.__init__(self, None, None, name)
-        self.post_aggregator = {
-            'type': 'fieldAccess', 'fieldName': name}
+        self.post_aggregator = Spec(
+            type='fieldAccess', fieldName=name)
 
 
 class Const(Postaggregator):
@@ -73,5 +78,67 @@ class Const(Postaggregator):
             name = output_name
 
         Postaggregator.__init__(self, None, None, name)
-        self.post_aggregator = {
-            'type': 'constant', 'name': name, 'value': value}
+        self.post_aggregator = Spec(
+            type='constant', name=name, value=value)
+
+
+class HyperUniqueCardinality(Postaggregator):
+    def __init__(self, name):
+        Postaggregator.__init__(self, None, None, name)
+        self.post_aggregator = Spec(
+            type='hyperUniqueCardinality', fieldName=name)
+
+
+class Quantile(Postaggregator):
+    # of an approxHistogram aggregator
+    def __init__(self, name, probability):
+        Postaggregator.__init__(self, None, None, name)
+        self.post_aggregator = Spec(
+            type='quantile', fieldName=name, probability=probability)
+
+
+class Quantiles(Postaggregator):
+    def __init__(self, name, probabilities):
+        Postaggregator.__init__(self, None, None, name)
+        self.post_aggregator = Spec(
+            type='quantiles', fieldName=name, probabilities=probabilities)
+
+
+class ThetaSketchOp:
+    # a set operation on theta sketches, built with &, | and -
+    def __init__(self, fn, fields, name):
+        self.post_aggregator = Spec(type='thetaSketchSetOp',
+                                    name=name,
+                                    func=fn,
+                                    fields=fields)
+        self.name = name
+
+    def __and__(self, other):
+        return ThetaSketchOp('INTERSECT', self.fields(other),
+                             self.name + '_AND_' + other.name)
+
+    def __or__(self, other):
+        return ThetaSketchOp('UNION', self.fields(other),
+                             self.name + '_OR_' + other.name)
+
+    def __sub__(self, other):
+        return ThetaSketchOp('NOT', self.fields(other),
+                             self.name + '_NOT_' + other.name)
+
+    def fields(self, other):
+        return [self.post_aggregator, other.post_aggregator]
+
+
+class ThetaSketch(ThetaSketchOp):
+    # a thetaSketch aggregator, to combine with others
+    def __init__(self, name):
+        ThetaSketchOp.__init__(self, None, None, name)
+        self.post_aggregator = Spec(
+            type='fieldAccess', fieldName=name)
+
+
+class ThetaSketchEstimate(Postaggregator):
+    def __init__(self, field):
+        Postaggregator.__init__(self, None, None, field.name)
+        self.post_aggregator = Spec(
+            type='thetaSketchEstimate', name=field.name, field=field.post_aggregator)
@@ -15,6 +15,11 @@
 #
 import csv
 import codecs
+import gzip
+import io
+import itertools
+from operator import itemgetter
+
 import six
 # A special CSV writer which will write rows to TSV file "f", which is encoded in utf-8.
 # this is necessary because the values in druid are not all ASCII.
@@ -31,8 +36,15 @@ class UnicodeWriter:
     def __encode(self, data):
         data = str(data) if isinstance(data, six.integer_types) else data
         if not six.PY3:
-            data = data.encode('utf-8') if isinstance(data, unicode) else data
-            data = data.decode('utf-8')
+            # as the Python 3 csv module does: None is written empty and floats as their repr
+            if data is None:
+                data = u''
+            elif isinstance(data, float):
+                data = six.text_type(repr(data))
+            elif isinstance(data, bytes):
+                data = data.decode('utf-8')
+            elif not isinstance(data, six.text_type):
+                data = six.text_type(data)
             return self.encoder.encode(data)
         return data
 
@@ -41,5 +53,66 @@ class UnicodeWriter:
         self.writer.writerow(row)
 
     def writerows(self, rows):
-        for row in rows:
-            self.writerow(row)
+        self.writer.writerows([[self.__encode(s) for s in row] for row in rows])
+
+
+def write_rows(rows, dest_path, columns=None, dialect="excel-tab", compression="infer",
+               batch_size=1000):
+    """
+    Write an iterable of row dicts to a delimited text file, consuming the rows as they come, so
+    that the whole result never needs to be held in memory. Rows are written in batches through
+    a buffered writer.
+
+    :param rows: Row dicts, e.g., as yielded by PyDruid.stream
+    :param str dest_path: File to write the rows to
+    :param list columns: Columns to write, in order. Defaults to the keys of the first row.
+        Columns missing from a row are written empty and keys not among the columns are left out.
+    :param str dialect: csv dialect, e.g., excel-tab (TSV) or excel (CSV)
+    :param str compression: gzip to compress the file, None not to, or infer to compress it if
+        dest_path ends with .gz
+    :param int batch_size: Number of rows to write at a time
+    :return: The number of rows written
+    :rtype: int
+    """
+    rows = iter(rows)
+    if columns is None:
+        first = next(rows, None)
+        columns = list(first.keys()) if first is not None else []
+        if first is not None:
+            rows = itertools.chain([first], rows)
+    if compression == "infer":
+        compression = "gzip" if dest_path.endswith(".gz") else None
+
+    if compression == "gzip":
+        raw = gzip.open(dest_path, "wb")
+    else:
+        raw = open(dest_path, "wb", 1024 * 1024)
+    if six.PY3:
+        f = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        writer = csv.writer(f, dialect=dialect)
+    else:
+        f = raw
+        writer = UnicodeWriter(f, dialect=dialect)
+
+    getter = itemgetter(*columns) if len(columns) > 1 else None
+
+    def values(row):
+        try:
+            if getter is not None:
+                return getter(row)
+            return [row[column] for column in columns]
+        except KeyError:
+            return [row.get(column) for column in columns]
+
+    count = 0
+    try:
+        writer.writerow(columns)
+        while True:
+            batch = [values(row) for row in itertools.islice(rows, batch_size)]
+            if not batch:
+                break
+            writer.writerows(batch)
+            count += len(batch)
+    finally:
+        f.close()
+    return count
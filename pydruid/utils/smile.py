@@ -0,0 +1,421 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""
+Encoding and decoding of Jackson's Smile binary JSON format, which Druid Brokers answer in when
+asked for application/x-jackson-smile. See
+https://github.com/FasterXML/smile-format-specification.
+"""
+import struct
+from decimal import Decimal
+
+import six
+
+HEADER = b':)\n'
+CONTENT_TYPE = 'application/x-jackson-smile'
+
+# flags in the fourth header byte
+_SHARED_NAMES = 0x01
+_SHARED_VALUES = 0x02
+
+# both shared string tables are cleared once they hold this many entries
+_MAX_SHARED = 1024
+# strings longer than this (in bytes) are written as long strings, and never shared
+_MAX_SHORT_VALUE = 64
+_MAX_SHORT_ASCII_NAME = 64
+_MAX_SHORT_UNICODE_NAME = 57
+
+_INT32 = (-2 ** 31, 2 ** 31 - 1)
+_INT64 = (-2 ** 63, 2 ** 63 - 1)
+
+_pack_double_bits = struct.Struct('>Q').pack
+_unpack_double = struct.Struct('>d').unpack
+
+
+def loads(data):
+    """
+    Decode a Smile document, headed by the :)\\n signature, into Python objects the way json.loads
+    decodes JSON: objects become dicts, arrays lists, and BigDecimals floats.
+
+    :param bytes data: The Smile document
+    :raise ValueError: if data is not valid Smile
+    """
+    # a bytearray indexes to ints on Python 2 as well
+    data = bytearray(data)
+    if data[:3] != HEADER or len(data) < 4:
+        raise ValueError('Not a Smile document: missing the :)\\n header')
+    flags = data[3]
+    if flags >> 4:
+        raise ValueError('Unsupported Smile version: {0}'.format(flags >> 4))
+    decoder = _Decoder(data, flags & _SHARED_NAMES, flags & _SHARED_VALUES)
+    try:
+        value, pos = decoder.value(4)
+        # the optional end-of-content marker
+        while pos < len(data) and data[pos] == 0xFF:
+            pos += 1
+    except IndexError:
+        raise ValueError('Unexpected end of Smile document')
+    if pos != len(data):
+        raise ValueError('Extra data after the end of the Smile document')
+    return value
+
+
+def dumps(obj, shared_names=True, shared_values=False):
+    """
+    Encode Python objects into a Smile document, the way Jackson does by default.
+
+    :param obj: dicts, lists, tuples, strings, numbers, bools, None and bytes, nested arbitrarily
+    :param bool shared_names: Whether to refer back to repeated object keys
+    :param bool shared_values: Whether to refer back to repeated short string values
+    :rtype: bytes
+    """
+    encoder = _Encoder(shared_names, shared_values)
+    out = bytearray(HEADER)
+    out.append((_SHARED_NAMES if shared_names else 0) | (_SHARED_VALUES if shared_values else 0))
+    encoder.value(obj, out)
+    return bytes(out)
+
+
+def _double(data, pos):
+    # a double is sent as 10 bytes of 7 bits each, the first holding just the sign bit
+    bits = ((data[pos] << 63) | (data[pos + 1] << 56) | (data[pos + 2] << 49) |
+            (data[pos + 3] << 42) | (data[pos + 4] << 35) | (data[pos + 5] << 28) |
+            (data[pos + 6] << 21) | (data[pos + 7] << 14) | (data[pos + 8] << 7) | data[pos + 9])
+    return _unpack_double(_pack_double_bits(bits & 0xFFFFFFFFFFFFFFFF))[0]
+
+
+def _zigzag_decode(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def _zigzag_encode(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+
+class _Decoder:
+
+    def __init__(self, data, shared_names, shared_values):
+        self.data = data
+        self.names = [] if shared_names else None
+        self.values = [] if shared_values else None
+
+    def value(self, pos):
+        # decodes the value starting at pos, returning it and the position after it
+        data = self.data
+        token = data[pos]
+        pos += 1
+        kind = token >> 5
+
+        if kind == 6:  # 0xC0-0xDF: small int
+            return _zigzag_decode(token & 0x1F), pos
+        if kind == 2 or kind == 3:  # 0x40-0x7F: tiny and small ASCII
+            end = pos + (token & 0x1F) + (1 if kind == 2 else 33)
+            return self._short_string(data[pos:end].decode('ascii'), end)
+        if kind == 4 or kind == 5:  # 0x80-0xBF: tiny and small Unicode
+            end = pos + (token & 0x1F) + (2 if kind == 4 else 34)
+            return self._short_string(data[pos:end].decode('utf-8'), end)
+        if token == 0xFA:
+            return self._object(pos)
+        if token == 0xF8:
+            array = []
+            while data[pos] != 0xF9:
+                value, pos = self.value(pos)
+                array.append(value)
+            return array, pos + 1
+        if kind == 1:  # 0x20-0x3F: literals and numbers
+            if token == 0x29:
+                return _double(data, pos), pos + 10
+            if token == 0x24 or token == 0x25:
+                n, pos = self._vint(pos)
+                return _zigzag_decode(n), pos
+            if token == 0x21:
+                return None, pos
+            if token == 0x23:
+                return True, pos
+            if token == 0x22:
+                return False, pos
+            if token == 0x20:
+                return u'', pos
+            if token == 0x28:
+                bits = 0
+                for b in data[pos:pos + 5]:
+                    bits = (bits << 7) | b
+                return struct.unpack('>f', struct.pack('>I', bits & 0xFFFFFFFF))[0], pos + 5
+            if token == 0x26:
+                raw, pos = self._binary(pos)
+                return _int_from_bytes(raw), pos
+            if token == 0x2A:
+                scale, pos = self._vint(pos)
+                raw, pos = self._binary(pos)
+                unscaled = _int_from_bytes(raw)
+                return float(Decimal(unscaled).scaleb(-_zigzag_decode(scale))), pos
+        elif kind == 0:  # 0x01-0x1F: short shared value reference
+            if token and self.values is not None:
+                return self.values[token - 1], pos
+        elif token == 0xE0 or token == 0xE4:  # long ASCII or Unicode text
+            end = data.index(b'\xfc', pos)
+            return data[pos:end].decode('utf-8'), end + 1
+        elif 0xEC <= token <= 0xEF and self.values is not None:
+            return self.values[((token & 0x03) << 8) | data[pos]], pos + 1
+        elif token == 0xE8:
+            return self._binary(pos)
+        elif token == 0xFD:
+            length, pos = self._vint(pos)
+            return bytes(data[pos:pos + length]), pos + length
+        raise ValueError('Invalid Smile token 0x{0:02X} at position {1}'.format(token, pos - 1))
+
+    def _short_string(self, value, pos):
+        values = self.values
+        if values is not None:
+            if len(values) == _MAX_SHARED:
+                del values[:]
+            values.append(value)
+        return value, pos
+
+    def _object(self, pos):
+        data = self.data
+        names = self.names
+        values = self.values
+        obj = {}
+        while True:
+            token = data[pos]
+            pos += 1
+            if 0x80 <= token < 0xC0:  # short ASCII name
+                end = pos + (token & 0x3F) + 1
+                name = data[pos:end].decode('ascii')
+                pos = end
+            elif 0x40 <= token < 0x80 and names is not None:  # short shared name reference
+                name = names[token & 0x3F]
+                obj_value, pos = self.value(pos)
+                obj[name] = obj_value
+                continue
+            elif token == 0xFB:
+                return obj, pos
+            elif 0xC0 <= token <= 0xF7:  # short Unicode name
+                end = pos + (token - 0xC0) + 2
+                name = data[pos:end].decode('utf-8')
+                pos = end
+            elif 0x30 <= token <= 0x33 and names is not None:  # long shared name reference
+                name = names[((token & 0x03) << 8) | data[pos]]
+                obj_value, pos = self.value(pos + 1)
+                obj[name] = obj_value
+                continue
+            elif token == 0x34:  # long name
+                end = data.index(b'\xfc', pos)
+                name = data[pos:end].decode('utf-8')
+                pos = end + 1
+            elif token == 0x20:
+                obj_value, pos = self.value(pos)
+                obj[u''] = obj_value
+                continue
+            else:
+                raise ValueError('Invalid Smile key token 0x{0:02X} at position {1}'.format(
+                    token, pos - 1))
+            if names is not None:
+                if len(names) == _MAX_SHARED:
+                    del names[:]
+                names.append(name)
+
+            # the most common values are decoded inline, the rest by value()
+            token = data[pos]
+            if 0xC0 <= token < 0xE0:
+                obj[name] = _zigzag_decode(token & 0x1F)
+                pos += 1
+            elif token == 0x29:
+                obj[name] = _double(data, pos + 1)
+                pos += 11
+            elif 0x40 <= token < 0x60 and values is None:
+                end = pos + (token & 0x1F) + 2
+                obj[name] = data[pos + 1:end].decode('ascii')
+                pos = end
+            else:
+                obj[name], pos = self.value(pos)
+
+    def _vint(self, pos):
+        data = self.data
+        value = 0
+        while True:
+            b = data[pos]
+            pos += 1
+            if b & 0x80:
+                return (value << 6) | (b & 0x3F), pos
+            value = (value << 7) | b
+
+    def _binary(self, pos):
+        # 7-bit encoded binary: each 7 bytes take 8, the last n < 7 bytes take n + 1
+        length, pos = self._vint(pos)
+        data = self.data
+        out = bytearray()
+        while length > 0:
+            k = 7 if length >= 7 else length
+            bits = 0
+            for b in data[pos:pos + k]:
+                bits = (bits << 7) | b
+            bits = (bits << k) | data[pos + k]
+            out.extend(_int_to_bytes(bits, k))
+            pos += k + 1
+            length -= k
+        return bytes(out), pos
+
+
+class _Encoder:
+
+    def __init__(self, shared_names, shared_values):
+        self.names = {} if shared_names else None
+        self.values = {} if shared_values else None
+        # a value may be written out again instead of referenced, so the table's size is counted
+        self.value_count = 0
+
+    def value(self, obj, out):
+        if obj is None:
+            out.append(0x21)
+        elif obj is True:
+            out.append(0x23)
+        elif obj is False:
+            out.append(0x22)
+        elif isinstance(obj, six.string_types):
+            self._string(obj, out)
+        elif isinstance(obj, six.integer_types):
+            if -16 <= obj <= 15:
+                out.append(0xC0 | _zigzag_encode(obj))
+            elif _INT32[0] <= obj <= _INT32[1]:
+                out.append(0x24)
+                _write_vint(_zigzag_encode(obj), out)
+            elif _INT64[0] <= obj <= _INT64[1]:
+                out.append(0x25)
+                _write_vint(_zigzag_encode(obj), out)
+            else:
+                out.append(0x26)
+                length = (obj + (obj < 0)).bit_length() // 8 + 1
+                _write_binary(_int_to_bytes(obj & ((1 << (8 * length)) - 1), length), out)
+        elif isinstance(obj, float):
+            out.append(0x29)
+            bits = struct.unpack('>Q', struct.pack('>d', obj))[0]
+            out.extend((bits >> shift) & 0x7F for shift in range(63, -1, -7))
+        elif isinstance(obj, dict):
+            out.append(0xFA)
+            for key, value in obj.items():
+                self._name(key, out)
+                self.value(value, out)
+            out.append(0xFB)
+        elif isinstance(obj, (list, tuple)):
+            out.append(0xF8)
+            for value in obj:
+                self.value(value, out)
+            out.append(0xF9)
+        elif isinstance(obj, (bytes, bytearray)):
+            out.append(0xE8)
+            _write_binary(bytes(obj), out)
+        else:
+            raise TypeError('{0!r} cannot be encoded as Smile'.format(obj))
+
+    def _string(self, value, out):
+        values = self.values
+        if not value:
+            out.append(0x20)
+            return
+        if values is not None:
+            index = values.get(value)
+            # references whose low byte would be 0xFE or 0xFF are not allowed
+            if index is not None and (index & 0xFF) < 0xFE:
+                if index < 31:
+                    out.append(index + 1)
+                else:
+                    out.append(0xEC | (index >> 8))
+                    out.append(index & 0xFF)
+                return
+        data = value.encode('utf-8')
+        n = len(data)
+        ascii = n == len(value)
+        if n > _MAX_SHORT_VALUE + (0 if ascii else 1):
+            out.append(0xE0 if ascii else 0xE4)
+            out.extend(data)
+            out.append(0xFC)
+            return
+        if ascii:
+            out.append(0x40 | (n - 1) if n <= 32 else 0x60 | (n - 33))
+        else:
+            out.append(0x80 | (n - 2) if n <= 33 else 0xA0 | (n - 34))
+        out.extend(data)
+        if values is not None:
+            if self.value_count == _MAX_SHARED:
+                values.clear()
+                self.value_count = 0
+            values[value] = self.value_count
+            self.value_count += 1
+
+    def _name(self, name, out):
+        names = self.names
+        if not name:
+            out.append(0x20)
+            return
+        if names is not None:
+            index = names.get(name)
+            if index is not None:
+                if index < 64:
+                    out.append(0x40 | index)
+                else:
+                    out.append(0x30 | (index >> 8))
+                    out.append(index & 0xFF)
+                return
+        data = name.encode('utf-8')
+        n = len(data)
+        if n == len(name) and n <= _MAX_SHORT_ASCII_NAME:
+            out.append(0x80 | (n - 1))
+            out.extend(data)
+        elif n != len(name) and n <= _MAX_SHORT_UNICODE_NAME:
+            out.append(0xC0 + n - 2)
+            out.extend(data)
+        else:
+            out.append(0x34)
+            out.extend(data)
+            out.append(0xFC)
+        if names is not None:
+            if len(names) == _MAX_SHARED:
+                names.clear()
+            names[name] = len(names)
+
+
+def _write_vint(n, out):
+    groups = [0x80 | (n & 0x3F)]
+    n >>= 6
+    while n:
+        groups.append(n & 0x7F)
+        n >>= 7
+    out.extend(reversed(groups))
+
+
+def _write_binary(data, out):
+    _write_vint(len(data), out)
+    for start in range(0, len(data), 7):
+        chunk = data[start:start + 7]
+        k = len(chunk)
+        bits = _int_from_bytes(chunk, signed=False)
+        rest = bits >> k
+        out.extend((rest >> (7 * (k - 1 - i))) & 0x7F for i in range(k))
+        out.append(bits & ((1 << k) - 1))
+
+
+def _int_from_bytes(data, signed=True):
+    value = 0
+    for b in bytearray(data):
+        value = (value << 8) | b
+    if signed and data and bytearray(data)[0] & 0x80:
+        value -= 1 << (8 * len(data))
+    return value
+
+
+def _int_to_bytes(value, length):
+    return bytes(bytearray((value >> (8 * (length - 1 - i))) & 0xFF for i in range(length)))
@@ -0,0 +1,130 @@
+#
+# Copyright 2013 Metamarkets Group Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import six
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError('{0} is immutable'.format(type(self).__name__))
+
+
+class Spec(dict):
+    """
+    An immutable, hashable dict, as returned by the aggregator, post-aggregator and having
+    builders. Since nothing can change it, one spec can be shared by any number of queries and
+    threads without copying; deriving a variant of it, e.g., naming an aggregator, builds a new
+    spec, which is cached on the original so that doing it again costs nothing. Plain dicts
+    passed where specs are expected are frozen anew each time, so they don't benefit from that.
+
+    Nested dicts and lists are frozen as well. A Spec compares equal to a dict with the same items,
+    and copy() returns such a dict, to modify. Queries are encoded by the client's codec as usual.
+
+    :ivar str json: The spec as canonical JSON
+    """
+
+    __slots__ = ('_json', '_hash', '_derived')
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, ((key, freeze(value))
+                             for key, value in six.iteritems(dict(*args, **kwargs))))
+        self._json = None
+        self._hash = None
+        self._derived = {}
+
+    @property
+    def json(self):
+        if self._json is None:
+            self._json = json.dumps(self, sort_keys=True, separators=(',', ':'))
+        return self._json
+
+    def replace(self, **items):
+        """
+        :return: A spec with the given items added or replaced
+        :rtype: Spec
+        """
+        return Spec(self, **items)
+
+    def _derive(self, key, build):
+        # the spec build returns for this one, built only the first time; races merely build it
+        # twice, which is harmless as specs are immutable
+        derived = self._derived.get(key)
+        if derived is None:
+            derived = self._derived[key] = build(self)
+        return derived
+
+    def __hash__(self):
+        # from the items, as equality is: the values are frozen, so hashable themselves
+        if self._hash is None:
+            self._hash = hash(frozenset(six.iteritems(self)))
+        return self._hash
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return Spec, (dict(self),)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+    __ior__ = _immutable
+
+
+class FrozenList(list):
+    """
+    An immutable, hashable list, for the lists within a Spec. It compares equal to a list with the
+    same items.
+    """
+
+    __slots__ = ()
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+    __setitem__ = __delitem__ = append = extend = insert = remove = pop = _immutable
+    clear = sort = reverse = __iadd__ = __imul__ = _immutable
+    if six.PY2:
+        __setslice__ = __delslice__ = _immutable
+
+
+def freeze(value):
+    """
+    :param value: A JSON-like value
+    :return: The value, with dicts turned into Specs and lists into FrozenLists, recursively
+    """
+    if isinstance(value, (Spec, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return Spec(value)
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    if isinstance(value, tuple):
+        return tuple(freeze(item) for item in value)
+    return value
@@ -1,5 +1,6 @@
 import sys
 from setuptools import setup
+from setuptools.command.build_py import build_py
 from setuptools.command.test import test as TestCommand
 
 class PyTest(TestCommand):
@@ -20,6 +21,15 @@ class PyTest(TestCommand):
         sys.exit(status)
 
 
+class BuildPy(build_py):
+    # the asyncio client uses async/await, which Pythons before 3.5 can't even byte-compile
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info < (3, 5):
+            modules = [module for module in modules if module[:2] != ('pydruid', 'async_client')]
+        return modules
+
+
 install_requires = ["six >= 1.9.0"]
 
 # only require simplejson on python < 2.6
@@ -38,5 +48,5 @@ setup(
     long_description='See https://github.com/druid-io/pydruid for more information.',
     install_requires=install_requires,
     tests_require=['pytest'],
-    cmdclass={'test': PyTest},
+    cmdclass={'build_py': BuildPy, 'test': PyTest},
 )
@@ -0,0 +1,111 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import sys
+import threading
+import time
+
+import pytest
+from six.moves import BaseHTTPServer, socketserver
+
+# the asyncio client and its tests use async/await, which older Pythons can't compile
+collect_ignore = ['test_async_client.py'] if sys.version_info < (3, 5) else []
+
+
+class StubBroker(object):
+    """
+    A local HTTP/1.1 server standing in for a Druid Broker. Each request pops the next queued
+    response (or gets the default one) and is recorded for inspection.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        self.default_response = (200, {}, b'[]')
+        self.client_ports = set()
+        broker = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                broker.requests.append((self.command, self.path, dict(self.headers), body))
+                broker.client_ports.add(self.client_address[1])
+                if broker.responses:
+                    status, headers, payload = broker.responses.pop(0)
+                else:
+                    status, headers, payload = broker.default_response
+                if callable(payload):
+                    payload = payload(self, body)
+                if not isinstance(payload, bytes):
+                    payload = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_DELETE = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,))
+        self.thread.daemon = True
+
+    def respond(self, payload, status=200, headers=None):
+        self.responses.append((status, headers or {}, payload))
+
+    def query(self, index=-1):
+        return json.loads(self.requests[index][3].decode('utf-8'))
+
+
+def slow(seconds, payload):
+    # a stub Broker response that takes its time answering queries, though not cancellations
+    def respond(handler, body):
+        if handler.command == 'POST':
+            time.sleep(seconds)
+        return json.dumps(payload).encode('utf-8')
+    return respond
+
+
+def deletes(broker, timeout=2.0):
+    # the paths of the cancellations a stub Broker received, waiting up to timeout for the first
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        paths = [path for (command, path, _, _) in broker.requests if command == 'DELETE']
+        if paths:
+            return paths
+        time.sleep(0.01)
+    return []
+
+
+def _serve():
+    stub = StubBroker()
+    stub.thread.start()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+@pytest.fixture
+def broker():
+    for stub in _serve():
+        yield stub
+
+
+@pytest.fixture
+def broker2():
+    # a second Broker, for multi-Broker clients
+    for stub in _serve():
+        yield stub
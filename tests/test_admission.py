@@ -0,0 +1,168 @@
+# -*- coding: UTF-8 -*-
+
+import gc
+import json
+import threading
+import time
+
+import pytest
+
+from pydruid.admission import AdmissionControl
+from pydruid.client import PyDruid, QueryTimeout
+
+
+def topn(datasource='events', priority=None):
+    query = {'queryType': 'topN', 'dataSource': datasource}
+    if priority is not None:
+        query['context'] = {'priority': priority}
+    return query
+
+
+class Concurrency:
+    # a stub Broker response that records how many queries it was answering at once
+    def __init__(self, seconds=0.05):
+        self.seconds = seconds
+        self.current = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, handler, body):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(self.seconds)
+        with self.lock:
+            self.current -= 1
+        return json.dumps([]).encode('utf-8')
+
+
+class TestAdmissionControl:
+
+    def test_rate(self):
+        admission = AdmissionControl(rate=20, burst=1)
+        start = time.time()
+        for _ in range(4):
+            admission.release(admission.acquire(topn()))
+        assert time.time() - start >= 0.14
+
+    def test_burst(self):
+        admission = AdmissionControl(rate=1, burst=3)
+        start = time.time()
+        tickets = [admission.acquire(topn()) for _ in range(3)]
+        assert time.time() - start < 0.1
+        assert admission.stats() == {None: {'in_flight': 3, 'waiting': 0, 'admitted': 3}}
+        for ticket in tickets:
+            admission.release(ticket)
+
+    def test_max_in_flight(self):
+        admission = AdmissionControl(max_in_flight=1)
+        first = admission.acquire(topn())
+        admitted = []
+        thread = threading.Thread(target=lambda: admitted.append(admission.acquire(topn())))
+        thread.start()
+        time.sleep(0.05)
+        assert not admitted
+        admission.release(first)
+        thread.join(1)
+        assert len(admitted) == 1
+
+    def test_priority(self):
+        admission = AdmissionControl(max_in_flight=1)
+        first = admission.acquire(topn())
+        low = admission.enter(topn(priority=-1))
+        default = admission.enter(topn())
+        high = admission.enter(topn(priority=10))
+        assert admission.poll(high) == (False, None)
+        admission.release(first)
+        assert [admission.poll(t)[0] for t in (low, default, high)] == [False, False, True]
+        admission.release(high)
+        assert [admission.poll(t)[0] for t in (low, default)] == [False, True]
+
+    def test_wake(self):
+        admission = AdmissionControl(max_in_flight=1)
+        first = admission.acquire(topn())
+        woken = []
+        ticket = admission.enter(topn(), lambda: woken.append(True))
+        admission.poll(ticket)
+        admission.release(first)
+        assert woken == [True]
+
+    def test_by_datasource(self):
+        admission = AdmissionControl(max_in_flight=1, by='datasource', limits={
+            'batch': {'max_in_flight': 2}})
+        admission.acquire(topn('events'))
+        ticket = admission.enter(topn('events'))
+        assert not admission.poll(ticket)[0]
+        admission.acquire(topn('batch'))
+        admission.acquire(topn('batch'))
+        admission.acquire(topn({'type': 'table', 'name': 'other'}))
+        assert admission.stats()['batch']['in_flight'] == 2
+        assert set(admission.stats()) == {'events', 'batch', 'other'}
+
+    def test_by_query_type(self):
+        admission = AdmissionControl(by='query_type')
+        assert admission.key(topn()) == 'topN'
+        assert AdmissionControl(by=lambda query: 'x').key(topn()) == 'x'
+        with pytest.raises(ValueError):
+            AdmissionControl(by='user')
+
+    def test_prioritize(self):
+        admission = AdmissionControl(by='datasource', limits={'batch': {'priority': -5}})
+        query = topn('batch')
+        assert admission.prioritize(query)['context'] == {'priority': -5}
+        assert 'context' not in query
+        assert admission.prioritize(topn('batch', priority=3))['context'] == {'priority': 3}
+        assert 'context' not in admission.prioritize(topn('events'))
+
+    def test_deadline(self):
+        admission = AdmissionControl(max_in_flight=1)
+        admission.acquire(topn())
+        with pytest.raises(QueryTimeout):
+            admission.acquire(topn(), deadline=time.time() + 0.05)
+        assert admission.stats()[None]['waiting'] == 0
+
+
+class TestAdmittedQueries:
+
+    def test_max_in_flight(self, broker):
+        concurrency = Concurrency()
+        broker.default_response = (200, {}, concurrency)
+        client = PyDruid(broker.url, 'druid/v2/', admission=AdmissionControl(max_in_flight=2))
+        results = client.run_many([('time_boundary', {'datasource': 'test'})] * 6)
+        assert all(result.ok for result in results)
+        assert concurrency.peak == 2
+        assert client.admission.stats()[None]['in_flight'] == 0
+
+    def test_sets_priority(self, broker):
+        admission = AdmissionControl(priority=-1)
+        client = PyDruid(broker.url, 'druid/v2/', admission=admission)
+        client.time_boundary(datasource='test')
+        assert broker.query()['context'] == {'priority': -1}
+        assert client.query_dict == {'queryType': 'timeBoundary', 'dataSource': 'test'}
+
+    def test_stream(self, broker):
+        admission = AdmissionControl(max_in_flight=1)
+        client = PyDruid(broker.url, 'druid/v2/', admission=admission)
+        rows = client.stream('time_boundary', datasource='test')
+        assert admission.stats()[None]['in_flight'] == 1
+        assert list(rows) == []
+        assert admission.stats()[None]['in_flight'] == 0
+
+    def test_stream_closed_before_iterating(self, broker):
+        admission = AdmissionControl(max_in_flight=1)
+        client = PyDruid(broker.url, 'druid/v2/', admission=admission)
+        client.stream('time_boundary', datasource='test').close()
+        assert admission.stats()[None]['in_flight'] == 0
+        rows = client.stream('time_boundary', datasource='test')
+        del rows
+        gc.collect()
+        assert admission.stats()[None]['in_flight'] == 0
+
+    def test_export_stream_fails_before_reading(self, broker):
+        admission = AdmissionControl(max_in_flight=1)
+        client = PyDruid(broker.url, 'druid/v2/', admission=admission)
+        with pytest.raises(IOError):
+            client.export_stream('/nonexistent/x.tsv', 'time_boundary', columns=['a'],
+                                 datasource='test')
+        assert admission.stats()[None]['in_flight'] == 0
+        client.time_boundary(datasource='test', context={'timeout': 1000})
@@ -0,0 +1,306 @@
+# -*- coding: UTF-8 -*-
+
+import asyncio
+import json
+
+import pytest
+
+from pydruid.admission import AdmissionControl
+from pydruid.async_client import AsyncPyDruid, AsyncConnectionPool
+from pydruid.cache import IntervalCache
+from pydruid.client import QueryTimeout
+from pydruid.hedging import Hedging
+from pydruid.retry import RetryPolicy
+from pydruid.template import Param
+from pydruid.utils import aggregators, compression
+
+import test_admission
+import test_instrumentation
+import test_template
+from conftest import deletes, slow
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+class TestAsyncPyDruid:
+
+    def test_query(self, broker):
+        broker.respond([{'timestamp': '2015-01-01T00:00:00.000Z',
+                         'result': [{'count': 7.0, 'user_name': 'user_1'}]}])
+
+        async def query():
+            client = AsyncPyDruid(broker.url, 'druid/v2/')
+            result = await client.topn(
+                datasource='twitterstream', granularity='all', intervals='2015-01-01/p1d',
+                aggregations={'count': aggregators.doublesum('count')},
+                dimension='user_name', metric='count', threshold=1)
+            await client.close()
+            return result
+
+        result = run(query())
+        assert result[0]['result'][0]['user_name'] == 'user_1'
+        assert broker.query() == {
+            'queryType': 'topN', 'dataSource': 'twitterstream', 'granularity': 'all',
+            'intervals': '2015-01-01/p1d', 'dimension': 'user_name', 'metric': 'count',
+            'threshold': 1,
+            'aggregations': [{'type': 'doubleSum', 'fieldName': 'count', 'name': 'count'}],
+        }
+
+    def test_concurrent_queries_share_connections(self, broker):
+        broker.default_response = (200, {}, lambda handler, body: [{'echo': body.decode('utf-8')}])
+
+        async def query():
+            client = AsyncPyDruid(broker.url, 'druid/v2/')
+            first = await asyncio.gather(*[
+                client.time_boundary(datasource='ds{0}'.format(i)) for i in range(20)])
+            second = await asyncio.gather(*[
+                client.time_boundary(datasource='ds{0}'.format(i)) for i in range(20)])
+            await client.close()
+            return first + second
+
+        results = run(query())
+        assert all('"ds{0}"'.format(i % 20) in res[0]['echo'] for i, res in enumerate(results))
+        assert len(broker.client_ports) <= 20
+
+    def test_invalid_query_raises_immediately(self):
+        client = AsyncPyDruid('http://localhost:8083', 'druid/v2/')
+        with pytest.raises(ValueError):
+            client.time_boundary(datasource='things', bogus=1)
+
+    def test_druid_error(self, broker):
+        broker.respond({'error': 'Query timeout'}, status=500)
+        client = AsyncPyDruid(broker.url, 'druid/v2/')
+        with pytest.raises(IOError) as excinfo:
+            run(client.time_boundary(datasource='things'))
+        assert 'Druid Error: Query timeout' in str(excinfo.value)
+
+    def test_run_many(self, broker):
+        broker.default_response = (200, {}, lambda handler, body: [{'echo': body.decode('utf-8')}])
+        broker.respond({'error': 'Query timeout'}, status=500)
+
+        async def query():
+            client = AsyncPyDruid(broker.url, 'druid/v2/')
+            results = await client.run_many(
+                [('time_boundary', {'datasource': 'ds{0}'.format(i)}) for i in range(10)] +
+                [('time_boundary', {'bogus': 1})],
+                max_concurrency=1)
+            await client.close()
+            return results
+
+        results = run(query())
+        assert [r.ok for r in results] == [False] + [True] * 9 + [False]
+        assert all('"ds{0}"'.format(i) in results[i].result[0]['echo'] for i in range(1, 10))
+        assert isinstance(results[-1].error, ValueError)
+
+    def test_compressed_response(self, broker):
+        rows = [{'timestamp': 't', 'result': {'count': i}} for i in range(1000)]
+        broker.respond(compression.gzip_compress(json.dumps(rows).encode('utf-8')),
+                       headers={'Content-Encoding': 'gzip'})
+        client = AsyncPyDruid(broker.url, 'druid/v2/')
+        result = run(client.timeseries(datasource='things', granularity='all',
+                                       intervals='2015-01-01/p1d'))
+        assert result == rows
+        assert result.compressed_bytes < result.uncompressed_bytes / 5
+        assert broker.requests[0][2]['Accept-Encoding'] == 'gzip, deflate'
+
+    def test_interval_cache(self, broker):
+        broker.respond([{'timestamp': '2015-01-01T00:00:00.000Z', 'result': {'count': 1}}])
+        broker.respond([{'timestamp': '2015-01-02T00:00:00.000Z', 'result': {'count': 2}}])
+
+        async def query():
+            client = AsyncPyDruid(broker.url, 'druid/v2/', interval_cache=IntervalCache())
+            await client.timeseries(datasource='things', granularity='day',
+                                    intervals='2015-01-01/P1D', aggregations={})
+            result = await client.timeseries(datasource='things', granularity='day',
+                                             intervals='2015-01-01/P2D', aggregations={})
+            await client.close()
+            return result
+
+        assert [row['result']['count'] for row in run(query())] == [1, 2]
+        assert broker.query()['intervals'] == ['2015-01-02T00:00:00.000Z/2015-01-03T00:00:00.000Z']
+
+
+class TestAsyncConnectionPool:
+
+    def test_reuses_connection(self, broker):
+        async def requests():
+            pool = AsyncConnectionPool()
+            for _ in range(3):
+                res = await pool.request('POST', broker.url + '/druid/v2/', b'{}')
+                assert res.status == 200
+                assert res.body == b'[]'
+            await pool.clear()
+
+        run(requests())
+        assert len(broker.client_ports) == 1
+
+    def test_connection_close_is_not_pooled(self, broker):
+        broker.respond(b'[]', headers={'Connection': 'close'})
+
+        async def requests():
+            pool = AsyncConnectionPool()
+            for _ in range(2):
+                await pool.request('POST', broker.url + '/druid/v2/', b'{}')
+            await pool.clear()
+
+        run(requests())
+        assert len(broker.client_ports) == 2
+
+
+class TestAsyncAdmission:
+
+    def test_limit(self, broker):
+        concurrency = test_admission.Concurrency()
+        broker.default_response = (200, {}, concurrency)
+        admission = AdmissionControl(max_in_flight=1)
+        client = AsyncPyDruid(broker.url, 'druid/v2/', admission=admission)
+
+        async def go():
+            try:
+                return await asyncio.gather(*[client.time_boundary(datasource='test')
+                                              for _ in range(4)])
+            finally:
+                await client.close()
+
+        run(go())
+        assert concurrency.peak == 1
+        assert admission.stats()[None] == {'in_flight': 0, 'waiting': 0, 'admitted': 4}
+
+    def test_deadline(self, broker):
+        admission = AdmissionControl(max_in_flight=1)
+        admission.acquire(test_admission.topn())
+        client = AsyncPyDruid(broker.url, 'druid/v2/', admission=admission, timeout=0.05)
+
+        with pytest.raises(QueryTimeout):
+            run(client.time_boundary(datasource='test'))
+        assert admission.stats()[None]['waiting'] == 0
+        assert broker.requests == []
+
+
+class TestAsyncBalancer:
+
+    def test_failover(self, broker, broker2):
+        client = AsyncPyDruid([broker.url, broker2.url], 'druid/v2/')
+        broker.default_response = (503, {}, b'')
+        broker2.default_response = (200, {}, [{'result': 1}])
+
+        async def go():
+            try:
+                return [await client.time_boundary(datasource='test') for _ in range(2)]
+            finally:
+                await client.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(go())
+        finally:
+            loop.close()
+        assert [r.result for r in results] == [[{'result': 1}]] * 2
+        assert len(broker2.requests) == 2
+
+
+class TestAsyncHedging:
+
+    def test_hedge_wins(self, broker, broker2):
+        hedging = Hedging(initial_delay=0.05)
+        client = AsyncPyDruid([broker.url, broker2.url], 'druid/v2/', hedging=hedging)
+        broker.default_response = (200, {}, slow(1.0, [{'slow': True}]))
+        broker2.default_response = (200, {}, [{'slow': False}])
+
+        async def go():
+            try:
+                return await client.time_boundary(datasource='test')
+            finally:
+                await client.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(go())
+        finally:
+            loop.close()
+        assert result.result == [{'slow': False}]
+        assert (hedging.issued, hedging.won) == (1, 1)
+        assert client.balancer.stats()['nodes'][0]['outstanding'] == 0
+        assert deletes(broker) == ['/druid/v2/' + broker.query(0)['context']['queryId']]
+
+
+class TestAsyncInstrumentation:
+
+    def test_phases(self, broker):
+        recorder = test_instrumentation.Recorder()
+        client = AsyncPyDruid(broker.url, 'druid/v2/', listeners=[recorder])
+        broker.respond(test_instrumentation.TOPN_RESULT,
+                       headers=test_instrumentation.DRUID_HEADERS)
+
+        async def go():
+            try:
+                return await test_instrumentation.topn(client)
+            finally:
+                await client.close()
+
+        result = run(go())
+        metrics, = recorder.finished
+        assert result.metrics is metrics
+        assert metrics.rows == 3
+        assert metrics.query_id == 'q1'
+        assert metrics.response_context == {'missingSegments': ['s1']}
+        assert metrics.response_bytes > 0
+        assert metrics.ttfb >= 0 and metrics.download >= 0
+
+
+class TestAsyncRetries:
+
+    def test_retried(self, broker):
+        client = AsyncPyDruid(broker.url, 'druid/v2/', retry_policy=RetryPolicy(backoff=0.01))
+        broker.respond(b'', status=502)
+        broker.respond([{'result': 1}])
+
+        async def go():
+            try:
+                return await client.time_boundary(datasource='test')
+            finally:
+                await client.close()
+
+        result = run(go())
+        assert result.result == [{'result': 1}]
+        assert result.retries == 1
+
+
+class TestAsyncTemplate:
+
+    def test_run(self, broker):
+        client = AsyncPyDruid(broker.url, 'druid/v2/')
+        template = client.prepare(
+            'topn', **test_template.topn_args(Param('intervals'), Param('lang')))
+
+        async def go():
+            try:
+                return await template.run(intervals='2013/2014', lang='fr')
+            finally:
+                await client.close()
+
+        run(go())
+        assert broker.query()['filter']['value'] == 'fr'
+
+
+class TestAsyncDeadlines:
+
+    def test_expired(self, broker):
+        client = AsyncPyDruid(broker.url, 'druid/v2/', timeout=0.2)
+        broker.default_response = (200, {}, slow(1.0, []))
+
+        async def go():
+            try:
+                return await client.time_boundary(datasource='test')
+            finally:
+                await client.close()
+
+        loop = asyncio.new_event_loop()
+        try:
+            with pytest.raises(QueryTimeout) as e:
+                loop.run_until_complete(go())
+        finally:
+            loop.close()
+        assert deletes(broker) == ['/druid/v2/' + e.value.query_id]
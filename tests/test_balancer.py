@@ -0,0 +1,176 @@
+# -*- coding: UTF-8 -*-
+
+import socket
+
+import pytest
+
+from pydruid.balancer import Balancer, is_node_failure
+from pydruid.client import PyDruid, QueryError, QueryTimeout
+
+from conftest import slow
+
+
+def unused_url():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'http://127.0.0.1:{0}'.format(port)
+
+
+def query(client):
+    return client.time_boundary(datasource='test')
+
+
+class TestBalancer:
+
+    def test_least_outstanding(self):
+        balancer = Balancer(['a', 'b', 'c'])
+        first = balancer.acquire()
+        second = balancer.acquire()
+        third = balancer.acquire()
+        assert len({first, second, third}) == 3
+        balancer.release(second, 0.1)
+        assert balancer.acquire() is second
+
+    def test_ties_round_robin(self):
+        balancer = Balancer(['a', 'b'])
+        urls = []
+        for _ in range(4):
+            node = balancer.acquire()
+            balancer.release(node, 0.1)
+            urls.append(node.url)
+        assert urls == ['a', 'b', 'a', 'b']
+
+    def test_latency(self):
+        balancer = Balancer(['a', 'b'], strategy='latency')
+        fast, slow = balancer.nodes
+        balancer.release(balancer.acquire([slow]), 0.01)
+        balancer.release(balancer.acquire([fast]), 1.0)
+        assert [balancer.acquire().url for _ in range(3)] == ['a', 'a', 'a']
+        # busy enough to be worse than the slow node
+        assert fast.outstanding == 3
+        for _ in range(200):
+            node = balancer.acquire()
+            if node is slow:
+                break
+        else:
+            pytest.fail('slow node never picked')
+
+    def test_latency_moving_average(self):
+        balancer = Balancer(['a'], latency_decay=0.5)
+        node = balancer.acquire()
+        balancer.release(node, 1.0)
+        balancer.release(balancer.acquire(), 3.0)
+        assert node.latency == 2.0
+
+    def test_circuit_breaker(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('time.time', lambda: now[0])
+        balancer = Balancer(['a', 'b'], failure_threshold=2, backoff=1.0)
+        a, b = balancer.nodes
+        error = socket.error('refused')
+        for _ in range(2):
+            assert balancer.release(balancer.acquire([b]), error=error)
+        assert a.open_until == 1001.0
+        assert [balancer.acquire().url for _ in range(3)] == ['b', 'b', 'b']
+
+        # half open: a single probe goes through, and failing it doubles the backoff
+        now[0] = 1001.0
+        probe = balancer.acquire()
+        assert probe is a
+        assert balancer.acquire() is b
+        balancer.release(probe, error=error)
+        assert a.open_until == 1003.0
+
+        now[0] = 1003.0
+        balancer.release(balancer.acquire(), 0.1)
+        assert a.open_until == 0.0
+        assert balancer.stats()['nodes'][0]['available']
+
+    def test_all_unavailable(self, monkeypatch):
+        monkeypatch.setattr('time.time', lambda: 1000.0)
+        balancer = Balancer(['a', 'b'], failure_threshold=1)
+        a, b = balancer.nodes
+        balancer.release(balancer.acquire([a]), error=socket.error())
+        balancer.release(balancer.acquire([b]), error=socket.error())
+        b.open_until = 999.5
+        assert balancer.acquire() is b
+        assert balancer.acquire([b]) is a
+        assert balancer.acquire([a, b]) is None
+
+    def test_query_errors_are_not_failures(self):
+        balancer = Balancer(['a'], failure_threshold=1)
+        node = balancer.acquire()
+        assert not balancer.release(node, error=QueryError('bad', 500, 'Server Error'))
+        assert node.failures == 0
+
+    def test_is_node_failure(self):
+        assert is_node_failure(socket.timeout())
+        assert is_node_failure(ConnectionRefusedError())
+        assert is_node_failure(QueryError('unavailable', 503, 'Service Unavailable'))
+        assert not is_node_failure(QueryError('bad', 400, 'Bad Request'))
+        assert not is_node_failure(ValueError())
+        assert not is_node_failure(QueryTimeout({}, 'q1'))
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            Balancer([])
+        with pytest.raises(ValueError):
+            Balancer(['a'], strategy='random')
+
+
+class TestMultiBrokerClient:
+
+    def test_spreads_queries(self, broker, broker2):
+        client = PyDruid([broker.url, broker2.url], 'druid/v2/')
+        for _ in range(4):
+            query(client)
+        assert len(broker.requests) == 2
+        assert len(broker2.requests) == 2
+        assert broker.requests[0][1] == '/druid/v2/'
+
+    def test_fails_over_on_unavailable(self, broker, broker2):
+        client = PyDruid([broker.url, broker2.url], 'druid/v2/')
+        broker.default_response = (503, {}, b'')
+        broker2.respond([{'result': 1}])
+        assert query(client).result == [{'result': 1}]
+        assert client.balancer.stats()['failovers'] == 1
+
+    def test_fails_over_on_connection_error(self, broker):
+        client = PyDruid(Balancer([unused_url(), broker.url], failure_threshold=1), 'druid/v2/')
+        broker.default_response = (200, {}, [{'result': 1}])
+        for _ in range(3):
+            assert query(client).result == [{'result': 1}]
+        # the dead node was skipped after failing once
+        assert len(broker.requests) == 3
+        assert client.balancer.failovers == 1
+
+    def test_does_not_retry_query_errors(self, broker, broker2):
+        client = PyDruid([broker.url, broker2.url], 'druid/v2/')
+        broker.default_response = (500, {}, {'error': 'Query timeout'})
+        broker2.default_response = (500, {}, {'error': 'Query timeout'})
+        with pytest.raises(QueryError) as e:
+            query(client)
+        assert e.value.status == 500
+        assert e.value.error == 'Query timeout'
+        assert len(broker.requests) + len(broker2.requests) == 1
+
+    def test_deadline_expiry_is_not_a_failure(self, broker):
+        client = PyDruid(Balancer([broker.url], failure_threshold=1), 'druid/v2/', timeout=0.05)
+        broker.default_response = (200, {}, slow(0.5, []))
+        for _ in range(3):
+            with pytest.raises(QueryTimeout):
+                query(client)
+        node, = client.balancer.stats()['nodes']
+        assert node['available'] and node['failures'] == 0
+        assert [request[0] for request in broker.requests].count('POST') == 3
+
+    def test_gives_up(self, broker, broker2):
+        client = PyDruid([broker.url, broker2.url], 'druid/v2/')
+        broker.default_response = (503, {}, b'')
+        broker2.default_response = (502, {}, b'')
+        with pytest.raises(IOError):
+            query(client)
+        assert len(broker.requests) == 1
+        assert len(broker2.requests) == 1
@@ -0,0 +1,65 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import threading
+import time
+
+from pydruid.client import PyDruid
+
+
+def echo(handler, body):
+    return [{'result': json.loads(body.decode('utf-8'))['dataSource']}]
+
+
+class TestRunMany:
+
+    def test_results_in_input_order(self, broker):
+        broker.default_response = (200, {}, echo)
+        client = PyDruid(broker.url, 'druid/v2/')
+        queries = [('time_boundary', {'datasource': 'ds{0}'.format(i)}) for i in range(50)]
+        results = client.run_many(queries, max_concurrency=8)
+        assert [r.result[0]['result'] for r in results] == ['ds{0}'.format(i) for i in range(50)]
+        assert all(r.ok and r.elapsed > 0 for r in results)
+        assert results[3].spec == queries[3]
+        assert results[3].query == {'queryType': 'timeBoundary', 'dataSource': 'ds3'}
+        assert client.result is None and client.query_dict is None
+
+    def test_failures_do_not_abort_batch(self, broker):
+        broker.default_response = (200, {}, echo)
+        broker.respond({'error': 'Query capacity exceeded'}, status=500)
+        client = PyDruid(broker.url, 'druid/v2/')
+        results = client.run_many([
+            ('time_boundary', {'datasource': 'ds0'}),
+            ('time_boundary', {'datasource': 'ds1', 'bogus': 1}),
+            ('no_such_query', {}),
+            ('time_boundary', {'datasource': 'ds3'}),
+        ], max_concurrency=1)
+        assert [r.ok for r in results] == [False, False, False, True]
+        assert 'Query capacity exceeded' in str(results[0].error)
+        assert results[0].query == {'queryType': 'timeBoundary', 'dataSource': 'ds0'}
+        assert isinstance(results[1].error, ValueError) and results[1].query is None
+        assert isinstance(results[2].error, ValueError)
+        assert results[3].result == [{'result': 'ds3'}]
+
+    def test_max_concurrency(self, broker):
+        lock = threading.Lock()
+        state = {'in_flight': 0, 'max': 0}
+
+        def slow(handler, body):
+            with lock:
+                state['in_flight'] += 1
+                state['max'] = max(state['max'], state['in_flight'])
+            time.sleep(0.02)
+            with lock:
+                state['in_flight'] -= 1
+            return []
+
+        broker.default_response = (200, {}, slow)
+        client = PyDruid(broker.url, 'druid/v2/')
+        results = client.run_many([('time_boundary', {'datasource': 'ds'})] * 20,
+                                  max_concurrency=4)
+        assert all(r.ok for r in results)
+        assert 1 < state['max'] <= 4
+
+    def test_empty_batch(self):
+        assert PyDruid('http://localhost:8083', 'druid/v2/').run_many([]) == []
@@ -0,0 +1,261 @@
+# -*- coding: UTF-8 -*-
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from pydruid.cache import IntervalCache, QueryCache
+from pydruid.client import PyDruid
+from pydruid.query import QueryResult
+from pydruid.utils.intervals import format_instant, parse_intervals
+
+
+def create_query(**kwargs):
+    query = {'queryType': 'timeseries', 'dataSource': 'things', 'granularity': 'all',
+             'intervals': '2015-01-01/p1d'}
+    query.update(kwargs)
+    return query
+
+
+def create_result(query, raw=b'[]'):
+    return QueryResult(query, raw, [], 0.1)
+
+
+class TestQueryCache:
+
+    def test_key_is_canonical(self):
+        cache = QueryCache()
+        first = {'queryType': 'timeseries', 'dataSource': 'things', 'context': {'queryId': 'a'}}
+        second = {'dataSource': 'things', 'queryType': 'timeseries',
+                  'context': {'queryId': 'b', 'timeout': 1000}}
+        assert cache.key(first) == cache.key(second)
+        assert cache.key(first) != cache.key(dict(first, context={'finalize': False}))
+
+    def test_hit_and_miss(self):
+        cache = QueryCache()
+        query = create_query()
+        result = create_result(query)
+        assert cache.get(query) is None
+        cache.put(query, result)
+        assert cache.get(dict(query)) is result
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'expirations': 0,
+                                 'entries': 1, 'bytes': 2}
+
+    def test_expiration(self, monkeypatch):
+        now = [2000000000.0]
+        monkeypatch.setattr('pydruid.cache.time.time', lambda: now[0])
+        cache = QueryCache(ttl=10)
+        query = create_query()
+        cache.put(query, create_result(query))
+        now[0] += 5
+        assert cache.get(query) is not None
+        now[0] += 6
+        assert cache.get(query) is None
+        assert (cache.hits, cache.misses, cache.expirations) == (1, 1, 1)
+        assert cache.stats()['entries'] == 0
+
+    def test_evicts_least_recently_used(self):
+        cache = QueryCache(max_entries=2)
+        queries = [create_query(dataSource='ds{0}'.format(i)) for i in range(3)]
+        cache.put(queries[0], create_result(queries[0]))
+        cache.put(queries[1], create_result(queries[1]))
+        cache.get(queries[0])
+        cache.put(queries[2], create_result(queries[2]))
+        assert cache.get(queries[1]) is None
+        assert cache.get(queries[0]) is not None
+        assert cache.get(queries[2]) is not None
+        assert cache.evictions == 1
+
+    def test_evicts_by_size(self):
+        cache = QueryCache(max_bytes=10)
+        first, second = create_query(dataSource='a'), create_query(dataSource='b')
+        cache.put(first, create_result(first, b'x' * 6))
+        cache.put(second, create_result(second, b'x' * 6))
+        assert cache.get(first) is None
+        assert cache.stats()['bytes'] == 6
+        big = create_query(dataSource='c')
+        cache.put(big, create_result(big, b'x' * 11))
+        assert cache.get(big) is None
+        assert cache.get(second) is not None
+
+    def test_context_bypass(self):
+        cache = QueryCache()
+        query = create_query()
+        cache.put(create_query(context={'populateCache': False}), create_result(query))
+        assert cache.stats()['entries'] == 0
+        cache.put(query, create_result(query))
+        assert cache.get(create_query(context={'useCache': False})) is None
+        assert cache.get(query) is not None
+
+    def test_no_context(self):
+        cache = QueryCache()
+        query = create_query(context=None)
+        assert cache.get(query) is None
+        cache.put(query, create_result(query))
+        assert cache.get(query) is not None
+
+    @pytest.mark.parametrize('query', [
+        create_query(intervals='2015-01-01/3000-01-01'),
+        create_query(intervals=['2015-01-01/p1d', 'P1D/3000-01-01']),
+        {'queryType': 'timeBoundary', 'dataSource': 'things'},
+    ])
+    def test_recent_queries_are_not_cached(self, query):
+        cache = QueryCache()
+        cache.put(query, create_result(query))
+        assert cache.get(query) is None
+        cache = QueryCache(cache_recent=True)
+        cache.put(query, create_result(query))
+        assert cache.get(query) is not None
+
+    def test_clear(self):
+        cache = QueryCache()
+        query = create_query()
+        cache.put(query, create_result(query))
+        cache.clear()
+        assert cache.get(query) is None
+        assert cache.stats()['bytes'] == 0
+
+
+class TestClientCache:
+
+    def test_repeated_query_is_served_from_cache(self, broker):
+        broker.default_response = (200, {}, [{'timestamp': '2015-01-01T00:00:00.000Z',
+                                              'result': {'count': 1}}])
+        client = PyDruid(broker.url, 'druid/v2/', cache=QueryCache())
+        kwargs = dict(datasource='things', granularity='all', intervals='2015-01-01/p1d',
+                      aggregations={})
+        first = client.timeseries(**kwargs)
+        second = client.timeseries(**kwargs)
+        assert first == second == [{'timestamp': '2015-01-01T00:00:00.000Z', 'result': {'count': 1}}]
+        assert client.result == second
+        assert len(broker.requests) == 1
+        client.timeseries(context={'useCache': False}, **kwargs)
+        assert len(broker.requests) == 2
+        assert client.cache.hits == 1
+
+
+def hourly_rows(handler, body):
+    # one row per hour of the queried intervals, like a timeseries query with granularity hour
+    rows = []
+    for start, end in parse_intervals(json.loads(body.decode('utf-8'))['intervals']):
+        hour = start.replace(minute=0, second=0, microsecond=0)
+        while hour < end:
+            rows.append({'timestamp': format_instant(hour), 'result': {'hour': hour.hour}})
+            hour += timedelta(hours=1)
+    return rows
+
+
+class TestIntervalCache:
+
+    def test_split_fetches_only_missing_buckets(self):
+        cache = IntervalCache()
+        query = create_query(granularity='hour', intervals='2015-01-01T00:30/2015-01-01T05')
+        split = cache.split(query)
+        assert split.query['intervals'] == ['2015-01-01T00:30:00.000Z/2015-01-01T05:00:00.000Z']
+        fetched = hourly_rows(None, json.dumps(split.query).encode('utf-8'))
+        result = split.stitch(QueryResult(split.query, b'', fetched, 0.1))
+        assert [row['result']['hour'] for row in result] == [0, 1, 2, 3, 4]
+        assert result.query is query
+        assert cache.stats()['buckets'] == 4
+
+        # a window sliding by an hour only fetches the partial first hour and the new last hour
+        query = create_query(granularity='HOUR', intervals='2015-01-01T01:30/2015-01-01T06')
+        split = cache.split(query)
+        assert split.query['intervals'] == ['2015-01-01T01:30:00.000Z/2015-01-01T02:00:00.000Z',
+                                            '2015-01-01T05:00:00.000Z/2015-01-01T06:00:00.000Z']
+        fetched = hourly_rows(None, json.dumps(split.query).encode('utf-8'))
+        result = split.stitch(QueryResult(split.query, b'', fetched, 0.1))
+        assert [row['result']['hour'] for row in result] == [1, 2, 3, 4, 5]
+        assert json.loads(result.result_json.decode('utf-8')) == list(result)
+        assert (cache.hits, cache.misses) == (3, 5)
+
+    def test_fully_cached(self):
+        cache = IntervalCache()
+        query = create_query(granularity='day', intervals=['2015-01-01/P1D', '2015-01-02/P1D'],
+                             descending=True)
+        split = cache.split(query)
+        assert split.query['intervals'] == ['2015-01-01T00:00:00.000Z/2015-01-03T00:00:00.000Z']
+        split.stitch(QueryResult(split.query, b'', [
+            {'timestamp': '2015-01-02T00:00:00.000Z', 'result': {'count': 2}}], 0.1))
+        split = cache.split(query)
+        assert split.query is None
+        result = split.stitch()
+        # the empty first day was cached too
+        assert list(result) == [{'timestamp': '2015-01-02T00:00:00.000Z', 'result': {'count': 2}}]
+
+    def test_groupby_keeps_row_order_within_buckets(self):
+        cache = IntervalCache()
+        query = create_query(queryType='groupBy', granularity='day', intervals='2015-01-01/P2D')
+        rows = [{'timestamp': '2015-01-0{0}T00:00:00.000Z'.format(day), 'event': {'dim': dim}}
+                for day in (1, 2) for dim in ('b', 'a')]
+        split = cache.split(dict(query, intervals='2015-01-02/P1D'))
+        split.stitch(QueryResult(split.query, b'', rows[2:], 0.1))
+        split = cache.split(query)
+        assert split.query['intervals'] == ['2015-01-01T00:00:00.000Z/2015-01-02T00:00:00.000Z']
+        assert list(split.stitch(QueryResult(split.query, b'', rows[:2], 0.1))) == rows
+
+    @pytest.mark.parametrize('query', [
+        create_query(queryType='topN', granularity='hour'),
+        create_query(granularity='all'),
+        create_query(granularity={'type': 'period', 'period': 'PT1H'}),
+        create_query(queryType='groupBy', granularity='hour', limitSpec={'type': 'default', 'limit': 5}),
+        create_query(granularity='hour', context={'grandTotal': True}),
+        create_query(granularity='hour', intervals='bogus'),
+        create_query(granularity='second', intervals='2015-01-01/P1Y'),
+    ])
+    def test_unsupported_queries(self, query):
+        assert IntervalCache(max_buckets=1000).split(query) is None
+
+    def test_recent_buckets_are_not_cached(self, monkeypatch):
+        now = datetime(2015, 1, 1, 3, 30)
+        monkeypatch.setattr('pydruid.cache._utcnow', lambda: now)
+        cache = IntervalCache(min_age=3600)
+        split = cache.split(create_query(granularity='hour', intervals='2015-01-01/P1D'))
+        split.stitch(QueryResult(split.query, b'', [], 0.1))
+        # only hours that ended at least an hour ago
+        assert cache.stats()['buckets'] == 2
+
+    def test_expiration_and_eviction(self, monkeypatch):
+        now = [2000000000.0]
+        monkeypatch.setattr('pydruid.cache.time.time', lambda: now[0])
+        cache = IntervalCache(max_buckets=3, ttl=10)
+        first = create_query(granularity='day', intervals='2015-01-01/P2D')
+        split = cache.split(first)
+        split.stitch(QueryResult(split.query, b'', [], 0.1))
+        now[0] += 11
+        assert cache.split(first).query is not None
+        assert cache.expirations == 2
+
+        split = cache.split(first)
+        split.stitch(QueryResult(split.query, b'', [], 0.1))
+        second = create_query(dataSource='other', granularity='day', intervals='2015-01-01/P2D')
+        split = cache.split(second)
+        split.stitch(QueryResult(split.query, b'', [], 0.1))
+        assert cache.evictions == 2
+        assert cache.stats()['queries'] == 1
+        assert cache.split(second).query is None
+
+    def test_context_bypass(self):
+        cache = IntervalCache()
+        query = create_query(granularity='day', context={'populateCache': False})
+        split = cache.split(query)
+        split.stitch(QueryResult(split.query, b'', [], 0.1))
+        assert cache.stats()['buckets'] == 0
+        split = cache.split(create_query(granularity='day'))
+        split.stitch(QueryResult(split.query, b'', [], 0.1))
+        assert cache.split(create_query(granularity='day', context={'useCache': False})).query is not None
+
+    def test_client(self, broker):
+        broker.default_response = (200, {}, hourly_rows)
+        client = PyDruid(broker.url, 'druid/v2/', interval_cache=IntervalCache())
+        for end in range(5, 8):
+            result = client.timeseries(datasource='things', granularity='hour', aggregations={},
+                                       intervals='2015-01-01T00:00/2015-01-01T0{0}'.format(end))
+            assert [row['result']['hour'] for row in result] == list(range(end))
+            assert client.result == list(result)
+        assert [broker.query(i)['intervals'] for i in range(3)] == [
+            ['2015-01-01T00:00:00.000Z/2015-01-01T05:00:00.000Z'],
+            ['2015-01-01T05:00:00.000Z/2015-01-01T06:00:00.000Z'],
+            ['2015-01-01T06:00:00.000Z/2015-01-01T07:00:00.000Z'],
+        ]
@@ -1,5 +1,6 @@
 # -*- coding: UTF-8 -*-
 
+import json
 import os
 import pytest
 
@@ -15,6 +16,7 @@ from pydruid.utils import aggregators
 from pydruid.utils import postaggregator
 from pydruid.utils import filters
 from pydruid.utils import having
+from pydruid.utils import compression
 
 
 def create_client():
@@ -81,6 +83,19 @@ class TestClient:
         }
         assert client.query_dict == expected_query_dict
 
+    def test_build_query_leaves_specs_alone(self):
+        client = create_client()
+        ratio = postaggregator.Field('sum') / postaggregator.Field('count')
+        args = {'datasource': 'things', 'post_aggregations': {'avg': ratio},
+                'having': having.Aggregation('sum') > 1}
+        client.build_query(args)
+        first = client.query_dict
+        client.build_query(dict(args, post_aggregations={'other': ratio}))
+        assert first['postAggregations'][0]['name'] == 'avg'
+        assert client.query_dict['postAggregations'][0]['name'] == 'other'
+        assert ratio.post_aggregator['name'] == 'sumdivcount'
+        assert hash(client.query_dict['having']) == hash(first['having'])
+
     def test_validate_query(self):
         client = create_client()
         client.validate_query(['validkey'], {'validkey': 'value'})
@@ -106,3 +121,192 @@ class TestClient:
             'value2': '㬓',
         }])
         assert_frame_equal(df, expected_df)
+
+    def test_query_over_pool(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/')
+        broker.respond([{'timestamp': '2015-01-01T00:00:00.000Z', 'result': {'count': 1}}])
+        broker.respond([{'timestamp': '2015-01-02T00:00:00.000Z', 'result': {'count': 2}}])
+        for expected in (1, 2):
+            result = client.timeseries(
+                datasource='things', granularity='all', intervals='2015-01-01/p1d',
+                aggregations={'count': aggregators.count('thing')})
+            assert result[0]['result']['count'] == expected
+        assert broker.requests[0][1] == '/druid/v2/'
+        assert broker.query()['queryType'] == 'timeseries'
+        assert len(broker.client_ports) == 1
+
+    def test_druid_error(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/')
+        broker.respond({'error': 'Unknown exception'}, status=500)
+        with pytest.raises(IOError) as excinfo:
+            client.time_boundary(datasource='things')
+        assert 'Druid Error: Unknown exception' in str(excinfo.value)
+
+    def test_compressed_response(self, broker):
+        rows = [{'timestamp': '2015-01-01T00:00:00.000Z', 'result': {'count': i}} for i in range(1000)]
+        broker.respond(compression.gzip_compress(json.dumps(rows).encode('utf-8')),
+                       headers={'Content-Encoding': 'gzip'})
+        client = PyDruid(broker.url, 'druid/v2/')
+        result = client.timeseries(datasource='things', granularity='all', intervals='2015-01-01/p1d')
+        assert result == rows
+        assert result.uncompressed_bytes == len(result.result_json) == len(json.dumps(rows))
+        assert result.compressed_bytes < result.uncompressed_bytes / 5
+        assert broker.requests[0][2]['Accept-Encoding'] == 'gzip, deflate'
+        # the connection is reused after the compressed body was read
+        client.time_boundary(datasource='things')
+        assert len(broker.client_ports) == 1
+
+    def test_compressed_stream(self, broker):
+        rows = [{'timestamp': 't', 'result': {'count': i}} for i in range(10000)]
+        broker.respond(compression.gzip_compress(json.dumps(rows).encode('utf-8')),
+                       headers={'Content-Encoding': 'gzip'})
+        client = PyDruid(broker.url, 'druid/v2/')
+        streamed = client.stream('timeseries', datasource='things', granularity='minute',
+                                 intervals='2013-06-14/p1d')
+        assert list(streamed) == [{'timestamp': 't', 'count': i} for i in range(10000)]
+
+    def test_compressed_error(self, broker):
+        broker.respond(compression.gzip_compress(b'{"error": "Query timeout"}'), status=500,
+                       headers={'Content-Encoding': 'gzip'})
+        client = PyDruid(broker.url, 'druid/v2/')
+        with pytest.raises(IOError) as excinfo:
+            client.time_boundary(datasource='things')
+        assert 'Druid Error: Query timeout' in str(excinfo.value)
+
+    def test_compressed_request(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/', compression=False, compress_request_size=200)
+        client.time_boundary(datasource='things')
+        client.time_boundary(datasource='things', context={'x' * 500: 1})
+        (_, _, small_headers, small), (_, _, large_headers, large) = broker.requests
+        assert 'Content-Encoding' not in small_headers
+        assert 'gzip' not in small_headers.get('Accept-Encoding', '')
+        assert large_headers['Content-Encoding'] == 'gzip'
+        assert len(large) < 200
+        query = json.loads(compression.decompress(large, 'gzip').decode('utf-8'))
+        assert query['context'] == {'x' * 500: 1}
+
+    def test_stream_select(self, broker):
+        broker.respond([{
+            'timestamp': '2013-06-14T00:00:00.000Z',
+            'result': {
+                'pagingIdentifiers': {'seg': 1},
+                'events': [
+                    {'segmentId': 'seg', 'offset': 0, 'event': {'timestamp': 't0', 'dim': 'a'}},
+                    {'segmentId': 'seg', 'offset': 1, 'event': {'timestamp': 't1', 'dim': 'b'}},
+                ]}}])
+        client = PyDruid(broker.url, 'druid/v2/')
+        rows = client.stream('select', datasource='things', granularity='all',
+                             intervals='2013-06-14/pt1h',
+                             paging_spec={'pagingIdentifiers': {}, 'threshold': 2})
+        assert list(rows) == [{'timestamp': 't0', 'dim': 'a'}, {'timestamp': 't1', 'dim': 'b'}]
+        assert broker.query()['queryType'] == 'select'
+        assert client.result is None
+
+    def test_stream_topn(self, broker):
+        broker.respond([
+            {'timestamp': 't0', 'result': [{'count': 2, 'dim': 'a'}, {'count': 1, 'dim': 'b'}]},
+            {'timestamp': 't1', 'result': [{'count': 3, 'dim': 'c'}]},
+        ])
+        client = PyDruid(broker.url, 'druid/v2/')
+        rows = client.stream('topn', datasource='things', granularity='day',
+                             intervals='2013-06-14/p2d', dimension='dim', metric='count',
+                             threshold=2, aggregations={'count': aggregators.count('count')})
+        assert list(rows) == [
+            {'timestamp': 't0', 'count': 2, 'dim': 'a'},
+            {'timestamp': 't0', 'count': 1, 'dim': 'b'},
+            {'timestamp': 't1', 'count': 3, 'dim': 'c'},
+        ]
+
+    def test_stream_stops_early(self, broker):
+        broker.respond([{'timestamp': 't', 'result': {'count': i}} for i in range(100000)])
+        client = PyDruid(broker.url, 'druid/v2/')
+        rows = client.stream('timeseries', datasource='things', granularity='minute',
+                             intervals='2013-06-14/p1d')
+        assert next(rows) == {'timestamp': 't', 'count': 0}
+        rows.close()
+        # the half-read connection is not reused
+        client.time_boundary(datasource='things')
+        assert len(broker.client_ports) == 2
+
+    def test_stream_error(self, broker):
+        broker.respond({'error': 'Unknown exception'}, status=500)
+        client = PyDruid(broker.url, 'druid/v2/')
+        with pytest.raises(IOError):
+            client.stream('time_boundary', datasource='things')
+
+    def test_export_stream(self, broker, tmpdir):
+        broker.respond([
+            {'timestamp': 't0', 'result': [{'count': 2, 'dim': 'a'}, {'count': 1, 'dim': '㬓'}]},
+            {'timestamp': 't1', 'result': [{'count': 3, 'dim': 'c'}]},
+        ])
+        client = PyDruid(broker.url, 'druid/v2/')
+        file_path = tmpdir.join('out.csv')
+        rows = client.export_stream(str(file_path), 'topn', columns=['timestamp', 'dim', 'count'],
+                                    dialect='excel', datasource='things', granularity='day',
+                                    intervals='2013-06-14/p2d', dimension='dim', metric='count',
+                                    threshold=2, aggregations={'count': aggregators.count('count')})
+        assert rows == 3
+        assert file_path.read_binary().decode('utf-8') == (
+            'timestamp,dim,count\r\nt0,a,2\r\nt0,㬓,1\r\nt1,c,3\r\n')
+
+    def paging_broker(self, broker, segments):
+        # answers select queries from {segment: number of events}, honouring pagingSpec
+        def select(handler, body):
+            spec = json.loads(body.decode('utf-8'))['pagingSpec']
+            identifiers = spec['pagingIdentifiers']
+            events = []
+            for segment in sorted(segments):
+                start = identifiers.get(segment, 0)
+                for offset in range(start, segments[segment]):
+                    if len(events) == spec['threshold']:
+                        break
+                    events.append({'segmentId': segment, 'offset': offset,
+                                   'event': {'segment': segment, 'offset': offset}})
+            last = {}
+            for event in events:
+                last[event['segmentId']] = event['offset']
+            return [{'timestamp': 't', 'result': {'pagingIdentifiers': last, 'events': events}}]
+
+        broker.default_response = (200, {}, select)
+
+    @pytest.mark.parametrize('prefetch', [True, False])
+    def test_select_iter(self, broker, prefetch):
+        self.paging_broker(broker, {'seg_a': 7, 'seg_b': 5})
+        client = PyDruid(broker.url, 'druid/v2/')
+        events = list(client.select_iter(datasource='things', granularity='all',
+                                         intervals='2013-06-14/p1d', threshold=5,
+                                         prefetch=prefetch))
+        assert events == ([{'segment': 'seg_a', 'offset': i} for i in range(7)] +
+                          [{'segment': 'seg_b', 'offset': i} for i in range(5)])
+        # three full pages, then an empty one
+        assert len(broker.requests) == 4
+        assert broker.query(1)['pagingSpec'] == {'pagingIdentifiers': {'seg_a': 5}, 'threshold': 5}
+        assert client.result is None
+
+    def test_select_iter_max_rows(self, broker):
+        self.paging_broker(broker, {'seg_a': 100})
+        client = PyDruid(broker.url, 'druid/v2/')
+        events = list(client.select_iter(datasource='things', granularity='all',
+                                         intervals='2013-06-14/p1d', threshold=4, max_rows=10))
+        assert events == [{'segment': 'seg_a', 'offset': i} for i in range(10)]
+        assert [broker.query(i)['pagingSpec']['threshold'] for i in range(3)] == [4, 4, 2]
+        assert len(broker.requests) == 3
+
+    def test_select_iter_paging_spec(self, broker):
+        broker.respond([{'timestamp': 't', 'result': {'pagingIdentifiers': {'seg_a': 3}, 'events': [
+            {'segmentId': 'seg_a', 'offset': 3, 'event': {'offset': 3}}]}}])
+        broker.respond([{'timestamp': 't', 'result': {'pagingIdentifiers': {}, 'events': []}}])
+        client = PyDruid(broker.url, 'druid/v2/')
+        events = list(client.select_iter(
+            datasource='things', granularity='all', intervals='2013-06-14/p1d',
+            paging_spec={'pagingIdentifiers': {'seg_a': 3}, 'threshold': 1, 'fromNext': True}))
+        assert events == [{'offset': 3}]
+        assert broker.query(0)['pagingSpec'] == {
+            'pagingIdentifiers': {'seg_a': 3}, 'threshold': 1, 'fromNext': True}
+        assert broker.query(1)['pagingSpec'] == {
+            'pagingIdentifiers': {'seg_a': 3}, 'threshold': 1, 'fromNext': True}
+
+    def test_select_iter_invalid(self):
+        client = create_client()
+        with pytest.raises(ValueError):
+            client.select_iter(datasource='things', bogus=1)
@@ -0,0 +1,105 @@
+# -*- coding: UTF-8 -*-
+
+import pytest
+
+from pydruid import codec
+from pydruid.client import PyDruid
+from pydruid.utils import smile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CODECS = [codec.JSONCodec]
+if codec.orjson is not None:
+    CODECS.append(codec.OrjsonCodec)
+if codec.ujson is not None:
+    CODECS.append(codec.UjsonCodec)
+
+
+class TestCodecs:
+
+    @pytest.mark.parametrize('codec_class', CODECS)
+    def test_round_trip(self, codec_class):
+        c = codec_class()
+        query = {'queryType': 'topN', 'filter': {'type': 'selector', 'value': '㬓'},
+                 'threshold': 5, 'intervals': ['2015-01-01/p1d'], 'context': {'finalize': True}}
+        data = c.dumps(query)
+        assert isinstance(data, bytes)
+        assert c.loads(data) == query
+        assert c.loads(data.decode('utf-8')) == query
+
+    @pytest.mark.parametrize('codec_class', CODECS)
+    def test_invalid(self, codec_class):
+        with pytest.raises(ValueError):
+            codec_class().loads(b'[{"timestamp"')
+
+    @pytest.mark.skipif(codec.orjson is None or numpy is None, reason="requires orjson and numpy")
+    def test_orjson_numpy(self):
+        data = codec.OrjsonCodec().dumps({'values': numpy.array([1, 2]), 'n': numpy.int64(3)})
+        assert data == b'{"values":[1,2],"n":3}'
+
+    def test_unavailable(self, monkeypatch):
+        monkeypatch.setattr(codec, 'orjson', None)
+        monkeypatch.setattr(codec, 'ujson', None)
+        with pytest.raises(ImportError):
+            codec.OrjsonCodec()
+        with pytest.raises(ImportError):
+            codec.UjsonCodec()
+        assert type(codec.default_codec()) is codec.JSONCodec
+
+    @pytest.mark.skipif(codec.orjson is None, reason="requires orjson")
+    def test_default_prefers_orjson(self):
+        assert type(codec.default_codec()) is codec.OrjsonCodec
+
+
+class TestClientCodec:
+
+    def test_custom_codec(self, broker):
+        class CountingCodec(codec.JSONCodec):
+            calls = 0
+
+            def loads(self, data):
+                self.calls += 1
+                return codec.JSONCodec.loads(self, data)
+
+        broker.respond([{'timestamp': '2015-01-01T00:00:00.000Z', 'result': {'count': 1}}])
+        c = CountingCodec()
+        client = PyDruid(broker.url, 'druid/v2/', codec=c)
+        result = client.timeseries(datasource='things', granularity='all',
+                                   intervals='2015-01-01/p1d')
+        assert result == [{'timestamp': '2015-01-01T00:00:00.000Z', 'result': {'count': 1}}]
+        assert c.calls == 1
+        assert broker.query()['dataSource'] == 'things'
+
+    def test_smile(self, broker):
+        rows = [{'timestamp': '2015-01-01T00:00:00.000Z', 'result': {'count': i}} for i in range(100)]
+        broker.respond(smile.dumps(rows), headers={'Content-Type': smile.CONTENT_TYPE})
+        client = PyDruid(broker.url, 'druid/v2/', codec=codec.SmileCodec())
+        result = client.timeseries(datasource='things', granularity='all',
+                                   intervals='2015-01-01/p1d')
+        assert result == rows
+        assert result.result_json[:3] == smile.HEADER
+        assert broker.requests[0][2]['Accept'] == smile.CONTENT_TYPE
+        assert broker.query()['dataSource'] == 'things'
+
+    def test_smile_falls_back_to_json(self, broker):
+        broker.respond([{'timestamp': 't', 'result': {'count': 1}}])
+        client = PyDruid(broker.url, 'druid/v2/', codec=codec.SmileCodec())
+        assert client.time_boundary(datasource='things') == [{'timestamp': 't', 'result': {'count': 1}}]
+
+    def test_smile_error(self, broker):
+        broker.respond(smile.dumps({'error': 'Query timeout'}), status=500)
+        client = PyDruid(broker.url, 'druid/v2/', codec=codec.SmileCodec())
+        with pytest.raises(IOError) as excinfo:
+            client.time_boundary(datasource='things')
+        assert 'Druid Error: Query timeout' in str(excinfo.value)
+
+    def test_smile_stream_asks_for_json(self, broker):
+        broker.respond([{'timestamp': 't', 'result': {'count': 1}}])
+        client = PyDruid(broker.url, 'druid/v2/', codec=codec.SmileCodec())
+        rows = client.stream('timeseries', datasource='things', granularity='all',
+                             intervals='2015-01-01/p1d')
+        assert list(rows) == [{'timestamp': 't', 'count': 1}]
+        assert broker.requests[0][2]['Accept'] == 'application/json'
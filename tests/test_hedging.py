@@ -0,0 +1,125 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import time
+
+import pytest
+
+from pydruid.client import PyDruid
+from pydruid.hedging import Hedging, with_query_id
+
+from conftest import deletes, slow
+
+
+def query(client):
+    return client.time_boundary(datasource='test')
+
+
+class TestHedging:
+
+    def test_initial_delay(self):
+        hedging = Hedging(initial_delay=0.5, min_samples=3)
+        hedging.record('topN', 0.1)
+        assert hedging.delay('topN') == 0.5
+
+    def test_percentile(self):
+        hedging = Hedging(percentile=90, min_samples=10)
+        for i in range(1, 11):
+            hedging.record('topN', i / 10.0)
+        assert hedging.delay('topN') == 0.9
+        assert hedging.delay('groupBy') == hedging.initial_delay
+
+    def test_window(self):
+        hedging = Hedging(percentile=100, window=2, min_samples=1)
+        for elapsed in (5.0, 0.2, 0.3):
+            hedging.record('topN', elapsed)
+        assert hedging.delay('topN') == 0.3
+
+    def test_bounds(self):
+        hedging = Hedging(min_samples=1, min_delay=0.05, max_delay=1.0)
+        hedging.record('topN', 0.001)
+        assert hedging.delay('topN') == 0.05
+        hedging = Hedging(min_samples=1, min_delay=0.05, max_delay=1.0)
+        hedging.record('topN', 30)
+        assert hedging.delay('topN') == 1.0
+
+    def test_counters(self):
+        hedging = Hedging(min_samples=1)
+        hedging.issue()
+        hedging.record('topN', 0.5, won=True)
+        assert hedging.stats() == {'issued': 1, 'won': 1, 'delays': {'topN': 0.5}}
+
+    def test_applies(self):
+        hedging = Hedging(query_types=['topN'])
+        assert hedging.applies({'queryType': 'topN'})
+        assert not hedging.applies({'queryType': 'groupBy'})
+
+    def test_invalid_percentile(self):
+        with pytest.raises(ValueError):
+            Hedging(percentile=0)
+
+    def test_with_query_id(self):
+        query = {'queryType': 'topN', 'context': {'timeout': 100}}
+        copy, query_id = with_query_id(query)
+        assert copy['context'] == {'timeout': 100, 'queryId': query_id}
+        assert query == {'queryType': 'topN', 'context': {'timeout': 100}}
+        assert with_query_id(copy)[1] == query_id
+        assert with_query_id({}, 'q1') == ({'context': {'queryId': 'q1'}}, 'q1')
+
+
+class TestHedgedRequests:
+
+    def test_hedge_wins(self, broker, broker2):
+        hedging = Hedging(initial_delay=0.05)
+        client = PyDruid([broker.url, broker2.url], 'druid/v2/', hedging=hedging)
+        broker.default_response = (200, {}, slow(1.0, [{'slow': True}]))
+        broker2.default_response = (200, {}, [{'slow': False}])
+
+        assert query(client).result == [{'slow': False}]
+        assert (hedging.issued, hedging.won) == (1, 1)
+        query_id = broker.query(0)['context']['queryId']
+        assert broker2.query(0)['context']['queryId'] == query_id + '-hedge'
+        assert deletes(broker) == ['/druid/v2/' + query_id]
+        assert 'queryId' not in client.query_dict.get('context', {})
+
+    def test_no_hedge_when_fast(self, broker, broker2):
+        hedging = Hedging(initial_delay=1.0)
+        client = PyDruid([broker.url, broker2.url], 'druid/v2/', hedging=hedging)
+        broker.default_response = (200, {}, [{'result': 1}])
+        assert query(client).result == [{'result': 1}]
+        assert hedging.issued == 0
+        assert broker2.requests == []
+        assert hedging.stats()['delays'].keys() == {'timeBoundary'}
+
+    def test_primary_wins(self, broker, broker2):
+        hedging = Hedging(initial_delay=0.05)
+        client = PyDruid([broker.url, broker2.url], 'druid/v2/', hedging=hedging)
+        broker.default_response = (200, {}, slow(0.2, [{'slow': False}]))
+        broker2.default_response = (200, {}, slow(1.0, [{'slow': True}]))
+        assert query(client).result == [{'slow': False}]
+        assert (hedging.issued, hedging.won) == (1, 0)
+        assert deletes(broker2)[0].endswith('-hedge')
+
+    def test_single_broker(self, broker):
+        calls = []
+
+        def respond(handler, body):
+            if handler.command == 'POST':
+                calls.append(body)
+                if len(calls) == 1:
+                    time.sleep(1.0)
+            return json.dumps([{'call': len(calls)}]).encode('utf-8')
+
+        hedging = Hedging(initial_delay=0.05)
+        client = PyDruid(broker.url, 'druid/v2/', hedging=hedging)
+        broker.default_response = (200, {}, respond)
+        assert query(client).result == [{'call': 2}]
+        assert hedging.won == 1
+
+    def test_error_before_delay(self, broker, broker2):
+        hedging = Hedging(initial_delay=1.0)
+        client = PyDruid([broker.url, broker2.url], 'druid/v2/', hedging=hedging)
+        broker.default_response = (500, {}, {'error': 'Unknown exception'})
+        with pytest.raises(IOError):
+            query(client)
+        assert hedging.issued == 0
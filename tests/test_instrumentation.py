@@ -0,0 +1,160 @@
+# -*- coding: UTF-8 -*-
+
+
+import pytest
+
+from pydruid.cache import IntervalCache, QueryCache
+from pydruid.client import PyDruid, QueryError
+from pydruid.hedging import Hedging
+from pydruid.instrumentation import QueryListener, QueryMetrics
+from pydruid.query import count_rows
+from pydruid.retry import RetryPolicy
+
+TOPN_RESULT = [
+    {'timestamp': '2015-12-30T14:14:49.000Z', 'result': [{'dim': 'a', 'c': 1}, {'dim': 'b', 'c': 2}]},
+    {'timestamp': '2015-12-31T14:14:49.000Z', 'result': [{'dim': 'c', 'c': 3}]},
+]
+
+DRUID_HEADERS = {'X-Druid-Query-Id': 'q1',
+                 'X-Druid-Response-Context': '{"missingSegments": ["s1"]}'}
+
+
+class Recorder(QueryListener):
+    def __init__(self):
+        self.started = []
+        self.finished = []
+
+    def query_started(self, query):
+        self.started.append(query)
+
+    def query_finished(self, metrics):
+        self.finished.append(metrics)
+
+
+def topn(client):
+    return client.topn(datasource='test', granularity='all', intervals='2015-12-29/pt1h',
+                       dimension='dim', metric='c', threshold=2)
+
+
+class TestCountRows:
+
+    def test_count_rows(self):
+        assert count_rows('topN', TOPN_RESULT) == 3
+        assert count_rows('timeseries', [{'result': {}}, {'result': {}}]) == 2
+        assert count_rows('groupBy', [{'event': {}}]) == 1
+        assert count_rows('select', [{'result': {'events': [{}, {}]}}]) == 2
+        assert count_rows('timeBoundary', [{}]) == 1
+        assert count_rows('topN', {'unexpected': True}) == 0
+
+
+class TestQueryMetrics:
+
+    def test_phases(self, broker):
+        recorder = Recorder()
+        client = PyDruid(broker.url, 'druid/v2/', listeners=[recorder])
+        broker.respond(TOPN_RESULT, headers=DRUID_HEADERS)
+        result = topn(client)
+
+        assert recorder.started == [result.query]
+        metrics, = recorder.finished
+        assert result.metrics is metrics
+        assert metrics.query_type == 'topN'
+        assert metrics.datasource == 'test'
+        assert metrics.rows == 3
+        assert metrics.broker == broker.url + '/druid/v2/'
+        assert metrics.query_id == 'q1'
+        assert metrics.response_context == {'missingSegments': ['s1']}
+        assert metrics.request_bytes == len(broker.requests[0][3])
+        assert metrics.response_bytes == metrics.uncompressed_bytes > 0
+        assert metrics.error is None and not metrics.cached
+        phases = [metrics.build, metrics.serialize, metrics.connect, metrics.ttfb,
+                  metrics.download, metrics.parse]
+        assert all(phase >= 0 for phase in phases)
+        assert metrics.total >= sum(phases) - 0.001
+        assert 'query' not in metrics.as_dict()
+        assert metrics.as_dict()['rows'] == 3
+
+    def test_error(self, broker):
+        recorder = Recorder()
+        client = PyDruid(broker.url, 'druid/v2/', listeners=[recorder],
+                         retry_policy=RetryPolicy(backoff=0.01))
+        broker.respond(b'', status=503)
+        broker.respond({'error': 'Unknown exception'}, status=400)
+        with pytest.raises(QueryError) as e:
+            topn(client)
+        metrics, = recorder.finished
+        assert metrics.error is e.value
+        assert metrics.rows == 0
+
+    def test_retries(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/', retry_policy=RetryPolicy(backoff=0.01))
+        broker.respond(b'', status=503)
+        broker.respond(TOPN_RESULT)
+        assert topn(client).metrics.retries == 1
+
+    def test_cached(self, broker):
+        recorder = Recorder()
+        client = PyDruid(broker.url, 'druid/v2/', cache=QueryCache(), listeners=[recorder])
+        broker.respond(TOPN_RESULT)
+        fetched = topn(client)
+        cached = topn(client)
+        first, second = recorder.finished
+        assert fetched.metrics is first and cached.metrics is second
+        assert not first.cached and second.cached
+        assert second.rows == 3
+        assert second.broker is None
+        assert cached == fetched
+        assert len(broker.requests) == 1
+
+    def test_interval_cached(self, broker):
+        recorder = Recorder()
+        client = PyDruid(broker.url, 'druid/v2/', interval_cache=IntervalCache(),
+                         listeners=[recorder])
+        broker.respond([{'timestamp': '2015-01-01T00:00:00.000Z', 'result': {'c': 1}}])
+        for _ in range(2):
+            result = client.timeseries(datasource='test', granularity='day',
+                                       intervals='2015-01-01/p1d')
+        assert len(broker.requests) == 1
+        assert len(recorder.started) == 2
+        first, second = recorder.finished
+        assert not first.cached and second.cached
+        assert result.metrics is second
+        assert second.rows == 1 and second.error is None
+
+    def test_stream(self, broker):
+        recorder = Recorder()
+        client = PyDruid(broker.url, 'druid/v2/', listeners=[recorder])
+        broker.respond(TOPN_RESULT, headers=DRUID_HEADERS)
+        broker.respond(TOPN_RESULT)
+        broker.respond({'error': 'Unknown exception'}, status=400)
+        args = dict(datasource='test', granularity='all', intervals='2015-12-29/pt1h',
+                    dimension='dim', metric='c', threshold=2)
+
+        rows = client.stream('topn', **args)
+        assert not recorder.finished
+        assert len(list(rows)) == 3
+        metrics, = recorder.finished
+        assert recorder.started == [metrics.query]
+        assert metrics.rows == 3 and metrics.error is None
+        assert metrics.query_id == 'q1'
+        assert metrics.ttfb >= 0 and metrics.download >= 0
+
+        rows = client.stream('topn', **args)
+        next(rows)
+        rows.close()
+        assert recorder.finished[1].rows == 1
+
+        with pytest.raises(QueryError) as e:
+            client.stream('topn', **args)
+        assert recorder.finished[2].error is e.value
+        assert len(recorder.started) == 3
+
+    def test_hedged(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/', hedging=Hedging(initial_delay=5.0))
+        broker.respond(TOPN_RESULT, headers=DRUID_HEADERS)
+        metrics = topn(client).metrics
+        assert metrics.query_id == 'q1'
+        assert metrics.response_bytes > 0
+
+    def test_repr(self):
+        assert repr(QueryMetrics({'queryType': 'topN'})).startswith('QueryMetrics(topN')
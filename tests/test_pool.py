@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+
+import socket
+import time
+
+import pytest
+
+from pydruid.pool import ConnectionPool, _is_alive
+
+
+class TestConnectionPool:
+
+    def test_reuses_connection(self, broker):
+        pool = ConnectionPool()
+        for _ in range(3):
+            res = pool.urlopen('POST', broker.url + '/druid/v2/', b'{}')
+            assert res.status == 200
+            assert res.read() == b'[]'
+        assert len(broker.client_ports) == 1
+
+    def test_unread_response_is_not_reused(self, broker):
+        pool = ConnectionPool()
+        pool.urlopen('POST', broker.url + '/druid/v2/', b'{}').close()
+        pool.urlopen('POST', broker.url + '/druid/v2/', b'{}').read()
+        assert len(broker.client_ports) == 2
+
+    def test_idle_timeout(self, broker):
+        pool = ConnectionPool(idle_timeout=0)
+        pool.urlopen('POST', broker.url + '/druid/v2/', b'{}').read()
+        time.sleep(0.01)
+        pool.urlopen('POST', broker.url + '/druid/v2/', b'{}').read()
+        assert len(broker.client_ports) == 2
+
+    def test_connection_close_is_not_pooled(self, broker):
+        pool = ConnectionPool()
+        broker.respond(b'[]', headers={'Connection': 'close'})
+        pool.urlopen('POST', broker.url + '/druid/v2/', b'{}').read()
+        pool.urlopen('POST', broker.url + '/druid/v2/', b'{}').read()
+        assert len(broker.client_ports) == 2
+
+    def test_max_connections(self, broker):
+        pool = ConnectionPool(max_connections=1)
+        responses = [pool.urlopen('POST', broker.url + '/druid/v2/', b'{}')
+                     for _ in range(3)]
+        for res in responses:
+            res.read()
+        assert len(broker.client_ports) == 3
+        assert sum(len(conns) for conns in pool._idle.values()) == 1
+
+    def test_clear(self, broker):
+        pool = ConnectionPool()
+        pool.urlopen('POST', broker.url + '/druid/v2/', b'{}').read()
+        pool.clear()
+        pool.urlopen('POST', broker.url + '/druid/v2/', b'{}').read()
+        assert len(broker.client_ports) == 2
+
+    def test_request_timeout(self, broker):
+        def respond(handler, body):
+            time.sleep(0.5)
+            return b'[]'
+
+        broker.default_response = (200, {}, respond)
+        pool = ConnectionPool()
+        with pytest.raises(socket.timeout):
+            pool.urlopen('POST', broker.url + '/druid/v2/', b'{}', timeout=0.1)
+
+
+class TestHealthCheck:
+
+    class Conn:
+        def __init__(self, sock):
+            self.sock = sock
+
+    def test_is_alive(self):
+        ours, theirs = socket.socketpair()
+        try:
+            assert _is_alive(self.Conn(ours))
+            theirs.close()
+            assert not _is_alive(self.Conn(ours))
+        finally:
+            ours.close()
+
+    def test_unconnected_is_not_alive(self):
+        assert not _is_alive(self.Conn(None))
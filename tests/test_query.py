@@ -0,0 +1,238 @@
+# -*- coding: UTF-8 -*-
+
+import copy
+import os
+import pickle
+import threading
+
+import pytest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from six import PY3
+from pydruid.client import PyDruid
+from pydruid.query import QueryResult
+
+
+def create_result(query_type='timeseries', rows=None):
+    rows = rows if rows is not None else [
+        {'result': {'value1': 1}, 'timestamp': '2015-01-01T00:00:00.000-05:00'},
+        {'result': {'value1': 2}, 'timestamp': '2015-01-02T00:00:00.000-05:00'},
+    ]
+    return QueryResult({'queryType': query_type, 'dataSource': 'things'}, b'raw', rows, 0.5)
+
+
+def line_ending():
+    if PY3:
+        return os.linesep
+    return "\r\n"
+
+
+class TestQueryResult:
+
+    def test_attributes(self):
+        result = create_result()
+        assert result.query == {'queryType': 'timeseries', 'dataSource': 'things'}
+        assert result.query_type == 'timeseries'
+        assert result.result_json == b'raw'
+        assert result.elapsed == 0.5
+
+    def test_behaves_like_result_list(self):
+        result = create_result()
+        assert len(result) == 2
+        assert result[1]['result']['value1'] == 2
+        assert [row['result']['value1'] for row in result] == [1, 2]
+        assert result == result.result
+        assert result == create_result()
+        assert result != []
+        assert repr(result) == repr(result.result)
+
+    def test_immutable(self):
+        result = create_result()
+        with pytest.raises(AttributeError):
+            result.result = []
+        with pytest.raises(AttributeError):
+            result.anything = 1
+        with pytest.raises(AttributeError):
+            del result.query
+
+    def test_pickle_and_copy(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/')
+        broker.respond([{'result': {'value1': 1}, 'timestamp': '2015-01-01T00:00:00.000Z'}])
+        result = client.timeseries(datasource='things', granularity='all',
+                                   intervals='2015-01-01/p1d')
+        unpickled = pickle.loads(pickle.dumps(result))
+        assert unpickled == result
+        assert unpickled.query == result.query
+        assert unpickled.result_json == result.result_json
+        assert unpickled.metrics.rows == 1
+        assert copy.copy(result) is result
+        deep = copy.deepcopy(result)
+        assert deep == result and deep.result is not result.result
+        assert (deep.elapsed, deep.retries) == (result.elapsed, result.retries)
+
+    def test_export_tsv(self, tmpdir):
+        file_path = tmpdir.join('out.tsv')
+        create_result().export_tsv(str(file_path))
+        assert file_path.read() == (
+            "value1\ttimestamp" + line_ending() +
+            "1\t2015-01-01T00:00:00.000-05:00" + line_ending() +
+            "2\t2015-01-02T00:00:00.000-05:00" + line_ending())
+
+    def test_export_tsv_unsupported(self, tmpdir):
+        with pytest.raises(NotImplementedError):
+            create_result('timeBoundary').export_tsv(str(tmpdir.join('out.tsv')))
+
+    @pytest.mark.skipif(pandas is None, reason="requires pandas")
+    def test_export_pandas(self):
+        df = create_result().export_pandas()
+        assert list(df['value1']) == [1, 2]
+        assert list(df['timestamp']) == ['2015-01-01T00:00:00.000-05:00',
+                                         '2015-01-02T00:00:00.000-05:00']
+
+    @pytest.mark.skipif(numpy is None, reason="requires numpy")
+    def test_export_numpy(self):
+        columns = create_result().export_numpy()
+        assert list(columns) == ['value1', 'timestamp']
+        assert columns['value1'].dtype == numpy.int64
+        assert list(columns['value1']) == [1, 2]
+        assert list(columns['timestamp']) == [numpy.datetime64('2015-01-01T05:00:00.000'),
+                                              numpy.datetime64('2015-01-02T05:00:00.000')]
+
+    @pytest.mark.skipif(numpy is None, reason="requires numpy")
+    def test_export_numpy_topn(self):
+        columns = create_result('topN', [
+            {'timestamp': '2015-01-01T00:00:00.000Z',
+             'result': [{'count': 7, 'user': 'a'}, {'count': 6.5, 'user': 'b', 'bot': True}]},
+            {'timestamp': '2015-01-02T00:00:00.000Z', 'result': [{'count': None, 'user': None}]},
+        ]).export_numpy()
+        assert list(columns) == ['count', 'user', 'bot', 'timestamp']
+        assert columns['count'].dtype == numpy.float64
+        assert numpy.isnan(columns['count'][2])
+        assert list(columns['count'][:2]) == [7.0, 6.5]
+        assert columns['user'].dtype == object
+        assert list(columns['user']) == ['a', 'b', None]
+        assert list(columns['bot']) == [None, True, None]
+        assert list(columns['timestamp'].astype(str)) == [
+            '2015-01-01T00:00:00.000', '2015-01-01T00:00:00.000', '2015-01-02T00:00:00.000']
+
+    @pytest.mark.skipif(numpy is None, reason="requires numpy")
+    def test_export_numpy_groupby(self):
+        columns = create_result('groupBy', [
+            {'version': 'v1', 'timestamp': '2015-01-01T00:00:00.000Z', 'event': {'dim': 'x', 'n': True}},
+            {'version': 'v1', 'timestamp': '2015-01-01T00:00:00.000Z', 'event': {'dim': 'y', 'n': False}},
+        ]).export_numpy()
+        assert list(columns) == ['dim', 'n', 'timestamp']
+        assert columns['n'].dtype == bool
+
+    @pytest.mark.skipif(numpy is None, reason="requires numpy")
+    def test_export_numpy_unsupported(self):
+        with pytest.raises(NotImplementedError):
+            create_result('timeBoundary').export_numpy()
+
+    @pytest.mark.skipif(pandas is None, reason="requires pandas")
+    def test_export_pandas_columnar(self):
+        df = create_result().export_pandas(columnar=True)
+        assert list(df.columns) == ['value1', 'timestamp']
+        assert list(df['value1']) == [1, 2]
+        assert list(df['timestamp']) == [pandas.Timestamp('2015-01-01T05:00:00'),
+                                         pandas.Timestamp('2015-01-02T05:00:00')]
+
+    @pytest.mark.skipif(pyarrow is None, reason="requires pyarrow")
+    def test_export_arrow(self):
+        table = create_result('groupBy', [
+            {'version': 'v1', 'timestamp': '2015-01-01T00:00:00.000Z',
+             'event': {'dim': 'x', 'count': 1, 'mixed': 1}},
+            {'version': 'v1', 'timestamp': '2015-01-01T01:00:00.000+01:00',
+             'event': {'dim': '㬓', 'count': 2.5, 'mixed': 'a'}},
+            {'version': 'v1', 'timestamp': '2015-01-02T00:00:00.000Z', 'event': {'dim': None}},
+        ]).export_arrow()
+        assert table.column_names == ['dim', 'count', 'mixed', 'timestamp']
+        assert table.schema.field('count').type == pyarrow.float64()
+        assert table.schema.field('timestamp').type == pyarrow.timestamp('ms', tz='UTC')
+        assert table.column('dim').to_pylist() == ['x', '㬓', None]
+        assert table.column('count').to_pylist() == [1.0, 2.5, None]
+        assert table.column('mixed').to_pylist() == ['1', 'a', None]
+        assert [t.isoformat() for t in table.column('timestamp').to_pylist()] == [
+            '2015-01-01T00:00:00+00:00', '2015-01-01T00:00:00+00:00', '2015-01-02T00:00:00+00:00']
+
+    @pytest.mark.skipif(pyarrow is None, reason="requires pyarrow")
+    def test_export_arrow_topn_and_select(self):
+        table = create_result('topN', [
+            {'timestamp': '2015-01-01T00:00:00.000Z', 'result': [{'n': 2}, {'n': 1}]},
+            {'timestamp': '2015-01-02T00:00:00.000Z', 'result': [{'n': 3}]},
+        ]).export_arrow()
+        assert table.column('n').to_pylist() == [2, 1, 3]
+        assert [t.day for t in table.column('timestamp').to_pylist()] == [1, 1, 2]
+
+        table = create_result('select', [{'timestamp': '2015-01-01T00:00:00.000Z', 'result': {
+            'pagingIdentifiers': {'seg': 1},
+            'events': [{'segmentId': 'seg', 'offset': i,
+                        'event': {'timestamp': '2015-01-01T00:0{0}:00.000Z'.format(i), 'dim': i}}
+                       for i in range(2)]}}]).export_arrow()
+        assert table.column_names == ['dim', 'timestamp']
+        assert [t.minute for t in table.column('timestamp').to_pylist()] == [0, 1]
+
+    @pytest.mark.skipif(pyarrow is None, reason="requires pyarrow")
+    def test_export_arrow_unsupported(self):
+        with pytest.raises(NotImplementedError):
+            create_result('timeBoundary').export_arrow()
+
+    @pytest.mark.skipif(pyarrow is None, reason="requires pyarrow")
+    @pytest.mark.parametrize('compression', ['snappy', 'zstd', None])
+    def test_export_parquet(self, tmpdir, compression):
+        file_path = str(tmpdir.join('out.parquet'))
+        create_result().export_parquet(file_path, compression=compression)
+        table = pyarrow.parquet.read_table(file_path)
+        assert table.column('value1').to_pylist() == [1, 2]
+        codec = pyarrow.parquet.ParquetFile(file_path).metadata.row_group(0).column(0).compression
+        assert codec == (compression or 'uncompressed').upper()
+
+
+class TestClientResults:
+
+    def test_query_returns_result(self, broker):
+        broker.respond([{'timestamp': '2015-01-01T00:00:00.000Z', 'result': {'count': 1}}])
+        client = PyDruid(broker.url, 'druid/v2/')
+        result = client.timeseries(datasource='things', granularity='all',
+                                   intervals='2015-01-01/p1d')
+        assert isinstance(result, QueryResult)
+        assert result.query_type == 'timeseries'
+        assert result.query['dataSource'] == 'things'
+        assert result.elapsed > 0
+        # compatibility attributes
+        assert client.query_type == 'timeseries'
+        assert client.query_dict == result.query
+        assert client.result == result.result
+        assert client.result_json == result.result_json
+
+    def test_shared_client_across_threads(self, broker):
+        broker.default_response = (200, {}, lambda handler, body: [{'query': body.decode('utf-8')}])
+        client = PyDruid(broker.url, 'druid/v2/')
+        results = {}
+
+        def query(i):
+            results[i] = client.time_boundary(datasource='ds{0}'.format(i))
+
+        threads = [threading.Thread(target=query, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i, result in results.items():
+            assert result.query['dataSource'] == 'ds{0}'.format(i)
+            assert '"ds{0}"'.format(i) in result[0]['query']
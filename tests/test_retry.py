@@ -0,0 +1,98 @@
+# -*- coding: UTF-8 -*-
+
+import socket
+import time
+
+import pytest
+
+from pydruid.client import PyDruid, QueryError, QueryTimeout
+from pydruid.retry import RetryPolicy
+
+
+def error(status, druid_error=None):
+    return QueryError('failed', status, 'reason', druid_error)
+
+
+class TestRetryPolicy:
+
+    def test_is_retryable(self):
+        policy = RetryPolicy()
+        assert policy.is_retryable(error(429))
+        assert policy.is_retryable(error(503))
+        assert policy.is_retryable(error(500, 'Query capacity exceeded'))
+        assert policy.is_retryable(ConnectionResetError())
+        assert policy.is_retryable(socket.error())
+        assert not policy.is_retryable(error(400, 'Unknown exception'))
+        assert not policy.is_retryable(error(500, 'Query timeout'))
+        assert not policy.is_retryable(QueryTimeout({}, 'q1'))
+        assert not policy.is_retryable(ValueError())
+        assert not RetryPolicy(retry_connection_errors=False).is_retryable(socket.error())
+        assert RetryPolicy(retry_statuses=[500]).is_retryable(error(500))
+
+    def test_backoff(self):
+        policy = RetryPolicy(max_attempts=10, backoff=0.1, max_backoff=0.3, jitter=False,
+                             budget=None)
+        started = time.time()
+        delays = [policy.retry_delay(error(503), n, started) for n in range(1, 5)]
+        assert delays == [0.1, 0.2, 0.3, 0.3]
+        assert policy.retries == 4
+
+    def test_jitter(self):
+        policy = RetryPolicy(max_attempts=100, backoff=1.0, budget=None)
+        delays = [policy.retry_delay(error(503), 2, time.time()) for _ in range(50)]
+        assert all(0 <= delay <= 2.0 for delay in delays)
+        assert len(set(delays)) > 1
+
+    def test_give_up(self):
+        policy = RetryPolicy(max_attempts=3, backoff=1.0, jitter=False, budget=5.0)
+        now = time.time()
+        assert policy.retry_delay(error(503), 3, now) is None
+        assert policy.retry_delay(error(400), 1, now) is None
+        assert policy.retry_delay(error(503), 1, now - 4.5) is None
+        assert policy.retry_delay(error(503), 1, now, deadline=now + 0.5) is None
+        assert policy.retry_delay(error(503), 1, now, deadline=now + 2) == 1.0
+        assert policy.retries == 1
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            RetryPolicy(max_attempts=0)
+
+
+class TestRetries:
+
+    def test_retries_transient_errors(self, broker):
+        policy = RetryPolicy(backoff=0.01)
+        client = PyDruid(broker.url, 'druid/v2/', retry_policy=policy)
+        broker.respond({'error': 'Query capacity exceeded'}, status=429)
+        broker.respond(b'', status=503)
+        broker.respond([{'result': 1}])
+        result = client.time_boundary(datasource='test')
+        assert result.result == [{'result': 1}]
+        assert result.retries == 2
+        assert policy.retries == 2
+        assert len(broker.requests) == 3
+
+    def test_no_retry_on_permanent_error(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/', retry_policy=RetryPolicy(backoff=0.01))
+        broker.respond({'error': 'Unknown exception', 'errorMessage': 'bad query'}, status=400)
+        with pytest.raises(QueryError) as e:
+            client.time_boundary(datasource='test')
+        assert e.value.status == 400
+        assert e.value.error == 'Unknown exception'
+        assert e.value.retries == 0
+        assert len(broker.requests) == 1
+
+    def test_gives_up(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/', retry_policy=RetryPolicy(backoff=0.01))
+        broker.default_response = (503, {}, b'')
+        with pytest.raises(QueryError) as e:
+            client.time_boundary(datasource='test')
+        assert e.value.retries == 2
+        assert len(broker.requests) == 3
+
+    def test_no_policy(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/')
+        broker.respond(b'', status=503)
+        with pytest.raises(IOError):
+            client.time_boundary(datasource='test')
+        assert len(broker.requests) == 1
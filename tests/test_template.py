@@ -0,0 +1,87 @@
+# -*- coding: UTF-8 -*-
+
+import json
+
+import pytest
+
+from pydruid.client import PyDruid
+from pydruid.codec import JSONCodec
+from pydruid.template import BoundQuery, Param
+from pydruid.utils.aggregators import doublesum
+from pydruid.utils.filters import Dimension, Filter
+
+
+def topn_args(intervals, lang, threshold=10):
+    return dict(datasource='twitterstream', granularity='all', intervals=intervals,
+                aggregations={'count': doublesum('count')}, dimension='user_name',
+                filter=Dimension('user_lang') == lang, metric='count', threshold=threshold)
+
+
+class TestQueryTemplate:
+
+    def test_bind(self):
+        client = PyDruid('http://localhost:8082', 'druid/v2/')
+        template = client.prepare('topn', **topn_args(Param('intervals'), Param('lang')))
+        assert template.params == {'intervals', 'lang'}
+
+        query = template.bind(intervals='2013-10-04/pt1h', lang='en')
+        expected = client._query_from_spec(('topn', topn_args('2013-10-04/pt1h', 'en')))
+        assert query == expected
+        assert json.loads(client._encode(query).decode('utf-8')) == expected
+        # the template itself keeps its placeholders
+        assert template.query['filter']['value'] == Param('lang')
+
+    def test_codecs(self):
+        client = PyDruid('http://localhost:8082', 'druid/v2/', codec=JSONCodec())
+        template = client.prepare('topn', **topn_args(Param('intervals'), u'é㬓'))
+        query = template.bind(intervals=['2013-10-04/pt1h', '2013-10-05/pt1h'])
+        assert json.loads(client._encode(query).decode('utf-8')) == query
+        other = PyDruid('http://localhost:8082', 'druid/v2/')
+        assert json.loads(other._encode(query).decode('utf-8')) == query
+
+    def test_in_filter(self):
+        client = PyDruid('http://localhost:8082', 'druid/v2/')
+        template = client.prepare('timeseries', datasource='test', granularity='all',
+                                  intervals='2013-10-04/pt1h',
+                                  filter=Filter(type='in', dimension='user', values=Param('users')))
+        query = template.bind(users=['u1', 'u2'])
+        assert query['filter'] == {'type': 'in', 'dimension': 'user', 'values': ['u1', 'u2']}
+        assert json.loads(client._encode(query).decode('utf-8')) == query
+
+    def test_context(self):
+        client = PyDruid('http://localhost:8082', 'druid/v2/')
+        args = dict(topn_args(Param('intervals'), 'en'), context={'queryId': Param('id')})
+        query = client.prepare('topn', **args).bind(intervals='2013/2014', id='q1')
+        assert query['context'] == {'queryId': 'q1'}
+        copy = query.copy()
+        copy['context'] = dict(query['context'], timeout=1000)
+        assert isinstance(copy, BoundQuery)
+        encoded = json.loads(client._encode(copy).decode('utf-8'))
+        assert encoded['context'] == {'queryId': 'q1', 'timeout': 1000}
+        assert encoded['intervals'] == '2013/2014'
+
+    def test_invalid(self):
+        client = PyDruid('http://localhost:8082', 'druid/v2/')
+        template = client.prepare('topn', **topn_args(Param('intervals'), 'en'))
+        with pytest.raises(ValueError):
+            template.bind()
+        with pytest.raises(ValueError):
+            template.bind(intervals='2013/2014', lang='en')
+        with pytest.raises(ValueError):
+            client.prepare('topn', datasource='test', invalid=Param('x'))
+
+
+class TestPreparedQueries:
+
+    def test_run(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/', timeout=5)
+        template = client.prepare('topn', **topn_args(Param('intervals'), 'en', Param('n')))
+        for day in (4, 5):
+            result = template.run(intervals='2013-10-0{0}/pt1h'.format(day), n=day)
+            assert result.result == []
+            sent = broker.query()
+            assert sent['intervals'] == '2013-10-0{0}/pt1h'.format(day)
+            assert sent['threshold'] == day
+            assert 4000 < sent['context']['timeout'] <= 5000
+        assert client.query_dict['threshold'] == 5
+        assert result.metrics.build > 0
@@ -0,0 +1,66 @@
+# -*- coding: UTF-8 -*-
+
+import socket
+import time
+
+import pytest
+
+from pydruid.client import PyDruid, QueryTimeout
+
+from conftest import deletes, slow
+
+
+class TestDeadlines:
+
+    def test_client_timeout(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/', timeout=5)
+        client.time_boundary(datasource='test')
+        context = broker.query()['context']
+        assert 4000 < context['timeout'] <= 5000
+        assert context['queryId']
+        assert client.query_dict == {'queryType': 'timeBoundary', 'dataSource': 'test'}
+
+    def test_query_timeout(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/', timeout=5)
+        client.time_boundary(datasource='test', context={'timeout': 2000, 'queryId': 'q1'})
+        context = broker.query()['context']
+        assert 1000 < context['timeout'] <= 2000
+        assert context['queryId'] == 'q1'
+
+    def test_no_timeout(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/', timeout=5)
+        client.time_boundary(datasource='test', context={'timeout': 0})
+        assert broker.query()['context'] == {'timeout': 0}
+        PyDruid(broker.url, 'druid/v2/').time_boundary(datasource='test')
+        assert 'context' not in broker.query()
+
+    def test_expired(self, broker):
+        client = PyDruid(broker.url, 'druid/v2/', timeout=0.2)
+        broker.default_response = (200, {}, slow(1.0, []))
+        start = time.time()
+        with pytest.raises(QueryTimeout) as e:
+            client.time_boundary(datasource='test')
+        assert time.time() - start < 0.9
+        assert isinstance(e.value, socket.timeout)
+        assert isinstance(e.value, IOError)
+        assert deletes(broker) == ['/druid/v2/' + e.value.query_id]
+        assert broker.query(0)['context']['queryId'] == e.value.query_id
+
+    def test_stream_expired(self, broker):
+        def respond(handler, body):
+            # the headers arrive in time, but the rows don't
+            if handler.command == 'POST':
+                handler.send_response(200)
+                handler.send_header('Content-Length', '100')
+                handler.end_headers()
+                handler.wfile.write(b'[{"a": 1}, ')
+                handler.wfile.flush()
+                time.sleep(1.0)
+            return b''
+
+        client = PyDruid(broker.url, 'druid/v2/', timeout=0.3)
+        broker.default_response = (200, {}, respond)
+        rows = client.stream('time_boundary', datasource='test')
+        with pytest.raises(QueryTimeout):
+            list(rows)
+        assert len(deletes(broker)) == 1
@@ -18,6 +18,42 @@ class TestAggregators:
         for f, agg_type in aggs_funcs:
             assert f('metric') == {'type': agg_type, 'fieldName': 'metric'}
 
+    def test_typed_aggregators(self):
+        aggs = [('longmin', 'longMin'), ('longmax', 'longMax'),
+                ('doublemin', 'doubleMin'), ('doublemax', 'doubleMax'),
+                ('longfirst', 'longFirst'), ('longlast', 'longLast'),
+                ('doublefirst', 'doubleFirst'), ('doublelast', 'doubleLast')]
+        for agg_name, agg_type in aggs:
+            f = getattr(aggregators, agg_name)
+            assert f('metric') == {'type': agg_type, 'fieldName': 'metric'}
+
+    def test_thetasketch(self):
+        assert aggregators.thetasketch('users') == {
+            'type': 'thetaSketch', 'fieldName': 'users', 'isInputThetaSketch': False,
+            'size': 16384}
+        assert aggregators.thetasketch('users', True, 1024) == {
+            'type': 'thetaSketch', 'fieldName': 'users', 'isInputThetaSketch': True,
+            'size': 1024}
+
+    def test_approxhistogram(self):
+        assert aggregators.approxhistogram('latency') == {
+            'type': 'approxHistogram', 'fieldName': 'latency'}
+        assert aggregators.approxhistogram('latency', resolution=100, num_buckets=10,
+                                           lower_limit=0, upper_limit=1000.0) == {
+            'type': 'approxHistogram', 'fieldName': 'latency', 'resolution': 100,
+            'numBuckets': 10, 'lowerLimit': 0, 'upperLimit': 1000.0}
+        assert aggregators.approxhistogram('histograms', fold=True) == {
+            'type': 'approxHistogramFold', 'fieldName': 'histograms'}
+
+    def test_javascript(self):
+        assert aggregators.javascript(['a', 'b'], 'function(c, a, b) { return c + a * b; }',
+                                      'function(x, y) { return x + y; }',
+                                      'function() { return 0; }') == {
+            'type': 'javascript', 'fieldNames': ['a', 'b'],
+            'fnAggregate': 'function(c, a, b) { return c + a * b; }',
+            'fnCombine': 'function(x, y) { return x + y; }',
+            'fnReset': 'function() { return 0; }'}
+
     def test_filtered_aggregator(self):
         filter_ = filters.Filter(dimension='dim', value='val')
         aggs = [aggregators.count('metric1'),
@@ -117,3 +153,18 @@ class TestAggregators:
         actual = sorted(expected, key=lambda k: itemgetter('name')(
             itemgetter('aggregator')(k)))
         assert expected == actual
+
+    def test_build_aggregators_leaves_input_alone(self):
+        filter_ = filters.Filter(dimension='dim', value='val')
+        agg_input = {'agg1': aggregators.count('metric1'),
+                     'agg2': aggregators.filtered(filter_, aggregators.longsum('metric2')),
+                     'agg3': {'type': 'doubleSum', 'fieldName': 'metric3'}}
+        first = aggregators.build_aggregators(agg_input)
+        assert agg_input['agg1'] == {'type': 'count', 'fieldName': 'metric1'}
+        assert 'name' not in agg_input['agg2']['aggregator']
+        assert agg_input['agg3'] == {'type': 'doubleSum', 'fieldName': 'metric3'}
+        # the named aggregators are built once per name
+        second = aggregators.build_aggregators(agg_input)
+        assert first[0] is second[0] and first[1] is second[1]
+        renamed = aggregators.build_aggregators({'other': agg_input['agg1']})
+        assert renamed == [{'type': 'count', 'fieldName': 'metric1', 'name': 'other'}]
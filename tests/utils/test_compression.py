@@ -0,0 +1,54 @@
+# -*- coding: UTF-8 -*-
+
+import gzip
+import io
+import zlib
+
+import pytest
+
+from pydruid.utils import compression
+
+
+def body(n=20000):
+    return b'[' + b','.join(b'{"count": %d, "dim": "value"}' % i for i in range(n)) + b']'
+
+
+class TestCompression:
+
+    def test_gzip_compress(self):
+        data = body()
+        compressed = compression.gzip_compress(data)
+        assert len(compressed) < len(data) / 5
+        assert gzip.GzipFile(fileobj=io.BytesIO(compressed)).read() == data
+
+    @pytest.mark.parametrize('encoding,compress', [
+        ('gzip', compression.gzip_compress),
+        ('GZIP', compression.gzip_compress),
+        ('deflate', zlib.compress),
+    ])
+    def test_decompress(self, encoding, compress):
+        data = body()
+        assert compression.decompress(compress(data), encoding) == data
+
+    @pytest.mark.parametrize('amt', [1, 7, 4096, None])
+    def test_decompressing_reader(self, amt):
+        data = body()
+        compressed = compression.gzip_compress(data)
+        reader = compression.DecompressingReader(io.BytesIO(compressed), 'gzip')
+        chunks = []
+        while True:
+            chunk = reader.read(amt)
+            if not chunk:
+                break
+            assert amt is None or len(chunk) <= amt
+            chunks.append(chunk)
+            if amt is None:
+                break
+        assert b''.join(chunks) == data
+        assert reader.compressed_bytes == len(compressed)
+        assert reader.uncompressed_bytes == len(data)
+
+    def test_corrupt(self):
+        reader = compression.DecompressingReader(io.BytesIO(b'not gzip at all'), 'gzip')
+        with pytest.raises(zlib.error):
+            reader.read(1024)
@@ -14,6 +14,19 @@ class TestDimension:
         assert actual == expected
 
 
+    def test_bounds(self):
+        d = filters.Dimension('dim')
+        assert filters.Filter.build_filter(d < 10) == {
+            'type': 'bound', 'dimension': 'dim', 'upper': 10, 'upperStrict': True,
+            'ordering': 'numeric'}
+        assert filters.Filter.build_filter(d <= 1.5) == {
+            'type': 'bound', 'dimension': 'dim', 'upper': 1.5, 'ordering': 'numeric'}
+        assert filters.Filter.build_filter(d > 'b') == {
+            'type': 'bound', 'dimension': 'dim', 'lower': 'b', 'lowerStrict': True}
+        assert filters.Filter.build_filter(d >= 'b') == {
+            'type': 'bound', 'dimension': 'dim', 'lower': 'b'}
+
+
 class TestFilter:
 
     def test_selector_filter(self):
@@ -57,6 +70,129 @@ class TestFilter:
         }
         assert actual == expected
 
+    def test_in_filter(self):
+        expected = {'type': 'in', 'dimension': 'dim', 'values': ['a', 'b']}
+        for values in (['a', 'b'], ('a', 'b'), iter(['a', 'b'])):
+            actual = filters.Filter.build_filter(
+                filters.Filter(type='in', dimension='dim', values=values))
+            assert actual == expected
+        actual = filters.Filter.build_filter(filters.Filter(type='in', dimension='dim', values={1}))
+        assert actual['values'] == [1]
+        actual = filters.Filter.build_filter(filters.Filter(type='in', dimension='dim', values='a'))
+        assert actual['values'] == ['a']
+
+    def test_in_filter_numpy(self):
+        np = pytest.importorskip('numpy')
+        f = filters.Filter(type='in', dimension='dim', values=np.arange(3))
+        values = filters.Filter.build_filter(f)['values']
+        assert values == [0, 1, 2]
+        assert all(type(value) is int for value in values)
+        f = filters.Filter(type='in', dimension='dim', values=np.array(['a', 'b']))
+        assert filters.Filter.build_filter(f)['values'] == ['a', 'b']
+
+    def test_bound_filter(self):
+        actual = filters.Filter.build_filter(filters.Filter(
+            type='bound', dimension='dim', lower='1', upper='5', lowerStrict=True,
+            upperStrict=False, ordering='numeric'))
+        expected = {'type': 'bound', 'dimension': 'dim', 'lower': '1', 'upper': '5',
+                    'lowerStrict': True, 'ordering': 'numeric'}
+        assert actual == expected
+
+    def test_regex_filter(self):
+        actual = filters.Filter.build_filter(
+            filters.Filter(type='regex', dimension='dim', pattern='^a.*'))
+        assert actual == {'type': 'regex', 'dimension': 'dim', 'pattern': '^a.*'}
+
+    def test_search_filter(self):
+        actual = filters.Filter.build_filter(
+            filters.Filter(type='search', dimension='dim', query='foo'))
+        expected = {'type': 'search', 'dimension': 'dim',
+                    'query': {'type': 'insensitive_contains', 'value': 'foo'}}
+        assert actual == expected
+        query = {'type': 'fragment', 'values': ['a', 'b'], 'caseSensitive': True}
+        actual = filters.Filter.build_filter(
+            filters.Filter(type='search', dimension='dim', query=query))
+        assert actual == {'type': 'search', 'dimension': 'dim', 'query': query}
+
+    def test_javascript_filter(self):
+        function = 'function(x) { return x > 1 }'
+        actual = filters.Filter.build_filter(
+            filters.Filter(type='javascript', dimension='dim', function=function))
+        assert actual == {'type': 'javascript', 'dimension': 'dim', 'function': function}
+
+    def test_extraction_filter(self):
+        fn = {'type': 'lookup', 'lookup': {'type': 'map', 'map': {'a': 'b'}}}
+        actual = filters.Filter.build_filter(
+            filters.Filter(type='extraction', dimension='dim', value='b', extractionFn=fn))
+        assert actual == {'type': 'extraction', 'dimension': 'dim', 'value': 'b',
+                          'extractionFn': fn}
+
     def test_invalid_filter(self):
         with pytest.raises(NotImplementedError):
             filters.Filter(type='invalid', dimension='dim', value='val')
+
+
+def selector(dimension, value):
+    return {'type': 'selector', 'dimension': dimension, 'value': value}
+
+
+class TestOptimizeFilter:
+
+    def test_flatten(self):
+        f = filters.Dimension('dim0') == 0
+        for i in range(1, 5000):
+            f = f & (filters.Dimension('dim{0}'.format(i)) == i)
+        actual = filters.optimize_filter(filters.Filter.build_filter(f))
+        assert actual['type'] == 'and'
+        assert actual['fields'] == [selector('dim{0}'.format(i), i) for i in range(5000)]
+
+    def test_flatten_keeps_other_types(self):
+        a, b, c = (filters.Dimension(d) == 1 for d in 'abc')
+        actual = filters.optimize_filter(filters.Filter.build_filter((a & b) | c))
+        assert actual == filters.Filter.build_filter((a & b) | c)
+        actual = filters.optimize_filter(filters.Filter.build_filter(a & (b & c)))
+        assert actual == {'type': 'and', 'fields': [selector(d, 1) for d in 'abc']}
+
+    def test_duplicates(self):
+        a = filters.Dimension('a') == 1
+        b = filters.Dimension('b') == 2
+        actual = filters.optimize_filter(filters.Filter.build_filter(a & b & a))
+        assert actual == {'type': 'and', 'fields': [selector('a', 1), selector('b', 2)]}
+        actual = filters.optimize_filter(filters.Filter.build_filter(a & a))
+        assert actual == selector('a', 1)
+
+    def test_double_negation(self):
+        a = filters.Dimension('a') == 1
+        assert filters.optimize_filter(filters.Filter.build_filter(~~a)) == selector('a', 1)
+        assert filters.optimize_filter(filters.Filter.build_filter(~~~a)) == {
+            'type': 'not', 'field': selector('a', 1)}
+        actual = filters.optimize_filter(filters.Filter.build_filter(a & ~~(a & ~~a)))
+        assert actual == selector('a', 1)
+
+    def test_selectors_to_in(self):
+        d = filters.Dimension('user')
+        f = (d == 'u1') | (filters.Dimension('lang') == 'en') | (d == 'u2') | (d == 'u1') | (d == 'u3')
+        actual = filters.optimize_filter(filters.Filter.build_filter(f))
+        assert actual == {'type': 'or', 'fields': [
+            {'type': 'in', 'dimension': 'user', 'values': ['u1', 'u2', 'u3']},
+            selector('lang', 'en')]}
+
+    def test_in_merges_with_selectors(self):
+        d = filters.Dimension('user')
+        f = filters.Filter(type='in', dimension='user', values=['u1', 'u2']) | (d == 'u3')
+        actual = filters.optimize_filter(filters.Filter.build_filter(f | (d == 'u1')))
+        assert actual == {'type': 'in', 'dimension': 'user', 'values': ['u1', 'u2', 'u3']}
+
+    def test_selectors_in_and_stay(self):
+        d = filters.Dimension('user')
+        f = (d == 'u1') & (d == 'u2')
+        assert filters.optimize_filter(filters.Filter.build_filter(f)) == filters.Filter.build_filter(f)
+
+    def test_leaves_input_alone(self):
+        a, b = filters.Dimension('a') == 1, filters.Dimension('a') == 2
+        f = (a | b) | ~~a
+        before = filters.Filter.build_filter(f)
+        filters.optimize_filter(before)
+        assert before == {'type': 'or', 'fields': [
+            {'type': 'or', 'fields': [selector('a', 1), selector('a', 2)]},
+            {'type': 'not', 'field': {'type': 'not', 'field': selector('a', 1)}}]}
@@ -0,0 +1,79 @@
+# -*- coding: UTF-8 -*-
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from pydruid.utils import intervals
+
+
+class TestIntervals:
+
+    @pytest.mark.parametrize('value,expected', [
+        ('2013', datetime(2013, 1, 1)),
+        ('2013-10', datetime(2013, 10, 1)),
+        ('2013-10-04', datetime(2013, 10, 4)),
+        ('2013-10-04T05', datetime(2013, 10, 4, 5)),
+        ('2013-10-04t05:06', datetime(2013, 10, 4, 5, 6)),
+        ('2013-10-04T05:06:07.089Z', datetime(2013, 10, 4, 5, 6, 7, 89000)),
+        ('2013-10-04T05:06:07-07:00', datetime(2013, 10, 4, 12, 6, 7)),
+        ('2013-10-04T05:06:07+0130', datetime(2013, 10, 4, 3, 36, 7)),
+    ])
+    def test_parse_instant(self, value, expected):
+        assert intervals.parse_instant(value) == expected
+
+    @pytest.mark.parametrize('value,expected', [
+        ('P1D', (0, timedelta(days=1))),
+        ('pt1h', (0, timedelta(hours=1))),
+        ('P4W', (0, timedelta(weeks=4))),
+        ('P1Y2M', (14, timedelta())),
+        ('P1DT2H30M1.5S', (0, timedelta(days=1, hours=2, minutes=30, seconds=1.5))),
+    ])
+    def test_parse_period(self, value, expected):
+        assert intervals.parse_period(value) == expected
+
+    @pytest.mark.parametrize('value', ['P', 'PT', 'P1DT', '1D', 'P1H'])
+    def test_invalid_period(self, value):
+        with pytest.raises(ValueError):
+            intervals.parse_period(value)
+
+    @pytest.mark.parametrize('value,expected', [
+        ('2013-10-04/2013-10-05', (datetime(2013, 10, 4), datetime(2013, 10, 5))),
+        ('2013-10-04/pt1h', (datetime(2013, 10, 4), datetime(2013, 10, 4, 1))),
+        ('P1D/2013-10-05', (datetime(2013, 10, 4), datetime(2013, 10, 5))),
+        ('2013-01-31/P1M', (datetime(2013, 1, 31), datetime(2013, 2, 28))),
+        ('P1M/2013-03-31', (datetime(2013, 2, 28), datetime(2013, 3, 31))),
+        ('2013-11-15/P1Y2M', (datetime(2013, 11, 15), datetime(2015, 1, 15))),
+    ])
+    def test_parse_interval(self, value, expected):
+        assert intervals.parse_interval(value) == expected
+
+    @pytest.mark.parametrize('value', ['2013-10-04', '2013-10-04/', 'a/b', '2013/2014/2015'])
+    def test_invalid_interval(self, value):
+        with pytest.raises(ValueError):
+            intervals.parse_interval(value)
+
+    def test_parse_intervals(self):
+        assert intervals.parse_intervals('2013-10-04/P1D') == [
+            (datetime(2013, 10, 4), datetime(2013, 10, 5))]
+        assert intervals.parse_intervals(['2013-10-04/P1D', '2013-10-06/P1D']) == [
+            (datetime(2013, 10, 4), datetime(2013, 10, 5)),
+            (datetime(2013, 10, 6), datetime(2013, 10, 7))]
+
+    def test_format_instant(self):
+        assert intervals.format_instant(datetime(2013, 10, 4, 5, 6, 7, 89000)) == '2013-10-04T05:06:07.089Z'
+
+    @pytest.mark.parametrize('granularity,expected', [
+        ('second', datetime(2015, 8, 13, 17, 47, 3)),
+        ('fifteen_minute', datetime(2015, 8, 13, 17, 45)),
+        ('hour', datetime(2015, 8, 13, 17)),
+        ('six_hour', datetime(2015, 8, 13, 12)),
+        ('day', datetime(2015, 8, 13)),
+        ('week', datetime(2015, 8, 10)),
+        ('month', datetime(2015, 8, 1)),
+        ('quarter', datetime(2015, 7, 1)),
+        ('year', datetime(2015, 1, 1)),
+    ])
+    def test_floor_instant(self, granularity, expected):
+        assert intervals.floor_instant(datetime(2015, 8, 13, 17, 47, 3, 5), granularity) == expected
+        assert intervals.floor_instant(expected, granularity) == expected
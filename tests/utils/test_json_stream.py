@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+
+import io
+import json
+
+import pytest
+
+from pydruid.utils.json_stream import iter_items
+
+DOCUMENT = [
+    {'timestamp': '2013-10-04T00:00:00.000Z',
+     'result': [{'count': 12345, 'user_name': u'㬓user_1', 'ratio': 0.125, 'flag': True},
+                {'count': -6, 'user_name': None, 'ratio': 1e-05, 'flag': False}]},
+    {'timestamp': '2013-10-05T00:00:00.000Z', 'result': []},
+    {'result': [{'count': 1}], 'timestamp': '2013-10-06T00:00:00.000Z'},
+]
+
+
+def items(document, path, chunk_size=2, indent=None):
+    if not isinstance(document, bytes):
+        document = json.dumps(document, indent=indent).encode('utf-8')
+    return list(iter_items(io.BytesIO(document), path, chunk_size))
+
+
+class TestIterItems:
+
+    @pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1024])
+    @pytest.mark.parametrize('indent', [None, 2])
+    def test_nested_path(self, chunk_size, indent):
+        actual = items(DOCUMENT, ('*', 'result', '*'), chunk_size, indent)
+        assert actual == [
+            ({'timestamp': '2013-10-04T00:00:00.000Z'}, DOCUMENT[0]['result'][0]),
+            ({'timestamp': '2013-10-04T00:00:00.000Z'}, DOCUMENT[0]['result'][1]),
+            # members after the one stepped into are not known yet
+            ({}, {'count': 1}),
+        ]
+
+    def test_top_level_elements(self):
+        assert [item for _, item in items(DOCUMENT, ('*',))] == DOCUMENT
+
+    def test_whole_document(self):
+        assert items(DOCUMENT, ()) == [({}, DOCUMENT)]
+
+    def test_object_path(self):
+        document = [{'timestamp': 't', 'result': {'pagingIdentifiers': {'seg': 2},
+                                                  'events': [{'offset': 0}, {'offset': 1}]}}]
+        assert items(document, ('*', 'result', 'events', '*'), 3) == [
+            ({'timestamp': 't', 'pagingIdentifiers': {'seg': 2}}, {'offset': 0}),
+            ({'timestamp': 't', 'pagingIdentifiers': {'seg': 2}}, {'offset': 1}),
+        ]
+
+    def test_empty(self):
+        assert items([], ('*',)) == []
+        assert items([{}], ('*', 'result', '*')) == []
+
+    def test_number_split_across_chunks(self):
+        assert items(b'[1234567, 89]', ('*',), 3) == [({}, 1234567), ({}, 89)]
+        assert items(b'1234567', (), 3) == [({}, 1234567)]
+
+    def test_every_chunk_size(self):
+        document = b'[{"n":12.5,"e":-1.5e+10,"i":-7,"result":{"x":1E3}}, 0.25]'
+        expected = json.loads(document.decode('utf-8'))
+        for chunk_size in range(1, len(document) + 1):
+            assert items(document, ('*',), chunk_size) == [({}, item) for item in expected]
+
+    def test_unicode_split_across_chunks(self):
+        assert items(u'["㬓㬓", "é"]'.encode('utf-8'), ('*',), 1) == [({}, u'㬓㬓'), ({}, u'é')]
+
+    def test_large_value(self):
+        document = [{'events': list(range(10000))}]
+        assert items(document, ('*',), 16) == [({}, document[0])]
+
+    @pytest.mark.parametrize('document', [b'', b'[1, 2', b'[1 2]', b'{"a": 1}', b'[1] x', b'[{"a" 1}]'])
+    def test_malformed(self, document):
+        with pytest.raises(ValueError):
+            items(document, ('*', 'a'))
+
+    def test_lazy(self):
+        class Source(io.BytesIO):
+            reads = 0
+
+            def read(self, n=-1):
+                Source.reads += 1
+                return io.BytesIO.read(self, n)
+
+        source = Source(json.dumps(list(range(1000))).encode('utf-8'))
+        it = iter_items(source, ('*',), 16)
+        assert next(it) == ({}, 0)
+        assert Source.reads < 5
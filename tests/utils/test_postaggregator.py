@@ -0,0 +1,49 @@
+# -*- coding: UTF-8 -*-
+
+from pydruid.utils import postaggregator
+
+
+class TestPostaggregators:
+
+    def test_quantiles(self):
+        built = postaggregator.Postaggregator.build_post_aggregators({
+            'p95': postaggregator.Quantile('latency', 0.95),
+            'deciles': postaggregator.Quantiles('latency', [0.1, 0.5, 0.9])})
+        assert sorted(built, key=lambda p: p['name']) == [
+            {'type': 'quantiles', 'name': 'deciles', 'fieldName': 'latency',
+             'probabilities': [0.1, 0.5, 0.9]},
+            {'type': 'quantile', 'name': 'p95', 'fieldName': 'latency', 'probability': 0.95}]
+
+    def test_hyper_unique_cardinality(self):
+        ratio = postaggregator.HyperUniqueCardinality('users') / postaggregator.Field('rows')
+        built, = postaggregator.Postaggregator.build_post_aggregators({'per_row': ratio})
+        assert built == {
+            'type': 'arithmetic', 'name': 'per_row', 'fn': '/',
+            'fields': [{'type': 'hyperUniqueCardinality', 'fieldName': 'users'},
+                       {'type': 'fieldAccess', 'fieldName': 'rows'}]}
+
+    def test_theta_sketch_estimate(self):
+        a, b, c = (postaggregator.ThetaSketch(name) for name in ('a', 'b', 'c'))
+        estimate = postaggregator.ThetaSketchEstimate((a & b) | c)
+        built, = postaggregator.Postaggregator.build_post_aggregators({'both': estimate})
+        assert built == {
+            'type': 'thetaSketchEstimate', 'name': 'both',
+            'field': {'type': 'thetaSketchSetOp', 'name': 'a_AND_b_OR_c', 'func': 'UNION',
+                      'fields': [{'type': 'thetaSketchSetOp', 'name': 'a_AND_b',
+                                  'func': 'INTERSECT',
+                                  'fields': [{'type': 'fieldAccess', 'fieldName': 'a'},
+                                             {'type': 'fieldAccess', 'fieldName': 'b'}]},
+                                 {'type': 'fieldAccess', 'fieldName': 'c'}]}}
+        only_a = postaggregator.ThetaSketchEstimate(a - b).post_aggregator['field']
+        assert only_a['func'] == 'NOT' and only_a['name'] == 'a_NOT_b'
+        assert postaggregator.ThetaSketchEstimate(a).post_aggregator['field'] == {
+            'type': 'fieldAccess', 'fieldName': 'a'}
+
+    def test_plain_dict_subclass(self):
+        class Constant(postaggregator.Postaggregator):
+            def __init__(self, value):
+                self.post_aggregator = {'type': 'constant', 'value': value}
+                self.name = 'const'
+
+        built, = postaggregator.Postaggregator.build_post_aggregators({'two': Constant(2)})
+        assert built == {'type': 'constant', 'name': 'two', 'value': 2}
@@ -1,6 +1,8 @@
 # -*- coding: UTF-8 -*-
 
+import gzip
 import os
+
 from six import PY3
 from pydruid.utils import query_utils
 
@@ -39,3 +41,45 @@ class TestUnicodeWriter:
         ])
         f.close()
         assert file_path.read() == "header1\theader2" + line_ending() + "value1\t㬓" + line_ending()
+
+    def test_missing_and_float_values(self, tmpdir):
+        file_path = tmpdir.join("out.tsv")
+        f = open_file(str(file_path))
+        w = query_utils.UnicodeWriter(f)
+        w.writerows([['㬓', None, 0.1 + 0.2, 2, True]])
+        f.close()
+        assert file_path.read() == "㬓\t\t0.30000000000000004\t2\tTrue" + line_ending()
+
+
+class TestWriteRows:
+
+    def test_header_from_first_row(self, tmpdir):
+        file_path = tmpdir.join("out.tsv")
+        rows = iter([{'dim': 'a', 'count': 1}, {'dim': '㬓', 'count': 2, 'extra': 3}, {'dim': 'c'}])
+        assert query_utils.write_rows(rows, str(file_path), batch_size=2) == 3
+        assert file_path.read_binary().decode('utf-8') == "dim\tcount\r\na\t1\r\n㬓\t2\r\nc\t\r\n"
+
+    def test_explicit_columns(self, tmpdir):
+        file_path = tmpdir.join("out.csv")
+        rows = [{'dim': 'a', 'count': 1.5}, {'count': 2}]
+        query_utils.write_rows(rows, str(file_path), columns=['count'], dialect='excel')
+        assert file_path.read_binary().decode('utf-8') == "count\r\n1.5\r\n2\r\n"
+
+    def test_empty(self, tmpdir):
+        file_path = tmpdir.join("out.tsv")
+        assert query_utils.write_rows([], str(file_path), columns=['a', 'b']) == 0
+        assert file_path.read_binary().decode('utf-8') == "a\tb\r\n"
+
+    def test_gzip(self, tmpdir):
+        file_path = tmpdir.join("out.tsv.gz")
+        rows = ({'n': i} for i in range(5000))
+        assert query_utils.write_rows(rows, str(file_path), batch_size=100) == 5000
+        with gzip.open(str(file_path), 'rb') as f:
+            lines = f.read().decode('utf-8').split('\r\n')
+        assert lines[:3] == ['n', '0', '1']
+        assert len(lines) == 5002
+
+    def test_no_compression(self, tmpdir):
+        file_path = tmpdir.join("out.tsv.gz")
+        query_utils.write_rows([{'n': 1}], str(file_path), compression=None)
+        assert file_path.read_binary().decode('utf-8') == "n\r\n1\r\n"
@@ -0,0 +1,64 @@
+# -*- coding: UTF-8 -*-
+
+import pytest
+
+from pydruid.utils import smile
+
+
+DOCUMENTS = [
+    None, True, False, 0, 15, -16, 16, -17, 2 ** 31 - 1, -2 ** 31, 2 ** 40, -2 ** 63, 2 ** 63,
+    -2 ** 100, 1.5, -0.0, 1e300, float('inf'),
+    u'', u'a', u'x' * 32, u'x' * 33, u'x' * 64, u'x' * 65,
+    u'é', u'é' * 16, u'é' * 17, u'é' * 32, u'é' * 33, u'㬓' * 40,
+    b'', b'abc', bytes(bytearray(range(256))),
+    [], {}, {u'': 1}, [[1, [2]], {u'a': {u'b': None}}],
+    {u'a' * 64: 1, u'a' * 65: 2, u'é' * 28: 3, u'é' * 29: 4},
+]
+
+# enough distinct keys and values to overflow the shared string tables
+RESULT = [{u'timestamp': u't{0}'.format(i % 7), u'k{0}'.format(i % 1500): u'v{0}'.format(i % 2000),
+           u'values': [i, float(i), -i * 1000]} for i in range(5000)]
+
+
+class TestSmile:
+
+    @pytest.mark.parametrize('shared_names', [True, False])
+    @pytest.mark.parametrize('shared_values', [True, False])
+    def test_round_trip(self, shared_names, shared_values):
+        for doc in DOCUMENTS + [RESULT]:
+            data = smile.dumps(doc, shared_names=shared_names, shared_values=shared_values)
+            assert data[:3] == smile.HEADER
+            assert smile.loads(data) == doc
+
+    def test_shared_names_are_smaller(self):
+        assert len(smile.dumps(RESULT)) < len(smile.dumps(RESULT, shared_names=False))
+
+    def test_known_encoding(self):
+        # {"a": 1} with shared names and values, as written by Jackson
+        assert smile.loads(b':)\n\x03\xfa\x80a\xc2\xfb') == {'a': 1}
+        assert smile.dumps({'a': 1}) == b':)\n\x01\xfa\x80a\xc2\xfb'
+
+    def test_float(self):
+        # a 32-bit float: 1.5
+        assert smile.loads(b':)\n\x00\x28\x03\x7e\x00\x00\x00') == 1.5
+
+    def test_end_marker(self):
+        assert smile.loads(smile.dumps([1]) + b'\xff') == [1]
+
+    @pytest.mark.parametrize('data', [
+        b'[1]',
+        b':)\n',
+        b':)\n\x10\xc2',
+        b':)\n\x00\xf8\xc2',
+        b':)\n\x00\xc2\xc2',
+        b':)\n\x00\x01',
+        b':)\n\x00\xfa\x40\xc2\xfb',
+        b':)\n\x00\x27',
+    ])
+    def test_invalid(self, data):
+        with pytest.raises(ValueError):
+            smile.loads(data)
+
+    def test_unsupported_type(self):
+        with pytest.raises(TypeError):
+            smile.dumps(object())
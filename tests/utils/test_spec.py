@@ -0,0 +1,60 @@
+# -*- coding: UTF-8 -*-
+
+import copy
+import pickle
+
+import pytest
+
+from pydruid.utils.spec import FrozenList, Spec, freeze
+
+
+class TestSpec:
+
+    def test_equality_and_hash(self):
+        spec = Spec(type='cardinality', fieldNames=['a', 'b'])
+        assert spec == {'type': 'cardinality', 'fieldNames': ['a', 'b']}
+        assert isinstance(spec['fieldNames'], FrozenList)
+        assert hash(spec) == hash(Spec(fieldNames=['a', 'b'], type='cardinality'))
+        assert len({spec, Spec(spec)}) == 1
+        assert spec.json == '{"fieldNames":["a","b"],"type":"cardinality"}'
+        # hashes agree wherever equality does, e.g., across ints and floats
+        nested = Spec(value=1, fields=[{'value': 2}])
+        assert nested == Spec(value=1.0, fields=[{'value': 2.0}])
+        assert hash(nested) == hash(Spec(value=1.0, fields=[{'value': 2.0}]))
+
+    def test_immutable(self):
+        spec = Spec(type='count', fields=[{'a': 1}])
+        with pytest.raises(TypeError):
+            spec['name'] = 'x'
+        with pytest.raises(TypeError):
+            spec.update(name='x')
+        with pytest.raises(TypeError):
+            del spec['type']
+        with pytest.raises(TypeError):
+            spec['fields'].append({})
+        with pytest.raises(TypeError):
+            spec['fields'][0]['a'] = 2
+        assert spec == {'type': 'count', 'fields': [{'a': 1}]}
+
+    def test_replace(self):
+        spec = Spec(type='count')
+        assert spec.replace(name='x') == {'type': 'count', 'name': 'x'}
+        assert spec == {'type': 'count'}
+        mutable = spec.copy()
+        mutable['name'] = 'x'
+        assert type(mutable) is dict
+
+    def test_copy_and_pickle(self):
+        spec = Spec(type='filtered', aggregator={'type': 'count'})
+        assert copy.deepcopy(spec) is spec
+        assert copy.copy(spec['aggregator']) is spec['aggregator']
+        loaded = pickle.loads(pickle.dumps(spec))
+        assert loaded == spec and isinstance(loaded['aggregator'], Spec)
+
+    def test_freeze(self):
+        frozen = freeze({'a': [{'b': 1}], 'c': ({'d': 2},)})
+        assert isinstance(frozen, Spec)
+        assert isinstance(frozen['a'][0], Spec)
+        assert isinstance(frozen['c'][0], Spec)
+        assert freeze(frozen) is frozen
+        assert freeze('x') == 'x'